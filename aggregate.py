@@ -28,6 +28,14 @@ Examples:
 Aggregator also caches individual transformations of columns, as to 
 reduce redundant calculations.
 
+Aggregator factorizes the group keys once per ``aggregate()`` and computes
+the reductions named in ``REDUCTIONS``, and ``date_min``, ``date_max`` and
+``sum_squares``, with a few vectorized passes per column (see GroupReducer).
+Other reductions, e.g. arbitrary functions, are passed to pandas'
+``groupby().agg()``. The factorized keys are cached by frame and index
+columns in ``group_keys``, so aggregating the same frame by the same index
+again, e.g. with another set of aggregates, does not hash the keys again.
+
 Classes that endusers interface with are Aggregate, Fraction, 
 Count, and Proportion (all of which specify outcome columns and row-wise 
 aggregation functions), and Aggregator (which takes an input dataframe and an
@@ -37,6 +45,9 @@ index by which rows are being grouped).
 
 from itertools import product, chain
 from collections import defaultdict
+import threading
+import types
+import weakref
 
 import pandas as pd
 import numpy as np
@@ -50,7 +61,9 @@ class Column(object):
     existing column, or a lambda function that returns a pd.Series,
     or a constant, in which case it creates a pd.Series of that constant.
 
-    Columns are hashed based on their definition and type.
+    Columns are hashed based on their definition and type. Functions with the
+    same code, defaults and closure, e.g. the same lambda created again by
+    another call to a method, are the same definition.
     """
 
     def __init__(self, definition, astype=None):
@@ -80,10 +93,24 @@ class Column(object):
         return r.astype(self.astype) if self.astype else r
 
     def __hash__(self):
-        return hash((self.definition, self.astype))
+        return hash((_definition_key(self.definition), self.astype))
     def __eq__(self, other):
         return hash(self) == hash(other)
-        
+
+def _definition_key(definition):
+    """The key by which a Column definition is hashed
+    """
+    if isinstance(definition, types.FunctionType):
+        try:
+            closure = tuple(c.cell_contents for c in definition.__closure__ or ())
+            key = (definition.__code__, definition.__defaults__, closure)
+            hash(key)
+            return key
+        except (TypeError, ValueError):
+            # unhashable defaults or closure, or an empty closure cell
+            pass
+    return definition
+
 class ColumnReduction(object):
     """Wraps and hashes a `Column` together with a function that aggregates across rows.
     """
@@ -242,20 +269,521 @@ class Aggregate(ColumnIdentity):
 
         ColumnFunction.__init__(self, column_reductions, column_names)
 
+# reductions computed by GroupReducer, by name
+REDUCTIONS = ('sum', 'count', 'mean', 'min', 'max', 'sumsq')
+
+# NaT as an int64
+_NAT = np.iinfo(np.int64).min
+
+def factorize(df, index):
+    """Factorizes the group keys of a dataframe.
+
+    Args:
+        df (pd.DataFrame)
+        index (str, or list[str]): Column name, or list of column names, of df.
+
+    Returns:
+        (np.ndarray, pd.Index): The group of each row of df, -1 for rows with
+            a missing key, and the sorted groups, as a pd.Index named index, or
+            a pd.MultiIndex named by index for more than one column. Only the
+            groups observed in df are included.
+    """
+    if isinstance(index, basestring):
+        codes, uniques = pd.factorize(df[index], sort=True)
+        return codes, pd.Index(uniques, name=index)
+
+    index = list(index)
+    if len(index) == 1:
+        return factorize(df, index[0])
+
+    level_codes, levels = zip(*[pd.factorize(df[i], sort=True) for i in index])
+    valid = np.logical_and.reduce([c >= 0 for c in level_codes])
+
+    # combine the codes level by level, refactorizing to keep them small;
+    # sorted factorization keeps the combinations in lexicographic order
+    combined = np.zeros(valid.sum(), dtype=np.int64)
+    for c, level in zip(level_codes, levels):
+        combined = pd.factorize(combined * len(level) + c[valid], sort=True)[0]
+
+    # the first row of each group gives the group's key
+    first = np.empty(combined.max() + 1 if len(combined) else 0, dtype=np.int64)
+    first[combined[::-1]] = np.arange(len(combined))[::-1]
+    groups = pd.MultiIndex.from_arrays(
+            [pd.Index(level).take(c[valid][first]) for c, level in zip(level_codes, levels)],
+            names=index)
+
+    codes = np.empty(len(df), dtype=np.int64)
+    codes.fill(-1)
+    codes[valid] = combined
+    return codes, groups
+
+class GroupKeyCache(object):
+    """Caches factorize() by frame and index columns.
+
+    A frame's entries are dropped when the frame is garbage collected. Frames
+    must not be modified in place once they have been aggregated, as drain
+    results are not.
+
+    Attributes:
+        hits (int): The number of factorize() calls answered from the cache.
+        misses (int): The number of factorize() calls that factorized.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        # (id(df), index) -> (weakref to df, codes, groups)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def factorize(self, df, index):
+        """Returns factorize(df, index), from the cache when possible.
+        The codes returned are read-only.
+        """
+        key = (id(df), index if isinstance(index, basestring) else tuple(index))
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0]() is df:
+                self.hits += 1
+                return entry[1], entry[2]
+            self.misses += 1
+
+        codes, groups = factorize(df, index)
+        codes.setflags(write=False)
+
+        cache = self._cache
+        def remove(ref, key=key):
+            if key in cache and cache[key][0] is ref:
+                del cache[key]
+
+        with self._lock:
+            self._cache[key] = (weakref.ref(df, remove), codes, groups)
+        return codes, groups
+
+    def clear(self):
+        """Empties the cache and resets the counters"""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._cache)
+
+# the group key cache used by Aggregator
+group_keys = GroupKeyCache()
+
+_empty_sum = []
+
+def _nan_empty_sum():
+    """Whether this pandas' groupby sum of only missing values is NaN (rather than 0)
+    """
+    if not _empty_sum:
+        _empty_sum.append(np.isnan(pd.Series([np.nan]).groupby([0]).sum().iloc[0]))
+    return _empty_sum[0]
+
+class GroupReducer(object):
+    """Reduces columns by group, given the factorized group keys of their rows.
+
+    For floating point and integer columns, the reductions in REDUCTIONS
+    ('sumsq' is the sum of squares) are computed with a few vectorized passes
+    over the column, shared by all the reductions of that column: a
+    np.bincount() each for the counts, sums and sums of squares, and a
+    reduceat() over the rows sorted by group for the minimums and maximums.
+    Missing values are skipped, as by pandas. Floating point sums are
+    accumulated in float64.
+    For datetime columns, 'count', 'min' and 'max', and date_min and date_max,
+    are computed on the int64 view of the column.
+    Other reductions fall back to pandas' groupby().agg().
+    """
+
+    def __init__(self, codes, groups):
+        """Args:
+            codes (np.ndarray): The group of each row, -1 to leave a row out,
+                as returned by factorize().
+            groups (pd.Index): The groups. Groups without rows are left out.
+        """
+        valid = codes >= 0
+        self.rows = None if valid.all() else np.flatnonzero(valid)
+        if self.rows is not None:
+            codes = codes[self.rows]
+
+        sizes = np.bincount(codes, minlength=len(groups))
+        observed = np.flatnonzero(sizes)
+        if len(observed) < len(groups):
+            remap = np.zeros(len(groups), dtype=np.int64)
+            remap[observed] = np.arange(len(observed))
+            codes = remap[codes]
+            groups = groups.take(observed)
+            sizes = sizes[observed]
+
+        self.codes = codes
+        self.groups = groups
+        self.sizes = sizes
+        self._order = None
+
+    @property
+    def order(self):
+        """The rows sorted by group, and the start of each group in them
+        """
+        if self._order is None:
+            starts = np.zeros(len(self.sizes), dtype=np.int64)
+            np.cumsum(self.sizes[:-1], out=starts[1:])
+            codes = self.codes
+            if len(self.sizes) <= 2**16:
+                # numpy radix sorts 16 bit integers
+                codes = codes.astype(np.uint16)
+            self._order = (np.argsort(codes, kind='mergesort'), starts)
+        return self._order
+
+    def reduce(self, series, agg_funcs):
+        """Reduces a column by group with each of the given functions.
+
+        Args:
+            series (pd.Series): The column, with a row for each code.
+            agg_funcs (list): Reductions, as accepted by pandas' groupby().agg().
+
+        Returns:
+            list[pd.Series]: The reductions, indexed by self.groups.
+        """
+        values = series.values
+        if self.rows is not None:
+            values = values[self.rows]
+        values = np.ascontiguousarray(values)
+
+        stats = {}
+        results = []
+        for agg_func in agg_funcs:
+            name = self._reduction(agg_func, series.dtype)
+            if name is None:
+                results.append(self._agg(series, agg_func))
+            else:
+                results.append(pd.Series(self._reduce(values, name, stats),
+                                         index=self.groups))
+        return results
+
+    @staticmethod
+    def _reduction(agg_func, dtype):
+        """The name of the reduction computed for agg_func on a column of
+        the given dtype, or None when it falls back to pandas
+        """
+        if not isinstance(dtype, np.dtype):
+            # e.g. categorical or timezone aware
+            return None
+        elif dtype.kind == 'M':
+            if agg_func is date_min:
+                return 'min'
+            elif agg_func is date_max:
+                return 'max'
+            elif isinstance(agg_func, basestring) and agg_func in ('count', 'min', 'max'):
+                return agg_func
+        elif dtype.kind in 'fiu':
+            if agg_func is sum_squares:
+                return 'sumsq'
+            elif isinstance(agg_func, basestring) and agg_func in REDUCTIONS:
+                return agg_func
+        return None
+
+    def _agg(self, series, agg_func):
+        if agg_func == 'sumsq':
+            agg_func = sum_squares
+        if self.rows is not None:
+            series = series.iloc[self.rows]
+        r = series.groupby(self.codes).agg(agg_func)
+        r.index = self.groups
+        return r
+
+    def _reduce(self, values, name, stats):
+        """Computes a reduction, caching the statistics it uses in stats
+        """
+        if name not in stats:
+            if values.dtype.kind == 'M':
+                stats[name] = self._reduce_datetime(values, name, stats)
+            elif values.dtype.kind == 'f':
+                stats[name] = self._reduce_float(values, name, stats)
+            else:
+                stats[name] = self._reduce_int(values, name, stats)
+        return stats[name]
+
+    def _missing(self, values, stats):
+        if 'missing' not in stats:
+            if values.dtype.kind == 'M':
+                missing = values.view(np.int64) == _NAT
+            else:
+                missing = np.isnan(values)
+            stats['missing'] = missing if missing.any() else None
+        return stats['missing']
+
+    def _count(self, values, stats):
+        missing = self._missing(values, stats)
+        if missing is None:
+            return self.sizes
+        return np.bincount(self.codes[~missing], minlength=len(self.sizes))
+
+    def _reduce_float(self, values, name, stats):
+        missing = self._missing(values, stats)
+        if name == 'count':
+            return self._count(values, stats)
+        elif name in ('sum', 'sumsq', 'mean'):
+            if name == 'sumsq':
+                weights = np.square(values, dtype=np.float64)
+            else:
+                weights = values
+            if missing is not None:
+                weights = np.where(missing, 0, weights)
+            r = np.bincount(self.codes, weights=weights, minlength=len(self.sizes))
+            if name == 'mean':
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    r = r / self._reduce(values, 'count', stats)
+            elif missing is not None and _nan_empty_sum():
+                r[self._reduce(values, 'count', stats) == 0] = np.nan
+            return r.astype(values.dtype)
+        else:
+            order, starts = self.order
+            ufunc = np.fmin if name == 'min' else np.fmax
+            return ufunc.reduceat(values[order], starts) if len(starts) else \
+                    np.array([], dtype=values.dtype)
+
+    def _reduce_int(self, values, name, stats):
+        if name == 'count':
+            return self.sizes
+        elif name == 'mean':
+            return self._reduce(values, 'sum', stats) / self.sizes.astype(np.float64)
+        if len(self.sizes) == 0:
+            return np.array([], dtype=np.int64 if name in ('sum', 'sumsq') else values.dtype)
+
+        order, starts = self.order
+        if name in ('sum', 'sumsq'):
+            # reduceat over int64 sums exactly, unlike np.bincount()
+            values = values.astype(np.int64)
+            if name == 'sumsq':
+                values = np.square(values)
+            return np.add.reduceat(values[order], starts)
+        else:
+            ufunc = np.minimum if name == 'min' else np.maximum
+            return ufunc.reduceat(values[order], starts)
+
+    def _reduce_datetime(self, values, name, stats):
+        if name == 'count':
+            return self._count(values, stats)
+        if len(self.sizes) == 0:
+            return np.array([], dtype=values.dtype)
+
+        order, starts = self.order
+        i8 = values.view(np.int64)
+        if name == 'min':
+            # NaT is the smallest int64, so skip it by making it the largest
+            missing = self._missing(values, stats)
+            if missing is not None:
+                i8 = np.where(missing, np.iinfo(np.int64).max, i8)
+            r = np.minimum.reduceat(i8[order], starts)
+            r[r == np.iinfo(np.int64).max] = _NAT
+        else:
+            r = np.maximum.reduceat(i8[order], starts)
+        return r.view(values.dtype)
+
+# reductions computed by WindowReducer, by name
+ADDITIVE_REDUCTIONS = ('sum', 'count', 'mean', 'sumsq')
+
+# float64 sums of integers whose squares sum below this are exact
+_EXACT = 2**53
+
+class WindowReducer(object):
+    """Reduces slices of rows by group from cumulative sums.
+
+    The rows are sorted by group, keeping their order within each group, and
+    the cumulative sums of each column in that order are computed once. The
+    sum of a group over a slice of rows is then the difference of its
+    cumulative sums at the bounds of the slice, found by a binary search in
+    the group's rows, so reducing any slice costs O(groups * log(rows)). This
+    suits many long, overlapping slices of the same rows, e.g. date windows
+    of rows sorted by date.
+
+    Only the reductions in ADDITIVE_REDUCTIONS, and sum_squares, of floating
+    point and integer columns are computed, and only when their cumulative
+    sums are exact: integer sums and counts are, and so are floating point
+    sums of integral values, e.g. counts, with a sum of squares below 2**53.
+    Differences of other floating point cumulative sums lose the precision of
+    short slices after large values, so they are left to GroupReducer, see
+    additive().
+    """
+
+    def __init__(self, codes, groups):
+        """Args:
+            codes (np.ndarray): The group of each row, -1 to leave a row out,
+                as returned by factorize().
+            groups (pd.Index): The groups.
+        """
+        valid = np.flatnonzero(codes >= 0)
+        # rows by group, in order within each group, and their sort keys
+        self.rows = valid[np.argsort(codes[valid], kind='mergesort')]
+        self._stride = len(codes) + 1
+        self._keys = codes[self.rows].astype(np.int64) * self._stride + self.rows
+        self._offsets = np.arange(len(groups), dtype=np.int64) * self._stride
+        self.groups = groups
+        # cumulative sums by (column key, reduction)
+        self._sums = {}
+        self._values = {}
+        # whether the floating point sums of a column are exact, by column key
+        self._exact = {}
+
+    def values(self, column, columns):
+        """Returns the values of column in the frame columns, which are cached
+        """
+        if column not in self._values:
+            self._values[column] = columns[column].values
+        return self._values[column]
+
+    def bounds(self, rows):
+        """Returns the bounds in self.rows of each group's rows in the slice rows
+        """
+        return (np.searchsorted(self._keys, self._offsets + rows.start),
+                np.searchsorted(self._keys, self._offsets + rows.stop))
+
+    @staticmethod
+    def reduction(agg_func, dtype):
+        """The name of the reduction computed for agg_func on a column of
+        the given dtype, or None when it is not additive
+        """
+        if isinstance(dtype, np.dtype) and dtype.kind in 'fiu':
+            if agg_func is sum_squares:
+                return 'sumsq'
+            elif isinstance(agg_func, basestring) and agg_func in ADDITIVE_REDUCTIONS:
+                return agg_func
+        return None
+
+    def additive(self, key, values, agg_func):
+        """The name of the reduction computed for agg_func on values, the
+        column under key, or None when it is not additive or its cumulative
+        sums would not be exact
+        """
+        name = self.reduction(agg_func, values.dtype)
+        if name in ('sum', 'mean', 'sumsq') and values.dtype.kind == 'f' and \
+                not self.exact(key, values):
+            return None
+        return name
+
+    def exact(self, key, values):
+        """Whether float64 sums of the floating point column values, under key,
+        and of their squares are exact, i.e. its values are integral and the
+        sum of their squares is below 2**53
+        """
+        if key not in self._exact:
+            finite = values[~np.isnan(values)]
+            self._exact[key] = bool((finite == np.floor(finite)).all()) and \
+                    np.square(finite, dtype=np.float64).sum() < _EXACT
+        return self._exact[key]
+
+    @staticmethod
+    def _terms(values, name):
+        """The terms of the sums of a reduction"""
+        if values.dtype.kind != 'f':
+            if name == 'count':
+                return np.ones(len(values), dtype=np.int64)
+            values = values.astype(np.int64)
+            return np.square(values) if name == 'sumsq' else values
+
+        missing = np.isnan(values)
+        if name == 'count':
+            return (~missing).astype(np.int64)
+        elif name == 'sumsq':
+            values = np.square(values, dtype=np.float64)
+        return np.where(missing, 0, values).astype(np.float64)
+
+    def _cumsum(self, key, values, name):
+        if (key, name) not in self._sums:
+            terms = self._terms(values[self.rows], name)
+            cumsum = np.zeros(len(terms) + 1, dtype=terms.dtype)
+            np.cumsum(terms, out=cumsum[1:])
+            self._sums[(key, name)] = cumsum
+        return self._sums[(key, name)]
+
+    def _sum(self, key, values, name, bounds, observed, update):
+        cumsum = self._cumsum(key, values, name)
+        lo, hi = bounds
+        r = (cumsum[hi] - cumsum[lo])
+        if update is not None:
+            codes, current, new = update
+            r = r + np.bincount(codes, weights=self._terms(new, name) - self._terms(current, name),
+                    minlength=len(r)).astype(r.dtype)
+        return r[observed]
+
+    def reduce(self, key, values, agg_funcs, bounds, observed, update=None):
+        """Reduces a slice of a column by group.
+
+        Args:
+            key: A key for the column, e.g. its Column, under which its cumulative
+                sums are kept.
+            values (np.ndarray): The column, with a row for each code.
+            agg_funcs (list): Reductions, for which reduction() is not None.
+            bounds: The slice's bounds, as returned by bounds().
+            observed (np.ndarray): The groups to return.
+            update: None, or the groups, values and updated values of rows of
+                the slice whose values differ from values.
+
+        Returns:
+            list[np.ndarray]: The reductions of the observed groups.
+        """
+        stats = {}
+        def stat(name):
+            if name not in stats:
+                stats[name] = self._sum(key, values, name, bounds, observed, update)
+            return stats[name]
+
+        results = []
+        for agg_func in agg_funcs:
+            name = self.reduction(agg_func, values.dtype)
+            if values.dtype.kind != 'f':
+                if name == 'mean':
+                    results.append(stat('sum') / stat('count').astype(np.float64))
+                else:
+                    results.append(stat(name))
+                continue
+
+            if name == 'mean':
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    r = stat('sum') / stat('count')
+            elif name == 'count':
+                r = stat('count')
+            else:
+                r = stat(name)
+                if _nan_empty_sum():
+                    r = np.where(stat('count') == 0, np.nan, r)
+            results.append(r.astype(values.dtype) if name != 'count' else r)
+        return results
+
 class Aggregator(object):
     """Binds column functions to a dataframe and allows for aggregation by a given index.
     """
 
-    def __init__(self, df, column_functions):
+    def __init__(self, df, column_functions, rows=None, columns=None, windows=None):
         """
         Args:
             df (pd.DataFrame): A dataframe to apply column functions to, and 
                 which will be aggregated.
             column_functions (list[ColumnFunction]): ColumnFunctions that will
                 be applied to the dataframe.
+            rows (slice, or np.ndarray): Positions of the rows of df to aggregate,
+                None for all of them. A slice aggregates views of the populated
+                columns.
+            columns (pd.DataFrame): Columns populated from the whole of df, named
+                by Column and shared by Aggregators of df, so each is populated
+                once. Missing Columns are populated and added to it. Columns
+                must be row-wise, i.e. the value of a row only depends on that
+                row, for their values to be the same when populated from a
+                subset of the rows.
+            windows (dict): WindowReducers of df by index, shared by Aggregators of
+                slices of df and populated Columns. When given, the additive
+                reductions of a slice with at least as many rows as groups are
+                computed from cumulative sums.
         """
         self.df = df
+        self.rows = rows
         self.column_functions = column_functions
+        self.windows = windows
+        self._columns = columns
+        # rows populated again by update_rows(), by Column
+        self._updated = {}
 
         # unique column reductions from all the column functions
         self.column_reductions = set([cr for cf in column_functions for cr in cf.column_reductions])
@@ -264,7 +792,39 @@ class Aggregator(object):
         self.columns = set([c.column for c in self.column_reductions])
 
         # dataframe of the unique, populated columns, with the column objects as the dataframe's column names
-        self.col_df = pd.DataFrame({col: col.apply(df) for col in self.columns})
+        if columns is None:
+            self.col_df = pd.DataFrame({col: col.apply(df) for col in self.columns})
+        else:
+            for col in self.columns:
+                if col not in columns:
+                    values = col.apply(df)
+                    columns[col] = values.values if isinstance(values, pd.Series) else values
+            self.col_df = columns
+
+        if rows is not None:
+            self.col_df = self.col_df.iloc[rows]
+
+    def update_rows(self, positions, df):
+        """Populates the Columns again for some of the aggregated rows, e.g. after
+        censoring them. Copies the columns whose values change.
+
+        Args:
+            positions (np.ndarray): Positions of the rows among the aggregated rows.
+            df (pd.DataFrame): The rows to populate the Columns from.
+        """
+        changed = {}
+        for col in self.columns:
+            values = np.asarray(col.apply(df))
+            current = self.col_df[col].values[positions]
+            if not ((values == current) | (pd.isnull(values) & pd.isnull(current))).all():
+                changed[col] = values
+
+        if changed:
+            self.col_df = self.col_df[list(self.columns)].copy()
+            for col, values in changed.iteritems():
+                current = self.col_df[col].values[positions]
+                self.col_df.iloc[positions, self.col_df.columns.get_loc(col)] = values
+                self._updated[col] = (positions, current, self.col_df[col].values[positions])
 
     def get_reduced(self, column_reductions):
         """This function gets called by ColumnFunction._apply(). After a ColumnFunction
@@ -282,6 +842,77 @@ class Aggregator(object):
                 raise ValueError("Column reduction %r is not known to this Aggregator!"%cr)
         return self.reduced_df[column_reductions]
 
+    def reduce(self, index):
+        """Reduces the unique Columns by index, setting self.reduced_df.
+
+        Args:
+            index (str, or pd.Index): Index or column name of self.df.
+
+        Returns:
+            pd.DataFrame: A dataframe, aggregated by index, where the column names
+                are ColumnReductions.
+        """
+        # factorize the keys once for all the column reductions
+        codes, groups = group_keys.factorize(self.df, index)
+        window = self._get_window(index, codes, groups)
+        if self.rows is not None:
+            codes = codes[self.rows]
+
+        # reduce all the reductions of a column together
+        column_reductions = defaultdict(list)
+        for colred in self.column_reductions:
+            column_reductions[colred.column].append(colred)
+
+        reduced = {}
+        if window is not None:
+            # additive reductions from cumulative sums
+            bounds = window.bounds(self.rows)
+            observed = np.flatnonzero(bounds[1] > bounds[0])
+            for column, colreds in column_reductions.items():
+                values = window.values(column, self._columns)
+                additive = [c for c in colreds if window.additive(column, values, c.agg_func)]
+                if len(additive) == 0 or \
+                        (column in self._updated and values.dtype.kind != 'f'):
+                    continue
+
+                update = None
+                if column in self._updated:
+                    positions, current, new = self._updated[column]
+                    valid = codes[positions] >= 0
+                    update = (codes[positions][valid], current[valid], new[valid])
+                results = window.reduce(column, values, [c.agg_func for c in additive],
+                        bounds, observed, update)
+                reduced.update(zip(additive, results))
+                column_reductions[column] = [c for c in colreds if c not in additive]
+            reduced_groups = groups.take(observed)
+
+        if window is None or any(column_reductions.values()):
+            # the other reductions directly
+            reducer = GroupReducer(codes, groups)
+            reduced_groups = reducer.groups
+            for column, colreds in column_reductions.iteritems():
+                if len(colreds) > 0:
+                    reduced.update((colred, r.values) for colred, r in zip(colreds,
+                            reducer.reduce(self.col_df[column], [c.agg_func for c in colreds])))
+
+        self.reduced_df = pd.DataFrame(reduced, index=reduced_groups)
+        return self.reduced_df
+
+    def _get_window(self, index, codes, groups):
+        """Returns the WindowReducer of self.df by index for reducing self.rows,
+        or None when they should be reduced directly
+        """
+        if self.windows is None or not isinstance(self.rows, slice):
+            return None
+        if self.rows.stop - self.rows.start < len(groups):
+            # short slices are reduced faster directly
+            return None
+
+        key = index if isinstance(index, basestring) else tuple(index)
+        if key not in self.windows:
+            self.windows[key] = WindowReducer(codes, groups)
+        return self.windows[key]
+
     def aggregate(self, index):
         """Performs a groupby of the unique Columns by index, as constructed from self.df.
 
@@ -293,19 +924,7 @@ class Aggregator(object):
                 of the various ColumnFunctions, and named accordingly.
         """
 
-        # deal with index as a string vs index as a index/MultiIndex
-        if isinstance(index, basestring):
-            col_df_grouped = self.col_df.groupby(self.df[index])
-        else:
-            self.col_df.index = pd.MultiIndex.from_arrays([self.df[i] for i in index])
-            col_df_grouped = self.col_df.groupby(level=index)
-            self.col_df.index = self.df.index
-
-        # perform the actual aggregation
-        self.reduced_df = pd.DataFrame({
-            colred: col_df_grouped[colred.column].agg(colred.agg_func)
-            for colred in self.column_reductions
-            })
+        self.reduce(index)
 
         # then apply the functions to produce the final dataframe
         reduced_dfs = []
@@ -512,3 +1131,9 @@ def date_min(d):
 
 def date_max(d):
     return pd.to_datetime(d.max())
+
+def sum_squares(d):
+    """
+    the sum of squares, also available as the reduction 'sumsq'
+    """
+    return (d**2).sum()
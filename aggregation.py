@@ -1,9 +1,11 @@
 from drain.step import Step
-from drain.aggregate import Aggregator
+from drain.aggregate import Aggregator, group_keys
+from drain.cube import SpacetimeCube
 from drain import util, data
 
 from itertools import product,chain
 import pandas as pd
+import numpy as np
 import logging
 
 class AggregationBase(Step):
@@ -141,6 +143,8 @@ class AggregationBase(Step):
                 df.set_index(self.insert_args, append=True, inplace=True)
                 dfs.append(df)
 
+            logging.info('Group key cache: %s hits, %s misses' %
+                    (group_keys.hits, group_keys.misses))
             return dfs
 
     def get_concat_result(self):
@@ -157,7 +161,7 @@ class AggregationBase(Step):
         return dfs
 
     def _get_aggregator(self, **kwargs):
-        args_tuple = (kwargs[k] for k in self.aggregator_args)
+        args_tuple = tuple(kwargs[k] for k in self.aggregator_args)
         if args_tuple in self._aggregators:
             return self._aggregators[args_tuple]
         else:
@@ -246,7 +250,18 @@ class SpacetimeAggregation(AggregationBase):
     Note that dates should be datetime.datetime, not numpy.datetime64, for yaml serialization and to work with dateutil.relativedelta.
     However since pandas automatically turns a datetime column in the index into datetime64 DatetimeIndex, the left dataframe passed to join() should use datetime64!
     See test_aggregation.SpacetimeCrimeAggregation for an example.
+
+    The input is sorted by date once, and each Column of the aggregates is populated once from the whole input: each (date, delta) Aggregator aggregates a slice of the sorted input and its populated Columns, with the rows censored at its date populated again. Columns must therefore be row-wise, i.e. the value of a row only depends on that row. Subclasses with other Columns should set precompute_columns = False to populate them from each window, as do subclasses overriding get_data().
+
+    When the input is a drain.cube.SpacetimeCube, each window aggregates the days of the cube instead of the events, see drain.cube.
+
+    With precomputed Columns, the additive reductions (see aggregate.WindowReducer) of windows with at least as many rows as groups are computed from cumulative sums over the sorted input for each index, so each window costs O(groups * log(rows)) however many rows it spans. Cumulative sums are only used where they are exact, i.e. for counts and sums of integers, including floating point Columns of integral values; other reductions, e.g. sums of other floating point Columns, are computed from the window's rows.
     """
+    # whether to populate Columns once from the whole input, see above
+    precompute_columns = True
+    # whether to reduce additive reductions of windows from cumulative sums
+    cumulative_sums = True
+
     def __init__(self, spacedeltas, dates, date_column, 
             censor_columns=None, aggregator_args=None, concat_args=None, **kwargs):
         if aggregator_args is None: aggregator_args = ['date', 'delta']
@@ -297,11 +312,104 @@ class SpacetimeAggregation(AggregationBase):
         #    raise ValueError('Left contains unaggregated dates: %s' % difference)
         return AggregationBase.join(self, left)
 
+    def run(self, *args, **kwargs):
+        try:
+            return AggregationBase.run(self, *args, **kwargs)
+        finally:
+            self._data = None
+            self._columns = None
+            self._windows = None
+
     def get_aggregator(self, date, delta):
-        df = self.get_data(date, delta)
-        aggregator = Aggregator(df, self.get_aggregates(date, delta))
+        aggregates = self.get_aggregates(date, delta)
+        if isinstance(self.inputs[0], SpacetimeCube):
+            if len(self.censor_columns) > 0:
+                raise ValueError('Aggregations of a SpacetimeCube can not censor columns')
+            return self.inputs[0].get_aggregator(date, delta, aggregates)
+
+        df = self._get_sorted_data()
+        if df is None:
+            df = self.get_data(date, delta)
+            return Aggregator(df, aggregates)
+
+        rows = self._get_rows(df, date, delta)
+        aggregator = Aggregator(df, aggregates, rows=rows, columns=self._columns,
+                windows=self._windows)
+
+        # populate the rows censored at this date again
+        window = df.iloc[rows]
+        censored = np.zeros(len(window), dtype=bool)
+        for date_column in self.censor_columns:
+            censored |= (window[date_column] >= pd.Timestamp(date)).values
+        positions = np.flatnonzero(censored)
+        if len(positions) > 0:
+            censored_df = data.date_censor(window.iloc[positions].copy(),
+                    self.censor_columns, date)
+            aggregator.update_rows(positions, censored_df)
+
         return aggregator
 
+    def _get_sorted_data(self):
+        """
+        Returns the input sorted by date, with the rows whose censoring dates
+        are missing censored, or None when the Columns are populated from each
+        window, see precompute_columns
+        """
+        if getattr(self, '_data', None) is None:
+            self._data = self._sort_data()
+            self._columns = pd.DataFrame(index=self._data.index) \
+                    if self._data is not None else None
+            self._windows = {} if self.cumulative_sums else None
+        return self._data
+
+    def _sort_data(self):
+        get_data = getattr(self.__class__.get_data, '__func__', self.__class__.get_data)
+        if not self.precompute_columns or \
+                get_data is not getattr(SpacetimeAggregation.get_data, '__func__',
+                        SpacetimeAggregation.get_data):
+            return None
+
+        df = self.inputs[0].get_result()
+        dates = df[self.date_column]
+        if not isinstance(dates.dtype, np.dtype) or dates.dtype.kind != 'M':
+            return None
+
+        # censored index columns would change the groups of the censored rows
+        censored = set(chain(self.censor_columns, *self.censor_columns.values()))
+        for index in self.indexes.values():
+            if censored.intersection([index] if isinstance(index, basestring) else index):
+                return None
+
+        if not dates.is_monotonic_increasing:
+            # stable, with missing dates last
+            missing = pd.isnull(dates.values)
+            order = np.flatnonzero(~missing)
+            order = order[np.argsort(dates.values[order], kind='mergesort')]
+            df = df.iloc[np.concatenate([order, np.flatnonzero(missing)])]
+        elif len(self.censor_columns) > 0:
+            df = df.copy()
+
+        # censoring at the end of time censors exactly the rows with a
+        # missing censoring date, which every window censors
+        if len(self.censor_columns) > 0:
+            df = data.date_censor(df, self.censor_columns, pd.Timestamp.max)
+
+        self._dates = df[self.date_column].dropna().values
+        return df
+
+    def _get_rows(self, df, date, delta):
+        """
+        Returns the slice of the rows of the sorted input selected by
+        data.date_select()
+        """
+        end = np.searchsorted(self._dates, pd.Timestamp(date).to_datetime64())
+        delta = data.parse_delta(delta)
+        if delta is None:
+            start = 0
+        else:
+            start = np.searchsorted(self._dates, pd.Timestamp(date - delta).to_datetime64())
+        return slice(start, end)
+
     def get_data(self, date, delta):
         df = self.inputs[0].get_result()
         df = data.date_select(df, self.date_column, date, delta)
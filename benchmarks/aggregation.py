@@ -0,0 +1,93 @@
+"""
+Aggregation benchmark for drain.aggregate.
+
+Generates an event table like test/crimes.csv and aggregates it with a
+typical set of Count, Proportion and Aggregate column functions by a
+single and by a pair of key columns, timing:
+    pandas: a groupby().agg() per column reduction, as Aggregator used to
+    drain: Aggregator.reduce(), which factorizes the keys once and
+        reduces each column in a few vectorized passes
+
+Usage:
+    python benchmarks/aggregation.py [-n 3] [--rows 1000000] [--types 10]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from drain.aggregate import Aggregator, Aggregate, Count, Proportion, sum_squares
+
+
+def events(rows, types, seed=0):
+    """
+    Returns a frame of events with a district, a community area, a date,
+    a primary type, an arrest flag and a quantity
+    """
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame({
+        'District': rng.randint(1, 26, rows),
+        'Community Area': rng.randint(1, 78, rows),
+        'Date': pd.Timestamp('2010-01-01') +
+                pd.to_timedelta(rng.randint(0, 365*5*24, rows), unit='h'),
+        'Primary Type': rng.randint(0, types, rows),
+        'Arrest': rng.rand(rows) < 0.2,
+        'Quantity': rng.lognormal(2, 1, rows)})
+
+
+def aggregates(types):
+    a = [Count(), Count('Arrest', prop=True),
+         Aggregate('Quantity', ['sum', 'mean', 'min', 'max', 'sumsq'])]
+    for t in range(types):
+        a.append(Count(lambda df, t=t: df['Primary Type'] == t,
+                       'type_%s' % t, prop=True))
+        a.append(Proportion(lambda df, t=t: (df['Primary Type'] == t) & df.Arrest,
+                            lambda df, t=t: df['Primary Type'] == t,
+                            'type_%s_arrest' % t, 'type_%s' % t))
+    return a
+
+
+def pandas_reduce(aggregator, index):
+    """
+    Reduce each column reduction with its own groupby().agg()
+    """
+    df = aggregator.df
+    if isinstance(index, basestring):
+        grouped = aggregator.col_df.groupby(df[index])
+    else:
+        grouped = aggregator.col_df.groupby([df[i] for i in index])
+    return pd.DataFrame({colred: grouped[colred.column].agg(
+                sum_squares if colred.agg_func == 'sumsq' else colred.agg_func)
+            for colred in aggregator.column_reductions})
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def timed(f, n):
+    times = []
+    for i in range(n):
+        t = time.time()
+        f()
+        times.append(time.time() - t)
+    return median(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time Aggregator reductions')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='number of runs, the median is reported')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of events')
+    parser.add_argument('--types', type=int, default=10, help='number of primary types counted')
+    args = parser.parse_args()
+
+    df = events(args.rows, args.types)
+    aggregator = Aggregator(df, aggregates(args.types))
+    print('%s rows, %s column reductions' % (args.rows, len(aggregator.column_reductions)))
+    print('%-28s %10s %10s %8s' % ('index', 'pandas', 'drain', 'speedup'))
+    for index in ['District', ['District', 'Community Area']]:
+        p = timed(lambda: pandas_reduce(aggregator, index), args.repeat)
+        d = timed(lambda: aggregator.reduce(index), args.repeat)
+        print('%-28s %9.3fs %9.3fs %7.1fx' % (index, p, d, p / d))
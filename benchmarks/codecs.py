@@ -0,0 +1,143 @@
+"""
+Compression codec benchmark for drain results.
+
+Dumps a result with each store and codec and reports:
+    size: the size of the dump directory, and its ratio to the dump of
+        the same store with the first codec, 'none' by default
+    write: write throughput in MB/s of uncompressed data
+    read: read throughput in MB/s of uncompressed data, loading the
+        result and touching every value
+
+The result is either a representative aggregation frame, float32
+counts and sums over spaces and dates as written by drain.aggregation,
+or a DataFrame result already dumped by a step (--dirname).
+
+Usage:
+    python benchmarks/codecs.py [-n 3] [--rows 1000000] [--columns 50]
+        [--stores hdf,npy,joblib] [--codecs 'none;zlib,1;blosc:lz4,5;...']
+        [--dirname OUTPUTDIR/Step/digest/dump]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from drain import store, stream
+
+CODECS = ['none', 'zlib,1', 'zlib,5', 'bz2,5', 'blosc:lz4,5', 'blosc:lz4hc,5',
+          'blosc:zstd,3', 'blosc:zstd,9']
+
+
+def aggregation_frame(rows, columns, seed=0):
+    """
+    Returns a frame like those of drain.aggregation: an (id, date) index
+    and float32 columns of sparse counts and sums with many repeats
+    """
+    rng = np.random.RandomState(seed)
+    ids = rng.randint(0, max(rows // 100, 1), rows)
+    dates = pd.Timestamp('2010-01-01') + \
+            pd.to_timedelta(rng.randint(0, 365*5, rows), unit='D')
+    data = {}
+    for c in range(columns):
+        counts = rng.poisson(0.5, rows).astype(np.float32)
+        if c % 2:
+            # sums of a rounded quantity over the counted events
+            counts *= np.round(rng.lognormal(2, 1, rows), 1).astype(np.float32)
+        data['column_%s' % c] = counts
+    df = pd.DataFrame(data)
+    df['id'] = ids
+    df['date'] = dates
+    return df.set_index(['id', 'date'])
+
+
+def nbytes(result):
+    """
+    Returns the uncompressed size of a DataFrame or collection of them
+    """
+    return sum(df.memory_usage(index=True, deep=True).sum()
+            for df in store._items(result)[2])
+
+
+def touch(result):
+    """
+    Reads every value of a loaded result, so memory-mapped data is read
+    """
+    for df in store._items(result)[2]:
+        for block in df._data.blocks:
+            if block.dtype != object:
+                np.asarray(block.values).sum()
+
+
+def du(dirname):
+    return sum(os.path.getsize(os.path.join(d, f))
+            for d, _, files in os.walk(dirname) for f in files)
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def benchmark(result, name, compression, n):
+    """
+    Returns the size, write seconds and read seconds of dumping result
+    with the given store and compression, the medians of n runs
+    """
+    sizes, writes, reads = [], [], []
+    for i in range(n):
+        dirname = tempfile.mkdtemp()
+        try:
+            t = time.time()
+            store.dump(result, dirname, name, compression)
+            writes.append(time.time() - t)
+            sizes.append(du(dirname))
+
+            t = time.time()
+            touch(store.load(dirname))
+            reads.append(time.time() - t)
+        finally:
+            shutil.rmtree(dirname)
+    return median(sizes), median(writes), median(reads)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare compression codecs on drain results')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='number of runs, the median is reported')
+    parser.add_argument('--rows', type=int, default=1000000, help='rows of the generated frame')
+    parser.add_argument('--columns', type=int, default=50, help='float32 columns of the generated frame')
+    parser.add_argument('--stores', default='hdf,npy,joblib', help='comma separated stores')
+    parser.add_argument('--codecs', default=';'.join(CODECS), help='semicolon separated compression settings')
+    parser.add_argument('--dirname', help='benchmark the result dumped in this directory instead')
+    args = parser.parse_args()
+
+    if args.dirname:
+        result = store.load(args.dirname)
+        if isinstance(result, stream.Chunks):
+            result = list(result)
+        if not store._is_dataframes(result):
+            parser.error('%s is not a DataFrame result' % args.dirname)
+    else:
+        result = aggregation_frame(args.rows, args.columns)
+    mb = nbytes(result) / 1e6
+
+    print('%.1f MB uncompressed' % mb)
+    print('%-8s %-16s %10s %7s %12s %12s' %
+            ('store', 'codec', 'size MB', 'ratio', 'write MB/s', 'read MB/s'))
+    for name in args.stores.split(','):
+        baseline = None
+        for compression in args.codecs.split(';'):
+            try:
+                size, write, read = benchmark(result, name, compression, args.repeat)
+            except Exception as e:
+                print('%-8s %-16s failed: %s' % (name, compression, e))
+                continue
+            if baseline is None:
+                baseline = size
+            print('%-8s %-16s %10.1f %7.2f %12.1f %12.1f' % (name, compression,
+                    size / 1e6, float(size) / baseline, mb / write, mb / read))
+            sys.stdout.flush()
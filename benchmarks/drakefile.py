@@ -0,0 +1,68 @@
+"""
+Drakefile generation benchmark for large grids.
+
+Builds a grid of target steps, each with one of a few shared target
+inputs, and times:
+    graph: building the StepGraph and the drake data of the grid
+    preview: generating the Drakefile without touching the file system
+    setup: generating it with preview=False in a fresh OUTPUTDIR, i.e.
+        creating every output directory and writing its step.yaml
+    setup again: the same once the step.yaml files exist and are
+        recorded in the manifest, unless DRAIN_MANIFEST=0
+
+Usage:
+    python benchmarks/drakefile.py [--targets 50000] [-j 8]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from drain import step, drake
+import drain.yaml
+
+
+class Train(step.Step):
+    pass
+
+
+class Aggregate(step.Step):
+    pass
+
+
+def grid(n):
+    """
+    Returns n target steps over 100 shared target inputs
+    """
+    inputs = [Aggregate(spacedeltas=['1y', '5y'], year=2000 + i, target=True)
+            for i in range(100)]
+    return [Train(inputs=[inputs[i % len(inputs)]], n_estimators=i,
+                  max_features='sqrt', target=True)
+            for i in range(n)]
+
+
+def timed(f):
+    t = time.time()
+    f()
+    return time.time() - t
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time Drakefile generation for a large grid')
+    parser.add_argument('--targets', type=int, default=50000, help='number of targets in the grid')
+    parser.add_argument('-j', '--jobs', type=int, default=8, help='threads setting up output directories')
+    args = parser.parse_args()
+
+    step.OUTPUTDIR = tempfile.mkdtemp()
+    drain.yaml.configure()
+    try:
+        steps = grid(args.targets)
+        print('%s targets' % args.targets)
+        print('graph: %.3fs' % timed(lambda: drake.get_drake_data(steps)))
+        print('preview: %.3fs' % timed(lambda: drake.to_drakefile(steps, preview=True)))
+        print('setup: %.3fs' % timed(lambda: drake.to_drakefile(steps,
+                preview=False, n_jobs=args.jobs)))
+        print('setup again: %.3fs' % timed(lambda: drake.to_drakefile(steps,
+                preview=False, n_jobs=args.jobs)))
+    finally:
+        shutil.rmtree(step.OUTPUTDIR)
@@ -0,0 +1,139 @@
+"""
+Serialization benchmark for drain steps.
+
+Builds a grid of steps sharing inputs, like a model search over
+aggregations, and times each stage of the serialization path with the
+pure-Python PyYAML classes and with the ones drain uses:
+    digest: hashing the signature of every step in the grid, encoded
+        as YAML and with drain's canonical encoding
+    dump: writing every step's step.yaml
+    load: reading every step.yaml back with drain.yaml.load
+
+Usage:
+    python benchmarks/serialization.py [-n 3] [--steps 1000]
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import date
+
+import yaml
+
+from drain import step
+import drain.yaml
+
+
+class PythonSignatureDumper(yaml.Dumper):
+    """
+    The YAML signature dumper without libyaml, as drain used to hash steps
+    """
+    def ignore_aliases(self, data):
+        return True
+
+PythonSignatureDumper.add_multi_representer(step.Step, step._digest_representer)
+
+
+def signature(s, encode):
+    cls = s.__class__
+    return encode({'step': '%s.%s' % (cls.__module__, cls.__name__),
+                   'arguments': s.get_arguments()})
+
+
+def yaml_encode(obj):
+    return yaml.dump(obj, Dumper=PythonSignatureDumper)
+
+
+def grid(n):
+    """
+    Returns n steps with dates, lists, tuples and nested dictionaries
+    among their arguments, each with one of a few shared inputs
+    """
+    inputs = [step.Step(table='events_%s' % i, dates=[date(2010 + i, 1, 1)],
+            target=True) for i in range(10)]
+    return [step.Step(inputs=[inputs[i % len(inputs)]], target=True,
+                   model={'n_estimators': i, 'max_features': 'sqrt',
+                          'class_weight': {0: 1, 1: i % 7}},
+                   window=(i % 3, 'days'), spacedeltas=['1y', '2y', '5y'],
+                   outcome_expr='count > 0', train_years=i % 5)
+            for i in range(n)]
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def timed(f, n):
+    times = []
+    for i in range(n):
+        t = time.time()
+        f()
+        times.append(time.time() - t)
+    return median(times)
+
+
+def time_digest(encode, steps, n):
+    grid_steps = grid(steps)
+    for s in grid_steps:
+        for i in s.inputs:
+            i._digest
+
+    def digest():
+        for s in grid_steps:
+            hashlib.md5(signature(s, encode).encode('utf-8')).digest()
+    return timed(digest, n)
+
+
+def time_dump(dumper, steps, n):
+    outputdir = tempfile.mkdtemp()
+    grid_steps = grid(steps)
+
+    def dump():
+        for i, s in enumerate(grid_steps):
+            with open(os.path.join(outputdir, '%s.yaml' % i), 'w') as f:
+                yaml.dump(s, f, Dumper=dumper)
+    return timed(dump, n), outputdir
+
+
+def time_load(loader, outputdir, n):
+    filenames = [os.path.join(outputdir, f) for f in os.listdir(outputdir)]
+    default = drain.yaml.Loader
+
+    def load():
+        for filename in filenames:
+            drain.yaml.load(filename)
+    try:
+        drain.yaml.Loader = loader
+        return timed(load, n)
+    finally:
+        drain.yaml.Loader = default
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time step serialization')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='number of runs, the median is reported')
+    parser.add_argument('--steps', type=int, default=1000, help='number of steps in the grid')
+    args = parser.parse_args()
+
+    drain.yaml.configure()
+    print('libyaml: %s' % ('yes' if step.Dumper is not yaml.Dumper else 'no'))
+    print('%-8s %12s %12s' % ('stage', 'python', 'drain'))
+
+    print('%-8s %11.3fs %11.3fs' % ('digest',
+            time_digest(yaml_encode, args.steps, args.repeat),
+            time_digest(step._canonical, args.steps, args.repeat)))
+
+    python_dump, python_dir = time_dump(yaml.Dumper, args.steps, args.repeat)
+    drain_dump, drain_dir = time_dump(step.Dumper, args.steps, args.repeat)
+    print('%-8s %11.3fs %11.3fs' % ('dump', python_dump, drain_dump))
+
+    try:
+        print('%-8s %11.3fs %11.3fs' % ('load',
+                time_load(yaml.Loader, python_dir, args.repeat),
+                time_load(drain.yaml.Loader, drain_dir, args.repeat)))
+    finally:
+        shutil.rmtree(python_dir)
+        shutil.rmtree(drain_dir)
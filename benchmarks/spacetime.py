@@ -0,0 +1,109 @@
+"""
+SpacetimeAggregation benchmark over many dates and deltas.
+
+Generates an event table like test/crimes.csv and aggregates it with
+counts and proportions by two spatial indexes over weekly dates and
+several deltas, timing SpacetimeAggregation.run() with:
+    window: Columns populated from each filtered and censored window,
+        i.e. precompute_columns = False
+    precomputed: Columns populated once and sliced per window, with
+        cumulative_sums = False
+    cumulative: additive reductions from cumulative sums, the default
+
+Usage:
+    python benchmarks/spacetime.py [-n 3] [--rows 1000000] [--dates 52]
+        [--deltas 1m,6m,1y,2y]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from drain.step import Step
+from drain.aggregation import SpacetimeAggregation
+from drain.aggregate import Aggregate, Count, Proportion
+
+
+class Events(Step):
+    def __init__(self, rows, seed=0, **kwargs):
+        Step.__init__(self, rows=rows, seed=seed, **kwargs)
+
+    def run(self):
+        rng = np.random.RandomState(self.seed)
+        arrested = rng.rand(self.rows) < 0.2
+        dates = pd.Timestamp('2010-01-01') + \
+                pd.to_timedelta(rng.randint(0, 365*5*24, self.rows), unit='h')
+        arrest_dates = dates + pd.to_timedelta(rng.randint(0, 24*30, self.rows), unit='h')
+        return pd.DataFrame({
+            'District': rng.randint(1, 26, self.rows),
+            'Community Area': rng.randint(1, 78, self.rows),
+            'Date': dates,
+            'Arrest Date': np.where(arrested, arrest_dates.values, np.datetime64('NaT')),
+            'Arrest': arrested.astype(np.float32),
+            'Primary Type': rng.randint(0, 10, self.rows),
+            'Quantity': rng.lognormal(2, 1, self.rows)})
+
+
+class EventAggregation(SpacetimeAggregation):
+    def __init__(self, inputs, dates, deltas, **kwargs):
+        SpacetimeAggregation.__init__(self, inputs=inputs, dates=dates,
+                spacedeltas={'district': ('District', deltas),
+                             'community': ('Community Area', deltas)},
+                date_column='Date', censor_columns={'Arrest Date': ['Arrest']},
+                prefix='events', **kwargs)
+
+    def get_aggregates(self, date, delta):
+        a = [Count(), Count('Arrest', prop=True),
+             Aggregate('Quantity', ['sum', 'mean', 'max'])]
+        for t in range(10):
+            a.append(Count(lambda df, t=t: df['Primary Type'] == t, 'type_%s' % t, prop=True))
+            a.append(Proportion(lambda df, t=t: (df['Primary Type'] == t) * df.Arrest,
+                                lambda df, t=t: df['Primary Type'] == t,
+                                'type_%s_arrest' % t, 'type_%s' % t))
+        return a
+
+
+class WindowAggregation(EventAggregation):
+    precompute_columns = False
+
+
+class PrecomputedAggregation(EventAggregation):
+    cumulative_sums = False
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def timed(f, n):
+    times = []
+    for i in range(n):
+        t = time.time()
+        f()
+        times.append(time.time() - t)
+    return median(times)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time SpacetimeAggregation')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='number of runs, the median is reported')
+    parser.add_argument('--rows', type=int, default=1000000, help='number of events')
+    parser.add_argument('--dates', type=int, default=52, help='number of weekly dates')
+    parser.add_argument('--deltas', default='1m,6m,1y,2y', help='comma separated deltas')
+    args = parser.parse_args()
+
+    events = Events(rows=args.rows)
+    events.set_result(events.run())
+    dates = [datetime(2014, 1, 1) + timedelta(weeks=i) for i in range(args.dates)]
+    deltas = args.deltas.split(',')
+
+    print('%s rows, %s dates, deltas %s' % (args.rows, args.dates, ', '.join(deltas)))
+    for name, cls in [('window', WindowAggregation),
+                      ('precomputed', PrecomputedAggregation),
+                      ('cumulative', EventAggregation)]:
+        def run():
+            cls(inputs=[events], dates=dates, deltas=deltas).run()
+        print('%-12s %9.3fs' % (name, timed(run, args.repeat)))
@@ -0,0 +1,102 @@
+"""
+Startup-time budget for drain.
+
+Measures, each in fresh interpreters:
+    import: the time to `import drain.step`
+    run_step: the wall time of `python bin/run_step.py` running a trivial
+        target, i.e. the per-target overhead drake pays
+
+and exits with status 1 when the median of either exceeds its budget.
+It also reports the heavy modules that `import drain.step` pulled in,
+which should be none: they are imported by the features that need them.
+
+Usage:
+    python benchmarks/startup.py [-n 5] [--import-budget 0.4] [--run-step-budget 1.0]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY = ('pandas', 'sklearn', 'scipy', 'sqlalchemy', 'tables', 'matplotlib', 'joblib')
+
+BINDIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin')
+
+IMPORT_SCRIPT = """
+import sys, time
+t = time.time()
+import drain.step
+t = time.time() - t
+heavy = sorted(set(m.split('.')[0] for m in sys.modules
+        if sys.modules[m] is not None and m.split('.')[0] in %r))
+print('%%s %%s' %% (t, ','.join(heavy)))
+""" % (HEAVY,)
+
+SETUP_SCRIPT = """
+import sys
+from drain import step
+import drain.yaml
+step.OUTPUTDIR = sys.argv[1]
+drain.yaml.configure()
+s = step.Scalar(value=1, target=True)
+s.setup_dump()
+print('%s %s' % (s._target_filename, s._yaml_filename))
+"""
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def time_import(n):
+    times = []
+    for i in range(n):
+        out = subprocess.check_output([sys.executable, '-c', IMPORT_SCRIPT],
+                cwd=tempfile.gettempdir())
+        t, heavy = (out.decode().strip().split(' ') + [''])[:2]
+        times.append(float(t))
+    return median(times), heavy
+
+
+def time_run_step(n):
+    outputdir = tempfile.mkdtemp()
+    try:
+        args = subprocess.check_output([sys.executable, '-c', SETUP_SCRIPT,
+                outputdir], cwd=outputdir).decode().split()
+        env = dict(os.environ)
+        env.pop('DRAIN_DAEMON', None)
+
+        times = []
+        with open(os.devnull, 'w') as devnull:
+            for i in range(n):
+                t = time.time()
+                subprocess.check_call([sys.executable,
+                        os.path.join(BINDIR, 'run_step.py')] + args,
+                        stdout=devnull, stderr=devnull, env=env, cwd=outputdir)
+                times.append(time.time() - t)
+        return median(times)
+    finally:
+        shutil.rmtree(outputdir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check drain startup times against a budget')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='number of runs, the median is reported')
+    parser.add_argument('--import-budget', type=float, default=0.4, help='seconds allowed for import drain.step')
+    parser.add_argument('--run-step-budget', type=float, default=1.0, help='seconds allowed for run_step.py')
+    args = parser.parse_args()
+
+    import_time, heavy = time_import(args.repeat)
+    run_step_time = time_run_step(args.repeat)
+
+    print('import drain.step: %.3fs (budget %.3fs)' % (import_time, args.import_budget))
+    print('heavy modules imported: %s' % (heavy or 'none'))
+    print('run_step.py: %.3fs (budget %.3fs)' % (run_step_time, args.run_step_budget))
+
+    if import_time > args.import_budget or run_step_time > args.run_step_budget:
+        print('Over budget')
+        sys.exit(1)
@@ -0,0 +1,19 @@
+"""
+Serve run_step.py requests from pre-imported worker processes.
+Set DRAIN_DAEMON to the socket path for run_step.py to use it.
+See drain.daemon.
+"""
+import argparse
+
+from drain import daemon
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a warm worker daemon for run_step.py')
+    parser.add_argument('-s', '--socket', type=str, required=True, help='path of the unix socket to listen on')
+    parser.add_argument('-p', '--preload', type=str, action='append', default=[], help='additional module to import before serving, e.g. the module defining your steps')
+    args = parser.parse_args()
+
+    try:
+        daemon.serve(args.socket, preload=args.preload)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,64 @@
+"""
+Move the step directories in an OUTPUTDIR to the locations given by the
+current step digests, e.g. after the signature encoding has changed.
+
+Each {OUTPUTDIR}/{Class}/{digest}/ directory is renamed according to the
+digest of the step loaded from its step.yaml. Renaming preserves the
+target and dump modification times so that drake does not consider the
+migrated steps stale.
+"""
+import os
+import argparse
+import logging
+
+from drain import step
+import drain.yaml
+
+def migrate(outputdir, dry_run=False):
+    """
+    Returns:
+        the number of directories that were (or would be) moved
+    """
+    moved = 0
+    for class_name in sorted(os.listdir(outputdir)):
+        class_dirname = os.path.join(outputdir, class_name)
+        if not os.path.isdir(class_dirname):
+            continue
+
+        for digest in sorted(os.listdir(class_dirname)):
+            dirname = os.path.join(class_dirname, digest)
+            yaml_filename = os.path.join(dirname, 'step.yaml')
+            if not os.path.isfile(yaml_filename):
+                continue
+
+            try:
+                s = drain.yaml.load(yaml_filename)
+            except Exception as e:
+                logging.warning('Skipping %s, could not load step: %s' % (dirname, e))
+                continue
+
+            new_dirname = s._output_dirname
+            if os.path.abspath(new_dirname) == os.path.abspath(dirname):
+                continue
+            if os.path.exists(new_dirname):
+                logging.warning('Skipping %s, %s already exists' % (dirname, new_dirname))
+                continue
+
+            logging.info('Moving %s to %s' % (dirname, new_dirname))
+            if not dry_run:
+                os.rename(dirname, new_dirname)
+            moved += 1
+
+    return moved
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Move step directories to their current digests')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='only log the moves')
+    parser.add_argument('outputdir', type=str, help='output base directory')
+    args = parser.parse_args()
+
+    step.OUTPUTDIR = os.path.abspath(args.outputdir)
+    drain.yaml.configure()
+
+    moved = migrate(step.OUTPUTDIR, dry_run=args.dry_run)
+    logging.info('%s %s directories' % ('Would move' if args.dry_run else 'Moved', moved))
@@ -1,43 +1,16 @@
 import sys
 import os
-from os.path import dirname
-import logging
 
-import drain.step
-import drain.yaml
-
-def is_target(filename):
-    return filename.endswith('/target')
-
-def is_step(filename):
-    return filename.endswith('/step.yaml')
-
-# given the filename of a step or a target, load it
-def get_step(filename):
-    yaml_filename = os.path.join(dirname(filename), 'step.yaml')
-    return drain.yaml.load(yaml_filename)
-
-if len(sys.argv) == 1:
-    raise ValueError('Need at least one argument')
+from drain import daemon
 
 args = sys.argv[1:]
 
-drain.step.OUTPUTDIR = dirname(dirname(dirname(args[0])))
-drain.yaml.configure()
-
-if is_target(args[0]):
-    output = get_step(args[0])
-    args = args[1:]
-else:
-    output = None
-
-if not is_step(args[0]):
-    raise ValueError('Need a step to run')
-
-step = get_step(args[0])
-inputs = []
-for i in args[1:]:
-    if is_step(i) or is_target(i):
-        inputs.append(get_step(i))
+# forward to a warm daemon when one is configured, see drain.daemon
+if os.environ.get(daemon.ENVIRON):
+    code = daemon.submit(os.environ[daemon.ENVIRON], args)
+    if code is not None:
+        sys.exit(code)
+    sys.stderr.write('drain daemon at %s did not run the step, running locally\n' % os.environ[daemon.ENVIRON])
 
-step.execute(output=output, inputs=inputs)
+from drain import drake
+drake.run_step(args)
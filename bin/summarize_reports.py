@@ -0,0 +1,31 @@
+"""
+Summarize the report.json files written by run_step.py across an OUTPUTDIR,
+listing step classes by the total wall time spent loading, running and
+dumping them. See drain.report.
+"""
+import argparse
+
+import pandas as pd
+
+from drain import report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Summarize step run reports')
+    parser.add_argument('-n', '--top', type=int, default=None, help='only show the top n steps')
+    parser.add_argument('--csv', action='store_true', help='print csv instead of a table')
+    parser.add_argument('outputdir', type=str, help='output base directory')
+    args = parser.parse_args()
+
+    reports = report.read_reports(args.outputdir)
+    if len(reports) == 0:
+        print('No reports found in %s' % args.outputdir)
+    else:
+        summary = report.summarize(reports)
+        if args.top is not None:
+            summary = summary.head(args.top)
+
+        if args.csv:
+            print(summary.to_csv())
+        else:
+            with pd.option_context('display.width', 200, 'display.max_rows', None):
+                print(summary)
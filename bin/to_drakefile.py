@@ -2,6 +2,7 @@ import os
 import sys
 import argparse
 import importlib
+import logging
 
 from drain import step, util, drake
 import drain.yaml
@@ -15,6 +16,9 @@ if __name__ == "__main__":
     parser.add_argument('-d', '--debug', action='store_true', help='run python -m pdb')
     parser.add_argument('-P', '--preview', action='store_true', help='Preview Drakefile')
     parser.add_argument('--outputdir', type=str, help='output base directory')
+    parser.add_argument('--native', action='store_true', help='run stale steps with drain.scheduler instead of drake')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='number of worker processes for --native and threads setting up output directories, -1 for one per cpu')
+    parser.add_argument('--async-dump', action='store_true', help='with --native and one job, dump each target in the background while the next one runs')
     
     parser.add_argument('steps', type=str, help='yaml file or reference to python collection of drain.Step objects or reference to python function returning same. can specify multiple using semi-colon separator.')
 
@@ -40,11 +44,23 @@ if __name__ == "__main__":
             s = util.make_list(s() if hasattr(s, '__call__') else s)
             steps += s
 
+    if args.native:
+        from drain import scheduler
+        if args.Drakeinput is not None or drake_args:
+            logging.warning('Ignoring drake arguments with --native')
+
+        stale = scheduler.Scheduler(steps, n_jobs=args.jobs, async_dump=args.async_dump).run(preview=args.preview)
+        if args.preview:
+            for output in stale:
+                print output._output_dirname
+        # leave the drakefile empty so that bin/drain does not call drake
+        sys.exit()
+
     if args.Drakeinput is None and os.path.exists('Drakefile'):
         args.Drakeinput = 'Drakefile'
     drakeinput = os.path.abspath(args.Drakeinput) if args.Drakeinput else None
 
-    workflow = drake.to_drakefile(steps, preview=args.preview, debug=args.debug, input_drakefile=drakeinput)
+    workflow = drake.to_drakefile(steps, preview=args.preview, debug=args.debug, input_drakefile=drakeinput, n_jobs=args.jobs)
 
     if not args.preview:
         with open(args.drakeoutput, 'w') as drakefile:
@@ -0,0 +1,315 @@
+"""
+Tiered cache of step results.
+
+The results dumped by drain.store live in the shared tier, the step
+directories of drain.step.OUTPUTDIR, e.g. on a network share. With a
+local tier, a directory on a fast local disk set by the DRAIN_LOCALDIR
+environment variable, the results are also kept in
+
+    {DRAIN_LOCALDIR}/{Class}/{digest}/dump/
+
+Step.dump() writes a result to the local tier first and then publishes it
+to the shared tier. Step.load() reads the local copy when it is current,
+and otherwise reads the shared one, first promoting it to the local tier
+unless DRAIN_PROMOTE=0. Steps overriding dump() and load() write and read
+their files through dump() and get_dirname() below.
+
+Every dump is written to a temporary directory next to its final location
+and renamed into place, so readers never see a partially written dump.
+Each published dump holds a random version in its .version file, and a
+local copy is current when its version matches the shared one, so a
+result re-run on another machine is not read from a stale local copy.
+
+Each tier may be given a size limit in bytes, with an optional K, M, G
+or T suffix, by DRAIN_LOCAL_LIMIT and DRAIN_SHARED_LIMIT. When a dump or
+promotion takes a tier over its limit, the least recently used dumps are
+evicted. Evicting a shared dump also removes its target, so that it is
+run again when needed. Tiers are unlimited by default. The sizes and last
+use of a tier's dumps are recorded in the manifest of its directory, see
+drain.manifest, so that eviction does not walk the tier; with
+DRAIN_MANIFEST=0 it does.
+"""
+import errno
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from drain import manifest
+
+# name of the file holding the version of a dump
+VERSION = '.version'
+
+_SUFFIXES = {'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
+
+def parse_size(size):
+    """
+    Returns a size such as 100, '512M' or '2G' in bytes, None for None
+    """
+    if size is None or size == '':
+        return None
+    size = str(size).strip().upper()
+    if size[-1] in _SUFFIXES:
+        return int(float(size[:-1]) * _SUFFIXES[size[-1]])
+    return int(size)
+
+
+def read_environ():
+    """
+    Read the settings below from the environment, again in a drain.daemon
+    worker once it has the client's environment
+    """
+    global LOCALDIR, LOCAL_LIMIT, SHARED_LIMIT, PROMOTE
+    LOCALDIR = os.environ.get('DRAIN_LOCALDIR')
+    LOCAL_LIMIT = parse_size(os.environ.get('DRAIN_LOCAL_LIMIT'))
+    SHARED_LIMIT = parse_size(os.environ.get('DRAIN_SHARED_LIMIT'))
+    PROMOTE = os.environ.get('DRAIN_PROMOTE', '1') != '0'
+
+read_environ()
+
+
+def _makedirs(dirname):
+    try:
+        os.makedirs(dirname)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+def _read_version(dirname):
+    try:
+        with open(os.path.join(dirname, VERSION)) as f:
+            return f.read()
+    except IOError:
+        # missing, or dumped before versions
+        return ''
+
+
+def _size(dirname):
+    return sum(os.path.getsize(os.path.join(d, f))
+            for d, _, files in os.walk(dirname) for f in files)
+
+
+def _replace(tmp_dirname, dirname):
+    """
+    Rename tmp_dirname to dirname, replacing it
+    """
+    try:
+        os.rename(tmp_dirname, dirname)
+        return
+    except OSError as e:
+        # a non-empty directory can not be renamed over
+        if e.errno not in (errno.ENOTEMPTY, errno.EEXIST):
+            raise
+
+    old_dirname = tempfile.mkdtemp(prefix='.old-', dir=os.path.dirname(dirname))
+    old_dirname = os.path.join(old_dirname, 'dump')
+    os.rename(dirname, old_dirname)
+    os.rename(tmp_dirname, dirname)
+    shutil.rmtree(os.path.dirname(old_dirname))
+
+
+class Tier(object):
+    """
+    A directory of dumps at {root}/{Class}/{digest}/dump
+    """
+    def __init__(self, root, limit=None, shared=False):
+        """
+        Args:
+            root: the tier's directory
+            limit: size limit in bytes, None for no limit
+            shared: whether this is the OUTPUTDIR, whose dumps come with
+                targets and manifest entries
+        """
+        self.root = root
+        self.limit = limit
+        self.shared = shared
+
+    def dirname(self, step):
+        """
+        Returns the dump directory of step in this tier
+        """
+        return os.path.join(self.root, step.__class__.__name__,
+                step._digest[0:8], 'dump')
+
+    def version(self, step):
+        """
+        Returns the version of the step's dump in this tier, '' when it
+        is missing or has no version
+        """
+        return _read_version(self.dirname(step))
+
+    def exists(self, step):
+        return os.path.isdir(self.dirname(step))
+
+    def publish(self, step, write, version):
+        """
+        Write the step's dump atomically.
+        Args:
+            write: function writing the dump into the directory it is given
+            version: the dump's version
+        """
+        dirname = self.dirname(step)
+        parent = os.path.dirname(dirname)
+        _makedirs(parent)
+        tmp_dirname = tempfile.mkdtemp(prefix='.dump-', dir=parent)
+        try:
+            write(tmp_dirname)
+            with open(os.path.join(tmp_dirname, VERSION), 'w') as f:
+                f.write(version)
+            size = _size(tmp_dirname)
+            _replace(tmp_dirname, dirname)
+        except:
+            shutil.rmtree(tmp_dirname, ignore_errors=True)
+            raise
+
+        m = self._index()
+        if m is not None:
+            m.add_dumps([(dirname, size, time.time())])
+
+    def use(self, step):
+        """
+        Mark the step's dump as recently used
+        """
+        dirname = self.dirname(step)
+        try:
+            os.utime(dirname, None)
+        except OSError:
+            return
+        m = self._index()
+        if m is not None:
+            m.use_dump(dirname)
+
+    def _walk(self):
+        """
+        Returns (dirname, size, mtime) of every dump in the tier
+        """
+        dumps = []
+        for class_name in os.listdir(self.root):
+            class_dirname = os.path.join(self.root, class_name)
+            if not os.path.isdir(class_dirname):
+                continue
+            for digest in os.listdir(class_dirname):
+                dirname = os.path.join(class_dirname, digest, 'dump')
+                if os.path.isdir(dirname):
+                    dumps.append((dirname, _size(dirname), os.stat(dirname).st_mtime))
+        return dumps
+
+    def _index(self):
+        """
+        Returns the manifest of the tier's root, which records the sizes
+        of its dumps, or None when manifests are disabled. A tier without
+        recorded dumps, e.g. one written before they were recorded, is
+        walked to record them.
+        """
+        m = manifest.get(self.root)
+        if m is not None and not m.has_dumps():
+            m.add_dumps(self._walk())
+        return m
+
+    def evict(self, keep=None):
+        """
+        Remove the least recently used dumps until the tier fits its limit.
+        Args:
+            keep: a step whose dump is not evicted
+        """
+        if self.limit is None or not os.path.isdir(self.root):
+            return
+
+        keep = self.dirname(keep) if keep is not None else None
+        m = self._index()
+        if m is not None:
+            dumps = m.dumps()
+        else:
+            dumps = [(d, size) for d, size, mtime in
+                     sorted(self._walk(), key=lambda dump: dump[2])]
+
+        total = sum(size for _, size in dumps)
+        for dirname, size in dumps:
+            if total <= self.limit:
+                break
+            if dirname == keep:
+                continue
+            self._remove(dirname)
+            total -= size
+
+    def _remove(self, dirname):
+        m = manifest.get(self.root)
+        if self.shared:
+            # the target goes first, so that the step never looks complete
+            # without its dump
+            output_dirname = os.path.dirname(dirname)
+            target_filename = os.path.join(output_dirname, 'target')
+            if os.path.exists(target_filename):
+                os.remove(target_filename)
+            if m is not None:
+                m.invalidate(output_dirname)
+        shutil.rmtree(dirname, ignore_errors=True)
+        if m is not None:
+            m.remove_dump(dirname)
+
+
+def get_tiers(step):
+    """
+    Returns the local tier, None when there is none, and the shared tier
+    of a step
+    """
+    shared = Tier(os.path.dirname(os.path.dirname(step._output_dirname)),
+            SHARED_LIMIT, shared=True)
+    local = Tier(LOCALDIR, LOCAL_LIMIT) if LOCALDIR else None
+    return local, shared
+
+
+def dump(step, write):
+    """
+    Write a step's dump to the local tier, when there is one, and publish
+    it to the shared tier.
+    Args:
+        write: function writing the dump into the directory it is given
+    """
+    local, shared = get_tiers(step)
+    version = uuid.uuid4().hex
+    if local is None:
+        shared.publish(step, write, version)
+    else:
+        local.publish(step, write, version)
+        local_dirname = local.dirname(step)
+
+        def copy(dirname):
+            os.rmdir(dirname)
+            shutil.copytree(local_dirname, dirname)
+        shared.publish(step, copy, version)
+        local.evict(keep=step)
+
+    shared.evict(keep=step)
+
+
+def get_dirname(step):
+    """
+    Returns the directory to load a step's dump from: its current local
+    copy, promoting the shared dump if needed, or its shared dump
+    """
+    local, shared = get_tiers(step)
+    if local is not None:
+        version = shared.version(step)
+        if local.exists(step) and local.version(step) == version:
+            local.use(step)
+            return local.dirname(step)
+
+        if PROMOTE and shared.exists(step):
+            shared_dirname = shared.dirname(step)
+
+            def copy(dirname):
+                os.rmdir(dirname)
+                shutil.copytree(shared_dirname, dirname)
+            local.publish(step, copy, version)
+            local.evict(keep=step)
+            if shared.limit is not None:
+                shared.use(step)
+            return local.dirname(step)
+
+    if shared.limit is not None:
+        shared.use(step)
+    return shared.dirname(step)
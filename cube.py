@@ -0,0 +1,358 @@
+"""
+Space by day cubes of the additive statistics of events.
+
+A SpacetimeCube step reduces an event table once to a cube: for every
+combination of its spatial key columns and day with events, the number
+of events and the sum, count, sum of squares, minimum and maximum of
+each Column of its aggregates. Its result is a normal drain result, a
+dictionary of two DataFrames:
+
+    cube: the key columns, 'day', 'rows' and, for the Column numbered i
+        in the order of get_columns(), 'c{i}_sum', 'c{i}_count',
+        'c{i}_sumsq', 'c{i}_min' and 'c{i}_max', sorted by day
+    columns: for each Column, the dtype of its values, whether they are
+        all integers, the sum of their squares and the source digest of
+        the step class, see drain.source
+
+A SpacetimeAggregation whose input is a SpacetimeCube aggregates the
+cube instead of the events. Each window (date, delta) sums the cube's
+days before date, by any index made of the cube's keys, so different
+aggregations, dates, deltas and rollups share one pass over the events.
+The Columns of the aggregation's aggregates must be Columns of the
+cube's aggregates, e.g. by defining them once for both.
+
+A window's answer is exactly the one aggregating the events would give:
+    - its date and start date must fall on midnight, e.g. dates without
+      a time and deltas of days, weeks, months or years
+    - the reductions are 'count', 'sum', 'mean', 'min' and 'max', and
+      'sumsq' and sum_squares, of integer, boolean and floating point
+      Columns, except 'sumsq' of booleans
+    - the 'sum', 'mean' and 'sumsq' of a floating point Column require
+      its values to be integers, e.g. counts or missing values, with a
+      sum of squares below 2**53, for which float64 sums are exact
+    - the aggregation censors no columns
+A CubeAggregator raises a ValueError for any other window or reduction.
+Columns must be row-wise, i.e. the value of an event only depends on
+that event.
+
+The cube is refreshed incrementally when a target cube is run again,
+e.g. when new days of events arrive: the days before the last day of
+its previous result are kept, and only the events of that day and after
+are reduced. Events of the kept days must not have changed; pass
+incremental=False otherwise. The previous result is kept as hard links
+to the dump's files in {output dirname}/previous/.
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from drain import cache, source
+from drain.step import Step
+from drain.aggregate import Aggregator, GroupReducer, group_keys, sum_squares, \
+        _nan_empty_sum
+
+# the statistics of each Column in a cube
+STATISTICS = ('sum', 'count', 'sumsq', 'min', 'max')
+
+# the largest integer below which float64 sums of integers are exact
+_EXACT = 2**53
+
+
+class SpacetimeCube(Step):
+    """
+    Reduces events to a cube of additive statistics by spatial keys and
+    day, see above. Subclasses define get_aggregates().
+    """
+    def __init__(self, inputs, keys, date_column, incremental=True, **kwargs):
+        """
+        Args:
+            inputs: a step whose result is the event table
+            keys: the spatial key columns, by any subset of which the cube
+                is aggregated
+            date_column: the date of each event
+            incremental: whether to reduce only the new days when run
+                again, see above
+        """
+        Step.__init__(self, inputs=inputs, keys=keys, date_column=date_column,
+                incremental=incremental, **kwargs)
+
+    def get_aggregates(self):
+        """
+        Returns the column functions whose Columns the cube holds
+        """
+        raise NotImplementedError
+
+    def get_columns(self):
+        """
+        Returns the unique Columns of get_aggregates(), in order
+        """
+        columns = []
+        for cf in self.get_aggregates():
+            for cr in cf.column_reductions:
+                if cr.column not in columns:
+                    columns.append(cr.column)
+        return columns
+
+    def run(self, events):
+        columns = self.get_columns()
+        digest = source.digest(self.__class__)
+
+        previous = self._load_previous() if self.incremental else None
+        if previous is not None and (len(previous['cube']) == 0 or
+                (previous['columns'].source != digest).any()):
+            # the Columns may have changed
+            previous = None
+
+        if previous is not None:
+            # the last day may have had more events since
+            start = previous['cube'].day.max()
+            cube, stats = reduce_cube(events[events[self.date_column] >= start],
+                    self.keys, self.date_column, columns)
+            previous_stats = previous['columns']
+            if (stats.dtype.values == previous_stats.dtype.values).all():
+                previous_cube = previous['cube']
+                cube = pd.concat([previous_cube[previous_cube.day < start], cube],
+                        ignore_index=True)
+                stats['integral'] &= previous_stats.integral.values
+            else:
+                # e.g. missing values in an integer Column
+                previous = None
+
+        if previous is None:
+            cube, stats = reduce_cube(events, self.keys, self.date_column, columns)
+
+        stats['sumsq'] = [cube['c%s_sumsq' % i].sum() if 'c%s_sumsq' % i in cube else np.inf
+                          for i in range(len(columns))]
+        stats['source'] = digest
+        return {'cube': cube, 'columns': stats}
+
+    @property
+    def _previous_dirname(self):
+        return os.path.join(self._output_dirname, 'previous')
+
+    def _load_previous(self):
+        from drain import store
+        dirname = self._previous_dirname
+        if not os.path.isdir(dirname):
+            return None
+        result = store.load(dirname)
+        return {'cube': result['cube'], 'columns': result['columns']}
+
+    def dump(self):
+        Step.dump(self)
+        if self.incremental:
+            # keep the result for the next run, which first removes the dump
+            cache._makedirs(self._output_dirname)
+            tmp_dirname = tempfile.mkdtemp(prefix='.previous-', dir=self._output_dirname)
+            try:
+                _link_tree(self._dump_dirname, tmp_dirname)
+                cache._replace(tmp_dirname, self._previous_dirname)
+            except:
+                shutil.rmtree(tmp_dirname, ignore_errors=True)
+                raise
+
+    def get_aggregator(self, date, delta, column_functions):
+        """
+        Returns a CubeAggregator of the days of the window before date,
+        see drain.data.date_select()
+        """
+        from drain import data
+
+        result = self.get_result()
+        cube = result['cube']
+        end = _midnight(date)
+        delta = data.parse_delta(delta)
+        start = None if delta is None else _midnight(date - delta)
+
+        days = cube.day.values
+        rows = slice(0 if start is None else
+                         np.searchsorted(days, start.to_datetime64()),
+                     np.searchsorted(days, end.to_datetime64()))
+
+        stats = result['columns']
+        columns = {}
+        for i, column in enumerate(self.get_columns()):
+            dtype = np.dtype(stats.dtype.iloc[i])
+            exact = dtype.kind in 'biu' or \
+                    (stats.integral.iloc[i] and stats.sumsq.iloc[i] < _EXACT)
+            columns[column] = (i, dtype, exact)
+        return CubeAggregator(cube, rows, column_functions, self.keys, columns)
+
+
+def _midnight(date):
+    t = pd.Timestamp(date)
+    if t != t.normalize():
+        raise ValueError('Cube windows must start and end at midnight: %s' % t)
+    return t
+
+
+def _link_tree(src, dst):
+    """
+    Hard link the files of the directory src into the directory dst,
+    copying them where hard links are not supported
+    """
+    for dirname, _, filenames in os.walk(src):
+        dst_dirname = os.path.join(dst, os.path.relpath(dirname, src))
+        cache._makedirs(dst_dirname)
+        for filename in filenames:
+            try:
+                os.link(os.path.join(dirname, filename),
+                        os.path.join(dst_dirname, filename))
+            except OSError:
+                shutil.copy2(os.path.join(dirname, filename), dst_dirname)
+
+
+def reduce_cube(events, keys, date_column, columns):
+    """
+    Reduces events to a cube, see above.
+
+    Returns:
+        (pd.DataFrame, pd.DataFrame): the cube and the dtype of each
+            Column and whether its values are all integers
+    """
+    events = events[events[date_column].notnull()]
+    days = events[date_column].values.astype('M8[D]')
+
+    # group by day, then by keys, keeping missing keys as a group, so
+    # that rolling up to fewer keys counts them as aggregating would
+    day_codes, unique_days = pd.factorize(days, sort=True)
+    codes = day_codes.astype(np.int64)
+    for key in keys:
+        key_codes, uniques = pd.factorize(events[key], sort=True)
+        codes = pd.factorize(codes * (len(uniques) + 1) + key_codes + 1, sort=True)[0]
+
+    n_groups = codes.max() + 1 if len(codes) else 0
+    first = np.empty(n_groups, dtype=np.int64)
+    first[codes[::-1]] = np.arange(len(codes))[::-1]
+
+    reducer = GroupReducer(codes, pd.Index(np.arange(n_groups)))
+    cube = pd.DataFrame({'day': days[first].astype('M8[ns]')})
+    for key in keys:
+        cube[key] = events[key].values[first]
+    cube['rows'] = reducer.sizes
+
+    dtypes, integral = [], []
+    for i, column in enumerate(columns):
+        values = np.asarray(column.apply(events))
+        dtypes.append(str(values.dtype))
+        if values.dtype.kind == 'b':
+            # summed as integers, as pandas sums booleans
+            values = values.astype(np.int64)
+        elif values.dtype.kind not in 'fiu':
+            # not summable, the cube can not answer its reductions
+            integral.append(False)
+            continue
+
+        if values.dtype.kind == 'f':
+            finite = values[~np.isnan(values)]
+            integral.append(bool((finite == np.floor(finite)).all()))
+            # sums of the day's values in float64, as aggregating would
+            values = values.astype(np.float64)
+        else:
+            integral.append(True)
+
+        results = reducer.reduce(pd.Series(values), list(STATISTICS))
+        for name, r in zip(STATISTICS, results):
+            r = r.values
+            if name in ('sum', 'sumsq') and r.dtype.kind == 'f':
+                # a day without values adds nothing
+                r = np.where(np.isnan(r), 0, r)
+            cube['c%s_%s' % (i, name)] = r
+
+    stats = pd.DataFrame({'dtype': dtypes, 'integral': integral},
+            columns=['dtype', 'integral'])
+    return cube, stats
+
+
+class CubeAggregator(Aggregator):
+    """
+    Aggregates a slice of the days of a cube as Aggregator would aggregate
+    their events, see above
+    """
+    def __init__(self, cube, rows, column_functions, keys, columns):
+        """
+        Args:
+            cube (pd.DataFrame): the cube
+            rows (slice): the cube's rows to aggregate
+            column_functions (list[ColumnFunction])
+            keys (list): the cube's key columns
+            columns (dict): the number, dtype of the values and exactness
+                of the sums of each Column of the cube, by Column
+        """
+        self.df = cube
+        self.rows = rows
+        self.column_functions = column_functions
+        self.keys = keys
+        self.cube_columns = columns
+
+        self.column_reductions = set([cr for cf in column_functions for cr in cf.column_reductions])
+        self.columns = set([c.column for c in self.column_reductions])
+
+        for cr in self.column_reductions:
+            self._reduction(cr)
+
+    def _reduction(self, column_reduction):
+        """
+        Returns the name of the reduction, the Column's number and the
+        dtype of its values, raising a ValueError when the cube can not
+        answer the reduction exactly
+        """
+        column = column_reduction.column
+        if column not in self.cube_columns:
+            raise ValueError('Column %r is not in the cube' % column.definition)
+        i, dtype, exact = self.cube_columns[column]
+        dtype = np.dtype(dtype)
+
+        name = column_reduction.agg_func
+        if name is sum_squares:
+            name = 'sumsq'
+        if dtype.kind not in 'biuf' or \
+                name not in ('sum', 'count', 'mean', 'sumsq', 'min', 'max') or \
+                (dtype.kind == 'b' and name == 'sumsq'):
+            raise ValueError('The cube can not reduce %r by %r' %
+                    (column.definition, column_reduction.agg_func))
+        if name in ('sum', 'mean', 'sumsq') and not exact:
+            raise ValueError('The cube can not sum %r exactly' % column.definition)
+        return name, i, dtype
+
+    def reduce(self, index):
+        index_columns = [index] if isinstance(index, basestring) else list(index)
+        if not set(index_columns).issubset(self.keys):
+            raise ValueError('Index %s is not made of the cube keys %s' % (index, self.keys))
+
+        codes, groups = group_keys.factorize(self.df, index)
+        reducer = GroupReducer(codes[self.rows], groups)
+
+        # the sums of the window's days, by statistic
+        sums = {}
+        def stat(i, name, agg_func='sum'):
+            key = (i, name)
+            if key not in sums:
+                sums[key] = reducer.reduce(self.df['c%s_%s' % (i, name)].iloc[self.rows],
+                        [agg_func])[0].values
+            return sums[key]
+
+        reduced = {}
+        for cr in self.column_reductions:
+            name, i, dtype = self._reduction(cr)
+            count = stat(i, 'count')
+            if name == 'count':
+                r = count
+            elif name in ('min', 'max'):
+                r = stat(i, name, name).astype(dtype)
+            elif dtype.kind in 'biu':
+                r = stat(i, 'sum') / count.astype(np.float64) if name == 'mean' \
+                        else stat(i, name)
+            else:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    r = stat(i, 'sum') / count if name == 'mean' else stat(i, name)
+                if name != 'mean' and _nan_empty_sum():
+                    r = np.where(count == 0, np.nan, r)
+                r = r.astype(dtype)
+            reduced[cr] = r
+
+        self.reduced_df = pd.DataFrame(reduced, index=reducer.groups)
+        return self.reduced_df
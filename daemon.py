@@ -0,0 +1,318 @@
+"""
+Warm worker daemon for bin/run_step.py.
+
+Every run_step.py process spends seconds importing pandas, sklearn, tables
+and the like before running its step. A daemon imports them once and then
+listens on a Unix socket. For each connection it forks a worker, which
+inherits the imported modules, runs the requested step with
+drain.drake.run_step() and streams its output and exit code back. Forking
+per request keeps steps isolated from each other and from the daemon.
+
+run_step.py becomes a thin client when the DRAIN_DAEMON environment
+variable holds the path of the socket. It only imports this module, which
+uses nothing but the standard library, and falls back to running the step
+itself when the daemon cannot be reached.
+
+Modules preloaded by the daemon are not reloaded. When the source file of
+a loaded module outside of the Python installation, e.g. one defining
+steps, has changed since the daemon started, its workers refuse requests
+with a RETRY frame and the client runs the step itself, so that steps
+never run with stale code. Restart the daemon to serve them again.
+
+A worker takes the client's working directory and environment, and the
+drain modules that read settings from the environment at import, e.g.
+DRAIN_STORE or DRAIN_LOCALDIR, read them again with their read_environ().
+
+Start a daemon with:
+    python bin/drain_daemon.py --socket /tmp/drain.sock --preload mymodule
+    export DRAIN_DAEMON=/tmp/drain.sock
+
+Protocol: each message is a frame of a one byte type, a 4-byte big-endian
+length and a payload. The client sends a REQUEST frame holding a JSON
+object with the arguments, working directory and environment. The worker
+replies with STDOUT and STDERR frames followed by an EXIT frame holding
+the exit code, or with a RETRY frame when the client should run the step
+itself.
+"""
+import errno
+import importlib
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import sys
+import traceback
+
+ENVIRON = 'DRAIN_DAEMON'
+
+REQUEST = b'q'
+STDOUT = b'1'
+STDERR = b'2'
+EXIT = b'x'
+RETRY = b'r'
+
+# modules imported by the daemon before it forks workers
+PRELOAD = ('drain.step', 'drain.yaml', 'drain.drake', 'drain.store',
+           'drain.data', 'drain.model', 'drain.metrics')
+
+_HEADER = struct.Struct('>cI')
+
+# (source file, modification time) of the modules loaded by serve(), by name
+_sources = {}
+
+
+def send_frame(sock, kind, payload):
+    if not isinstance(payload, bytes):
+        payload = payload.encode('utf-8')
+    sock.sendall(_HEADER.pack(kind, len(payload)) + payload)
+
+
+def _recv_exactly(sock, n):
+    chunks = []
+    while n > 0:
+        chunk = sock.recv(n)
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        n -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    """
+    Returns (kind, payload) or None when the connection was closed
+    """
+    header = _recv_exactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    kind, length = _HEADER.unpack(header)
+    payload = _recv_exactly(sock, length)
+    if payload is None:
+        return None
+    return kind, payload
+
+
+class _FrameWriter(object):
+    """
+    File-like object sending what is written to it as frames of one kind
+    """
+    def __init__(self, sock, kind):
+        self.sock = sock
+        self.kind = kind
+
+    def write(self, data):
+        if data:
+            send_frame(self.sock, self.kind, data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+def submit(path, args, stdout=None, stderr=None):
+    """
+    Run `run_step.py args` on the daemon listening at path, copying its
+    output to stdout and stderr (defaulting to sys.stdout and sys.stderr).
+    Returns:
+        the exit code, or None when the daemon cannot be reached or asks
+        the client to run the step itself
+    """
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+
+    try:
+        send_frame(sock, REQUEST, json.dumps({
+            'args': list(args),
+            'cwd': os.getcwd(),
+            'env': dict(os.environ),
+        }))
+
+        while True:
+            frame = recv_frame(sock)
+            if frame is None:
+                stderr.write('drain daemon closed the connection\n')
+                return 1
+            kind, payload = frame
+            if kind == EXIT:
+                return int(payload)
+            elif kind == RETRY:
+                stderr.write(payload.decode('utf-8'))
+                return None
+            stream = stdout if kind == STDOUT else stderr
+            stream.write(payload.decode('utf-8'))
+            stream.flush()
+    finally:
+        sock.close()
+
+
+def _mtime(filename):
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+
+def _source_files():
+    """
+    Returns the source files and their modification times of the loaded
+    modules outside of the Python installation, by module name
+    """
+    prefixes = tuple(set(os.path.abspath(p) for p in (sys.prefix, sys.exec_prefix)))
+    sources = {}
+    for name, module in list(sys.modules.items()):
+        filename = getattr(module, '__file__', None)
+        if not filename:
+            continue
+        filename = os.path.abspath(filename)
+        if filename.endswith(('.pyc', '.pyo')) and os.path.exists(filename[:-1]):
+            filename = filename[:-1]
+        if not filename.startswith(prefixes):
+            sources[name] = (filename, _mtime(filename))
+    return sources
+
+
+def _changed_modules():
+    """
+    Returns the names of the modules loaded by serve() whose source files
+    have changed since
+    """
+    return sorted(name for name, (filename, mtime) in _sources.items()
+            if _mtime(filename) != mtime)
+
+
+def _handle(conn):
+    """
+    Run a request in a forked worker. Returns the exit code, or None when
+    the client should run the step itself.
+    """
+    frame = recv_frame(conn)
+    if frame is None or frame[0] != REQUEST:
+        return 1
+    request = json.loads(frame[1].decode('utf-8'))
+
+    changed = _changed_modules()
+    if changed:
+        # the step may be defined by a changed module, which the fork inherited
+        send_frame(conn, RETRY, 'drain daemon modules changed since it started '
+                '(%s), restart it\n' % ', '.join(changed))
+        return None
+
+    os.chdir(request['cwd'])
+    os.environ.clear()
+    os.environ.update(request['env'])
+    # preloaded modules read their settings at import, read the client's
+    for name, module in list(sys.modules.items()):
+        if name.startswith('drain.') and hasattr(module, 'read_environ'):
+            module.read_environ()
+
+    sys.stdout = _FrameWriter(conn, STDOUT)
+    sys.stderr = _FrameWriter(conn, STDERR)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler):
+            handler.stream = sys.stderr
+
+    from drain import drake
+    try:
+        drake.run_step(request['args'])
+        return 0
+    except SystemExit as e:
+        # as the interpreter exits, e.g. 0 for sys.exit()
+        if e.code is None:
+            return 0
+        elif isinstance(e.code, int):
+            return e.code
+        sys.stderr.write('%s\n' % e.code)
+        return 1
+    except Exception:
+        sys.stderr.write(traceback.format_exc())
+        return 1
+
+
+def _reap():
+    """
+    Collect exited workers
+    """
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except OSError as e:
+            if e.errno == errno.ECHILD:
+                return
+            raise
+        if pid == 0:
+            return
+
+
+def serve(path, preload=()):
+    """
+    Import the PRELOAD modules and those in preload, then serve requests
+    on a Unix socket at path until interrupted.
+    """
+    for module in PRELOAD + tuple(preload):
+        importlib.import_module(module)
+    _sources.clear()
+    _sources.update(_source_files())
+
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            raise ValueError('A daemon is already listening on %s' % path)
+        except socket.error:
+            # stale socket left by a daemon that died
+            os.remove(path)
+        finally:
+            probe.close()
+
+    # exit through the finally clause below, removing the socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(path)
+    listener.listen(128)
+    listener.settimeout(1.0)
+    logging.info('Listening on %s' % path)
+
+    try:
+        while True:
+            _reap()
+            try:
+                conn, _ = listener.accept()
+            except socket.timeout:
+                continue
+            conn.settimeout(None)
+
+            pid = os.fork()
+            if pid == 0:
+                code = 1
+                try:
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    listener.close()
+                    code = _handle(conn)
+                finally:
+                    try:
+                        if code is not None:
+                            send_frame(conn, EXIT, str(code))
+                        conn.close()
+                    finally:
+                        os._exit(code or 0)
+            conn.close()
+    finally:
+        listener.close()
+        if os.path.exists(path):
+            os.remove(path)
@@ -2,12 +2,13 @@ import random
 import datetime
 import re
 import os
-from drain import util
+import shutil
+import tempfile
+from drain import cache, util, stream
 import logging
 
 from copy import deepcopy
 import pandas as pd
-from scipy import stats
 
 import numpy as np
 from numpy import random
@@ -16,13 +17,11 @@ from dateutil.relativedelta import relativedelta
 import collections
 from itertools import product
 
-from sklearn import preprocessing, datasets
-from sklearn.utils.validation import _assert_all_finite
-
 from drain.step import Step
 
 class ClassificationData(Step):
     def run(self):
+        from sklearn import datasets
         X,y = datasets.make_classification(**self.get_arguments())
         X,y = pd.DataFrame(X), pd.Series(y)
 
@@ -39,7 +38,9 @@ class CreateEngine(Step):
 class FromSQL(Step):
     def __init__(self, query=None, to_str=None, table=None, tables=None, **kwargs):
         """
-        Use tables to automatically set dependecies
+        Use tables to automatically set dependecies.
+        Passing chunksize streams the result in chunks of that many rows,
+        see drain.stream
         """
         if query is None:
             if table is None:
@@ -59,11 +60,18 @@ class FromSQL(Step):
 
         if 'inputs' not in kwargs:
             self.inputs = [CreateEngine()]
+
+        self.streaming = kwargs.get('chunksize') is not None
  
     def run(self, engine):
         kwargs = self.get_arguments(query=False, to_str=False, table=False, tables=False, inputs=False)
 
-        df = pd.read_sql(self.query, engine, **kwargs)
+        if self.streaming:
+            return (self._convert(df) for df in pd.read_sql(self.query, engine, **kwargs))
+        else:
+            return self._convert(pd.read_sql(self.query, engine, **kwargs))
+
+    def _convert(self, df):
         for column in self.to_str:
             if column in df.columns:
                 df[column] = df[column].astype(str)
@@ -94,31 +102,56 @@ class Merge(Step):
 # write DataFrames to an HDF store
 # pass put_arguments (format, mode, data_columns, etc.) to init
 # pass DataFrames by name via inputs
+# streamed inputs are appended chunk by chunk, so their put_args
+# should allow appending, e.g. set min_itemsize for string columns
 class ToHDF(Step):
+    streaming = True
+    # the result is an open pd.HDFStore, which can not be hashed
+    hash_result = False
+
     def __init__(self, target=True, objects_to_ascii=False, **kwargs):
         Step.__init__(self, target=True, objects_to_ascii=objects_to_ascii, **kwargs)
 
     def run(self, **kwargs):
-        store = pd.HDFStore(os.path.join(self._dump_dirname, 'result.h5'))
+        # written next to the dump directory, published by dump()
+        dirname = tempfile.mkdtemp(prefix='.hdf-', dir=self._output_dirname)
+        store = pd.HDFStore(os.path.join(dirname, 'result.h5'))
 
         for key, df in kwargs.iteritems():
-            if self.objects_to_ascii:
-                for c,dtype in df.dtypes.iteritems():
-                    if dtype == object:
-                        df[c] = df[c].str.encode("ascii", "ignore")
-
-            logging.info('Writing %s %s' % (key, str(df.shape)))
             args = self.get_arguments().get('put_args', {}).get(key, {})
-
-            store.put(key, df, mode='w', **deepcopy(args))
+            if isinstance(df, stream.Chunks):
+                if key in store:
+                    store.remove(key)
+                for chunk in df:
+                    logging.info('Appending %s %s' % (key, str(chunk.shape)))
+                    store.append(key, self._to_ascii(chunk), **deepcopy(args))
+            else:
+                logging.info('Writing %s %s' % (key, str(df.shape)))
+                store.put(key, self._to_ascii(df), mode='w', **deepcopy(args))
 
         return store
 
+    def _to_ascii(self, df):
+        if self.objects_to_ascii:
+            for c,dtype in df.dtypes.iteritems():
+                if dtype == object:
+                    df[c] = df[c].str.encode("ascii", "ignore")
+        return df
+
     def dump(self):
-        return
+        self.setup_dump()
+        store = self.get_result()
+        filename = store.filename
+        store.close()
+
+        def write(dirname):
+            shutil.move(filename, os.path.join(dirname, 'result.h5'))
+        cache.dump(self, write)
+        shutil.rmtree(os.path.dirname(filename), ignore_errors=True)
+        self.load()
 
     def load(self):
-        self.set_result(pd.HDFStore(os.path.join(self._dump_dirname, 'result.h5')))
+        self.set_result(pd.HDFStore(os.path.join(cache.get_dirname(self), 'result.h5')))
 
 class Shape(Step):
     def run(self, X, index=None, **kwargs):
@@ -137,6 +170,7 @@ class HoldOut(Step):
         return {'index': new_index, 'holdout': holdout}
 
 def percentile(series):
+    from scipy import stats
     return pd.Series(stats.rankdata(series)/len(series), index=series.index)
 
 def prefix_columns(df, prefix, ignore=[]):
@@ -328,6 +362,7 @@ def null_columns(df, train=None):
     return nulcols[nulcols].index
 
 def infinite_columns(df):
+    from sklearn.utils.validation import _assert_all_finite
     columns = []
     for c in df.columns:
         try:
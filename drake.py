@@ -1,60 +1,112 @@
-import itertools
 import os
 import inspect
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
+from drain import source
 from drain.util import StringIO
+from drain.graph import StepGraph
 
-# returns set of target steps
-# used below by get_input_targets and get_output_targets
-def get_targets(step, ignore):
-    outputs = set()
-    if not ignore and step.is_target():
-        outputs.add(step)
-    else:
-        for i in step.inputs:
-            outputs.update(get_targets(i, False))
-
-    return outputs
+# source files of step classes outside of the drain library, by class
+_sources = {}
 
 # traverse input tree for closest parent targets
 def get_input_targets(step):
-    return get_targets(step, ignore=True)
+    graph = StepGraph([step])
+    return set(graph.steps[n] for n in graph.input_targets(graph.roots[0]))
 
 # returns a dictionary of outputs mapped to inputs
 # note that an output is either a target
 # or a leaf node in the step tree
 def get_drake_data(steps):
-    output_inputs = {}
-    if len(steps) == 0:
-        return output_inputs
+    return StepGraph(steps).drake_data()
 
-    for step in steps:
-        output_inputs[step] = get_input_targets(step)
+# returns the source file of a step class, None when it is in the drain library
+# or has no source file, e.g. when defined in a REPL, a notebook or python -c
+def get_source_file(cls):
+    if cls not in _sources:
+        try:
+            filename = inspect.getsourcefile(cls)
+        except TypeError:
+            filename = None
+        if filename is not None:
+            filename = os.path.abspath(filename)
+            if filename.startswith(os.path.dirname(__file__)) or \
+                    not os.path.isfile(filename):
+                filename = None
+        _sources[cls] = filename
+    return _sources[cls]
 
-    # recursively do the same for all the inputs
-    inputs = set(itertools.chain(*output_inputs.values()))
-    o = get_drake_data(inputs)
-    output_inputs.update(o)
+# returns the files other than input targets that the output depends on:
+# its step.yaml, its dependencies and its source digest file
+def get_file_dependencies(output):
+    i = [output._yaml_filename]
+    i.extend(output.dependencies)
+    # add the digest of its class's code if it's not in the drain library,
+    # see drain.source
+    # TODO: do this for all non-target inputs, too
+    source_filename = source.get_filename(output)
+    if source_filename is not None:
+        i.append(source_filename)
 
-    return output_inputs
+    return i
+
+def setup_dumps(outputs, n_jobs=1):
+    """
+    Call setup_dump() on each output, n_jobs at a time on a thread pool,
+    -1 for one per cpu. Creating directories and reading and writing
+    step.yaml files is mostly waiting on the file system.
+    """
+    outputs = list(outputs)
+    n_jobs = n_jobs if n_jobs > 0 else multiprocessing.cpu_count()
+    if n_jobs == 1 or len(outputs) < 2:
+        for output in outputs:
+            output.setup_dump()
+        return
+
+    pool = ThreadPool(min(n_jobs, len(outputs)))
+    try:
+        # raises the first exception of a setup_dump()
+        pool.map(lambda output: output.setup_dump(), outputs)
+    finally:
+        pool.close()
+        pool.join()
+
+def _mtime(filename):
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+# whether drake would rerun the output given its input targets:
+# its target is missing or older than one of its files or input targets
+def is_outdated(output, inputs):
+    mtime = _mtime(output._target_filename)
+    if mtime is None:
+        return True
+
+    filenames = get_file_dependencies(output)
+    filenames.extend(i._target_filename for i in inputs)
+    for filename in filenames:
+        m = _mtime(filename)
+        # drake fails on missing inputs, we rebuild
+        if m is None or m > mtime:
+            return True
+    return False
 
 # returns a drake step string for the given inputs and outputs
 def to_drake_step(inputs, output):
-    i = [output._yaml_filename]
+    dependencies = get_file_dependencies(output)
+    i = dependencies[:1]
     i.extend(map(lambda i: i._target_filename, list(inputs)))
-    i.extend(output.dependencies)
-    # add source file if it's not in the drain library
-    # TODO: do this for all non-target inputs, too
-    source = os.path.abspath(inspect.getsourcefile(output.__class__))
-    if not source.startswith(os.path.dirname(__file__)):
-        i.append(source)
+    i.extend(dependencies[1:])
 
     output_str = '%' + output.__class__.__name__
     if output.is_target():
         output_str += ', ' + os.path.join(output._target_filename)
     return '{output} <- {inputs} [method:drain]\n\n'.format(output=output_str, inputs=str.join(', ', i))
 
-def to_drakefile(steps, preview=True, debug=False, input_drakefile=None):
+def to_drakefile(steps, preview=True, debug=False, input_drakefile=None, n_jobs=1):
     """
     Args:
         steps: collection of drain.step.Step objects to generate drakefile for
@@ -62,10 +114,15 @@ def to_drakefile(steps, preview=True, debug=False, input_drakefile=None):
             When True do not touch filesystem.
         debug: run python with '-m pdb'
         drakefile: path to drakefile to include
+        n_jobs: number of threads setting up output directories when
+            preview is False, -1 for one per cpu
     Returns:
         a string representation of the drakefile
     """
     data = get_drake_data(steps)
+    if not preview:
+        setup_dumps(data, n_jobs)
+
     drakefile = StringIO.StringIO()
 
     if input_drakefile:
@@ -74,9 +131,59 @@ def to_drakefile(steps, preview=True, debug=False, input_drakefile=None):
     bindir = os.path.join(os.path.dirname(__file__), 'bin')
     drakefile.write("drain()\n\tpython %s %s/run_step.py $OUTPUT $INPUTS 2>&1\n\n" % ('-m pdb' if debug else '', bindir))
     for output, inputs in data.iteritems():
-        if not preview:
-            output.setup_dump()
-
         drakefile.write(to_drake_step(inputs, output))
 
     return drakefile.getvalue()
+
+def run_step(args):
+    """
+    Load and run a step as called from a Drakefile: `run_step.py $OUTPUT $INPUTS`
+    where $OUTPUT is the output's target file (when it is a target) followed
+    by its step.yaml, and $INPUTS are the step.yaml and target files it
+    depends on. Used by bin/run_step.py and drain.daemon.
+    """
+    from os.path import dirname
+    import logging
+    import drain.step
+    import drain.yaml
+    from drain import manifest
+
+    def is_target(filename):
+        return filename.endswith('/target')
+
+    def is_step(filename):
+        return filename.endswith('/step.yaml')
+
+    # given the filename of a step or a target, load it
+    def get_step(filename):
+        yaml_filename = os.path.join(dirname(filename), 'step.yaml')
+        return drain.yaml.load(yaml_filename)
+
+    if len(args) == 0:
+        raise ValueError('Need at least one argument')
+
+    drain.step.OUTPUTDIR = dirname(dirname(dirname(args[0])))
+    drain.yaml.configure()
+
+    if is_target(args[0]):
+        output = get_step(args[0])
+        args = args[1:]
+
+        # an input was re-run but reproduced its result, see drain.manifest
+        m = manifest.get(drain.step.OUTPUTDIR)
+        if m is not None and m.cutoff(output, get_input_targets(output)):
+            logging.info('Up to date: %s' % output._target_filename)
+            return
+    else:
+        output = None
+
+    if not is_step(args[0]):
+        raise ValueError('Need a step to run')
+
+    step = get_step(args[0])
+    inputs = []
+    for i in args[1:]:
+        if is_step(i) or is_target(i):
+            inputs.append(get_step(i))
+
+    step.execute(output=output, inputs=inputs)
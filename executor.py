@@ -0,0 +1,398 @@
+"""
+In-process execution of a DAG of steps.
+
+Step.execute() hands its step to an Executor, which indexes the input tree
+in a drain.graph.StepGraph (walked iteratively, so deep chains do not hit
+the recursion limit), orders the steps by their dependencies and then loads
+or runs each of them once all of its inputs have results. With n_jobs > 1 independent steps are run
+concurrently on a thread or process pool, so a DAG finishes in
+critical-path time rather than in the sum of its steps' times.
+
+The executor counts the remaining consumers of every result. With
+release=True a result is dropped as soon as its last consumer has run,
+and with a memory_limit results that are still needed are spilled to a
+temporary directory, and reloaded (memory-mapped when possible) just
+before a consumer runs, whenever the results held in memory exceed it.
+
+Equal steps, i.e. separate objects with the same digest, are loaded or run
+once and share the result, see also drain.step.intern_steps().
+
+Every load or run is measured and recorded in the executor's report,
+see drain.report.
+"""
+import copy
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import traceback
+import types
+from multiprocessing.pool import Pool, ThreadPool
+
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+
+from drain import util, report, stream
+from drain.graph import StepGraph
+
+BACKENDS = ('thread', 'process')
+
+# seconds between checks of running tasks for failures that skip their callback
+POLL = 1
+
+
+def _load(step):
+    logging.info('Loading\n\t%s' % str(step).replace('\n', '\n\t'))
+    step.load()
+    return step.get_result()
+
+
+def _run(step):
+    args, kwargs = step.map_inputs()
+    logging.info('Running\n\t%s' % str(step).replace('\n', '\n\t'))
+    result = step.run(*args, **kwargs)
+    if step.streaming and isinstance(result, types.GeneratorType):
+        result = stream.Chunks(result)
+    return result
+
+
+def _call(function, step):
+    """
+    Calls function(step) in a worker and returns (result, error, stats) so
+    that exceptions, along with their traceback, make it back to the
+    scheduler, and the measurement is taken in the worker that ran it.
+    """
+    try:
+        with report.Measure() as measure:
+            result = function(step)
+        return result, None, measure.stats
+    except Exception:
+        return None, traceback.format_exc(), None
+
+
+def _next_done(done, pending, error):
+    """
+    Returns the next (key, value) that the callback of a task in pending, a
+    dictionary of apply_async() results by key, puts on the queue done, and
+    removes the task from pending. A task whose arguments or result fail to
+    pickle, e.g. with the process backend, never calls its callback, so the
+    pending tasks are checked every POLL seconds and (key, error(traceback))
+    is returned for a failed one.
+    """
+    while True:
+        try:
+            key, value = done.get(timeout=POLL)
+        except Empty:
+            failed = [k for k, r in pending.items() if r.ready() and not r.successful()]
+            if not failed:
+                continue
+            key = failed[0]
+            try:
+                pending[key].get()
+            except Exception:
+                value = error(traceback.format_exc())
+        del pending[key]
+        return key, value
+
+
+def _detach(step):
+    """
+    Returns a shallow copy of step suitable for pickling to a worker process.
+    Its inputs are replaced by shallow copies that hold their results but
+    none of their own inputs, so that only the results the step
+    actually consumes get pickled.
+    """
+    # compute the digest while the full input tree is still attached
+    step._digest
+
+    inputs = []
+    for i in step.inputs:
+        i = copy.copy(i)
+        i.inputs = []
+        i._kwargs = dict(i._kwargs, inputs=[])
+        inputs.append(i)
+
+    detached = copy.copy(step)
+    detached.inputs = inputs
+    if 'inputs' in detached._kwargs:
+        detached._kwargs = dict(detached._kwargs, inputs=inputs)
+
+    return detached
+
+
+class Executor(object):
+    """
+    Runs or loads a collection of steps and all of their inputs.
+    """
+
+    def __init__(self, inputs=None, load_targets=False, n_jobs=1, backend='thread',
+            release=False, memory_limit=None, spill_dir=None):
+        """
+        Args:
+            inputs: collection of steps that should be loaded rather than run
+            load_targets (boolean): load all steps which are targets
+            n_jobs (int): number of steps to load or run concurrently.
+                1 runs steps serially in the calling thread and
+                -1 uses one worker per cpu.
+            backend (str): 'thread' or 'process'. Threads share results
+                without copying but only help steps that release the GIL
+                (e.g. numpy, pandas and I/O). Processes pickle each step,
+                together with its inputs' results, to the worker and its
+                result back.
+            release (boolean): drop the result of every step other than the
+                ones passed to execute() once all of its consumers have run.
+            memory_limit (int): number of bytes of results to hold in memory,
+                as estimated by drain.util.nbytes. When exceeded, the largest
+                results that are still needed are spilled to disk.
+                Implies release.
+            spill_dir (str): directory in which to create the temporary
+                spill directory, defaults to the system's temporary directory.
+        """
+        if backend not in BACKENDS:
+            raise ValueError('Invalid backend: %s' % backend)
+
+        self.inputs = inputs if inputs is not None else []
+        self.load_targets = load_targets
+        self.n_jobs = n_jobs if n_jobs > 0 else multiprocessing.cpu_count()
+        self.backend = backend
+        self.release = release or memory_limit is not None
+        self.memory_limit = memory_limit
+        self.spill_dir = spill_dir
+
+    def execute(self, steps):
+        """
+        Load or run the given steps and their inputs in dependency order.
+        Sets:
+            self.report: list of drain.report entries, one per step
+                loaded or run, in order of completion
+        Returns:
+            the list of the steps' results
+        """
+        self.report = []
+        self._plan(steps)
+        self._roots = set(self._graph.roots)
+        # results held in memory: node: bytes
+        self._resident = {}
+        # results spilled to disk: node: dirname
+        self._spilled = {}
+        self._spill_dirname = None
+
+        try:
+            if self.n_jobs == 1 or len(self._work) <= 1:
+                self._execute_serial()
+            else:
+                self._execute_parallel()
+        finally:
+            if self._spill_dirname is not None:
+                shutil.rmtree(self._spill_dirname)
+
+        return [s.get_result() for s in steps]
+
+    def _plan(self, steps):
+        """
+        Find the steps that need to be loaded or run, keyed by their node in
+        a drain.graph.StepGraph. Equal steps, i.e. steps with the same
+        digest, are loaded or run once: the step kept by the graph does
+        the work and its duplicates receive its result.
+        Sets:
+            self._graph: the StepGraph of steps, not expanded past steps
+                that have results or will be loaded
+            self._work: dict of node: (step, function)
+            self._order: nodes in topological order
+            self._waiting: dict of node: number of inputs without results
+            self._consumers: dict of node: nodes of steps that take it as input
+            self._duplicates: dict of node: duplicate steps
+        """
+        inputs = set(s._digest for s in self.inputs)
+
+        def is_loaded(step):
+            return step._digest in inputs or (self.load_targets and step.is_target())
+
+        graph = StepGraph(steps, expand=lambda s: not s.has_result() and not is_loaded(s))
+        self._graph = graph
+        self._work = {}
+        self._duplicates = {}
+
+        # walk back from the roots, so that inputs of steps that already
+        # have a result or are loaded are left alone
+        needed = set(graph.roots)
+        for n in reversed(xrange(len(graph))):
+            if n not in needed:
+                continue
+            equal = graph.equal(n)
+            with_result = next((s for s in equal if s.has_result()), None)
+            if with_result is not None:
+                for s in equal:
+                    if not s.has_result():
+                        s.set_result(with_result.get_result())
+                continue
+
+            step = equal[0]
+            self._duplicates[n] = equal[1:]
+            if any(is_loaded(s) for s in equal):
+                self._work[n] = (step, _load)
+            else:
+                self._work[n] = (step, _run)
+                needed.update(graph.predecessors(n))
+
+        self._order = sorted(self._work)
+        self._waiting = {}
+        self._consumers = dict((n, []) for n in self._order)
+        # node: nodes of inputs that are in self._work
+        self._producers = {}
+        for n in self._order:
+            producers = [j for j in graph.predecessors(n) if j in self._work] \
+                    if self._work[n][1] is _run else []
+            self._producers[n] = producers
+            self._waiting[n] = len(producers)
+            for j in producers:
+                self._consumers[j].append(n)
+
+        # node: number of consumers that have not run yet
+        self._remaining = dict((n, len(self._consumers[n])) for n in self._order)
+
+    def _set_result(self, i, result):
+        self._work[i][0].set_result(result)
+        for step in self._duplicates[i]:
+            step.set_result(result)
+
+    def _delete_result(self, i):
+        for step in [self._work[i][0]] + self._duplicates[i]:
+            if step.has_result():
+                del step._result
+
+    def _complete(self, i, result, stats):
+        """
+        Store a finished step's result, release or spill results as
+        configured and return the nodes of steps that became ready.
+        """
+        step, function = self._work[i]
+        self._set_result(i, result)
+        self.report.append(report.step_entry(step,
+                'load' if function is _load else 'run', stats, result))
+        if self.memory_limit is not None:
+            self._resident[i] = util.nbytes(result)
+
+        if self.release:
+            for j in self._producers[i]:
+                self._remaining[j] -= 1
+                if self._remaining[j] == 0 and j not in self._roots:
+                    self._release(j)
+
+        ready = []
+        for j in self._consumers[i]:
+            self._waiting[j] -= 1
+            if self._waiting[j] == 0:
+                ready.append(j)
+        return ready
+
+    def _release(self, i):
+        self._delete_result(i)
+        self._resident.pop(i, None)
+        self._spilled.pop(i, None)
+
+    def _spill(self, needed):
+        """
+        Spill the largest resident results, other than those of roots and
+        of the steps in needed, until the rest fit in the memory limit.
+        """
+        if self.memory_limit is None:
+            return
+
+        total = sum(self._resident.values())
+        if total <= self.memory_limit:
+            return
+
+        candidates = sorted((i for i in self._resident
+                if i not in self._roots and i not in needed),
+                key=lambda i: self._resident[i], reverse=True)
+
+        for i in candidates:
+            if total <= self.memory_limit:
+                break
+            if self._spill_dirname is None:
+                self._spill_dirname = tempfile.mkdtemp(prefix='drain-spill-',
+                        dir=self.spill_dir)
+
+            from drain import store
+            step = self._work[i][0]
+            dirname = os.path.join(self._spill_dirname, str(i))
+            os.makedirs(dirname)
+            logging.info('Spilling\n\t%s' % str(step).replace('\n', '\n\t'))
+            # uncompressed, so that restoring memory-maps the spill
+            store.dump(step.get_result(), dirname, 'npy', 'none')
+            self._delete_result(i)
+
+            total -= self._resident.pop(i)
+            self._spilled[i] = dirname
+
+    def _restore(self, i):
+        """
+        Reload spilled inputs of step i before it runs.
+        Reloaded results are memory-mapped or lazy and are not counted
+        against the memory limit.
+        """
+        from drain import store
+        for j in self._producers[i]:
+            if j in self._spilled:
+                self._set_result(j, store.load(self._spilled.pop(j)))
+
+    def _execute_serial(self):
+        for i in self._order:
+            step, function = self._work[i]
+            self._restore(i)
+            with report.Measure() as measure:
+                result = function(step)
+            self._complete(i, result, measure.stats)
+            self._spill(needed=())
+
+    def _execute_parallel(self):
+        if self.backend == 'thread':
+            pool = ThreadPool(self.n_jobs)
+        else:
+            pool = Pool(self.n_jobs)
+
+        done = Queue()
+        # apply_async() results by step index
+        running = {}
+        error = None
+        # start with the leaves, in execution order
+        ready = [i for i in reversed(self._order) if self._waiting[i] == 0]
+
+        try:
+            while ready or running:
+                while ready and error is None:
+                    i = ready.pop()
+                    step, function = self._work[i]
+                    self._restore(i)
+                    if self.backend == 'process':
+                        step = _detach(step)
+
+                    running[i] = pool.apply_async(_call, (function, step),
+                            callback=lambda r, i=i: done.put((i, r)))
+
+                if not running:
+                    break
+
+                i, (result, exc, stats) = _next_done(done, running,
+                        lambda exc: (None, exc, None))
+                if exc is not None:
+                    if error is None:
+                        error = (self._work[i][0], exc)
+                    # stop submitting but let running steps finish
+                    ready = []
+                elif error is None:
+                    ready.extend(self._complete(i, result, stats))
+                    # keep the inputs of running steps in memory
+                    self._spill(needed=set(j for k in running
+                            for j in self._producers[k]))
+        finally:
+            pool.close()
+            pool.join()
+
+        if error is not None:
+            step, exc = error
+            raise RuntimeError('Error executing %s:\n%s' % (step, exc))
@@ -8,15 +8,10 @@ from copy import deepcopy
 from tempfile import NamedTemporaryFile
 from pprint import pformat
 
-from sklearn.externals import joblib
-from sklearn import tree
 import pandas as pd
 import numpy as np
 from collections import Counter
 
-import matplotlib.colors
-from matplotlib import cm
-
 from . import model, util, metrics
 
 def to_dataframe(steps):
@@ -90,6 +85,7 @@ def colorbar_index(ncolors, cmap, labels=None, **kwargs):
     Takes a standard colour ramp, and discretizes it,
     then draws a colour bar with correctly aligned labels
     """
+    from matplotlib import cm
     cmap = cmap_discretize(cmap, ncolors)
     mappable = cm.ScalarMappable(cmap=cmap)
     mappable.set_array([])
@@ -116,6 +112,7 @@ def cmap_discretize(cmap, N):
         imshow(x, cmap=djet)
 
     """
+    import matplotlib.colors
     if type(cmap) == str:
         cmap = get_cmap(cmap)
     colors_i = np.concatenate((np.linspace(0, 1., N), (0., 0., 0., 0.)))
@@ -139,6 +136,7 @@ def show_tree(tree, feature_names,max_depth=None):
 
 def export_tree(clf, filename, feature_names=None, max_depth=None):
     from sklearn.externals.six import StringIO
+    from sklearn import tree
     import pydot
 
     dot_data = StringIO()
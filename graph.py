@@ -0,0 +1,231 @@
+"""
+Indexed DAG of steps.
+
+Steps only know their inputs, so questions about a workflow, such as which
+step has a given name, which targets an output depends on or what order to
+run things in, used to be answered by recursing through inputs. On grids
+sharing inputs, i.e. diamond-shaped DAGs, the same subtrees were walked once
+per path through them. A StepGraph walks the steps reachable from a
+collection of roots once and answers these questions from indexes.
+
+Equal steps, i.e. separate objects with the same digest, are a single node.
+The step kept for a node is the first one found, or the first target among
+the equal steps, and the others are its duplicates, see equal().
+
+Nodes are numbered in topological order: every node after its inputs.
+Edges are stored as arrays of node numbers, so that the graph of a grid of
+100k steps costs little more than the steps themselves.
+"""
+from array import array
+
+from cached_property import cached_property
+
+
+class StepGraph(object):
+    """
+    The steps reachable from a collection of root steps through their inputs.
+    Nodes are referred to by their number, see index().
+    Attributes:
+        steps: the step kept for each node, in topological order
+        roots: the node of each root step, in the order given
+    """
+
+    def __init__(self, steps, expand=None):
+        """
+        Args:
+            steps: collection of root steps
+            expand: optional function of a step returning whether to
+                include its inputs, e.g. not for steps that will be loaded
+        """
+        self.steps = []
+        # digest: node
+        self._nodes = {}
+        # node: other equal steps, for the few nodes that have them
+        self._duplicates = {}
+        # predecessors of node n are _inputs[_offsets[n]:_offsets[n+1]]
+        self._offsets = array('l', [0])
+        self._inputs = array('l')
+
+        # iterative post-order traversal: a step is pushed a second time,
+        # flagged as expanded, to be numbered after its inputs
+        first = {}
+        duplicates = {}
+        stack = [(step, False) for step in reversed(list(steps))]
+        while stack:
+            step, expanded = stack.pop()
+            digest = step._digest
+            if expanded:
+                self._add(step, expand is None or expand(step))
+                continue
+
+            if digest in first:
+                if first[digest] is not step:
+                    duplicates.setdefault(digest, []).append(step)
+                continue
+
+            first[digest] = step
+            stack.append((step, True))
+            if expand is None or expand(step):
+                stack.extend((i, False) for i in reversed(step.inputs))
+
+        for digest, others in duplicates.iteritems():
+            n = self._nodes[digest]
+            equal = [self.steps[n]] + others
+            # keep a target when there is one
+            kept = next((s for s in equal if s.is_target()), equal[0])
+            self.steps[n] = kept
+            self._duplicates[n] = [s for s in equal if s is not kept]
+
+        self.roots = [self._nodes[s._digest] for s in steps]
+
+    def _add(self, step, expanded):
+        n = len(self.steps)
+        self._nodes[step._digest] = n
+        self.steps.append(step)
+
+        if expanded:
+            seen = set()
+            for i in step.inputs:
+                j = self._nodes[i._digest]
+                if j not in seen:
+                    seen.add(j)
+                    self._inputs.append(j)
+        self._offsets.append(len(self._inputs))
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    def __contains__(self, step):
+        return step._digest in self._nodes
+
+    def index(self, step):
+        """
+        Returns the node of the given step or of an equal one
+        """
+        return self._nodes[step._digest]
+
+    def by_digest(self, digest):
+        return self.steps[self._nodes[digest]]
+
+    def by_name(self, name):
+        """
+        Returns the first step, in topological order, of the given name
+        or None if there is none
+        """
+        return self._names.get(name)
+
+    def equal(self, n):
+        """
+        Returns the steps of node n: the one kept followed by its duplicates
+        """
+        return [self.steps[n]] + self._duplicates.get(n, [])
+
+    def is_target(self, n):
+        return self.steps[n].is_target()
+
+    def predecessors(self, n):
+        """
+        Returns the nodes of the distinct inputs of node n
+        """
+        return list(self._inputs[self._offsets[n]:self._offsets[n+1]])
+
+    def successors(self, n):
+        """
+        Returns the nodes taking node n as input
+        """
+        return list(self._outputs[self._output_offsets[n]:self._output_offsets[n+1]])
+
+    @cached_property
+    def _output_offsets(self):
+        counts = array('l', [0]) * (len(self.steps) + 1)
+        for j in self._inputs:
+            counts[j+1] += 1
+        for n in range(len(self.steps)):
+            counts[n+1] += counts[n]
+        return counts
+
+    @cached_property
+    def _outputs(self):
+        offsets = self._output_offsets
+        outputs = array('l', [0]) * len(self._inputs)
+        filled = array('l', offsets)
+        for n in range(len(self.steps)):
+            for j in self._inputs[self._offsets[n]:self._offsets[n+1]]:
+                outputs[filled[j]] = n
+                filled[j] += 1
+        return outputs
+
+    @cached_property
+    def _names(self):
+        names = {}
+        for n in range(len(self.steps)):
+            for step in self.equal(n):
+                if step.has_name():
+                    names.setdefault(step.get_name(), step)
+        return names
+
+    @cached_property
+    def named_steps(self):
+        """
+        Returns a dictionary of name: step pairs.
+        Raises NameError when different steps have the same name.
+        """
+        named = {}
+        for n in range(len(self.steps)):
+            for step in self.equal(n):
+                if not step.has_name():
+                    continue
+                name = step.get_name()
+                if name in named and named[name] != step:
+                    raise NameError('Multiple steps with the same name: %s' % name)
+                named[name] = step
+        return named
+
+    @cached_property
+    def named_arguments(self):
+        """
+        Returns a dictionary of (name, kwarg): value pairs where
+            name is the name of a step
+            kwarg is an argument name
+            value is the value of the argument
+        """
+        d = dict()
+        for name, step in self.named_steps.iteritems():
+            for k, v in step.get_arguments(inputs=False).iteritems():
+                d[(name, k)] = v
+        return d
+
+    @cached_property
+    def _input_targets(self):
+        targets = []
+        empty = frozenset()
+        for n in range(len(self.steps)):
+            found = empty
+            for j in self.predecessors(n):
+                t = frozenset([j]) if self.is_target(j) else targets[j]
+                # share the set of a node's only input
+                found = t if not found else found | t
+            targets.append(found)
+        return targets
+
+    def input_targets(self, n):
+        """
+        Returns the nodes of the closest targets among the ancestors of
+        node n, i.e. the targets it depends on without an intermediate
+        target, regardless of whether node n is a target itself
+        """
+        return self._input_targets[n]
+
+    def drake_data(self):
+        """
+        Returns a dictionary of outputs mapped to their input targets,
+        where the outputs are the roots and every target in the graph,
+        see drain.drake.get_drake_data()
+        """
+        outputs = set(self.roots)
+        outputs.update(n for n in range(len(self.steps)) if self.is_target(n))
+        return dict((self.steps[n], set(self.steps[j] for j in self.input_targets(n)))
+                for n in outputs)
@@ -0,0 +1,396 @@
+"""
+Index of the step directories in an OUTPUTDIR.
+
+Without it, deciding which targets are up to date means statting every
+target, step.yaml and dependency file, and Step.setup_dump() reads every
+existing step.yaml to compare it to a fresh dump. The manifest is a SQLite
+database at {OUTPUTDIR}/manifest.db with a row per step directory:
+
+    steps: digest, class, dirname, completed, the time its target was
+        last dumped or NULL while it is being (re)run, and result, a hash
+        of its result when it was last dumped
+    inputs: digest, input, result: the digests of its input targets and
+        the hashes of their results when it completed
+    dependencies: digest, filename, mtime: the modification times of its
+        dependencies and source digest file when it completed
+    dumps: dirname, size, used: the dumps of a drain.cache tier, which may
+        also be a DRAIN_LOCALDIR, with their sizes and last use
+
+Step.setup_dump() records a step when it writes step.yaml and skips the
+comparison for recorded steps whose step.yaml exists: the directory is
+named by the digest of the step's signature, so a recorded step.yaml
+cannot be out of date. When a target is dumped, Step.execute() records
+its completion.
+
+Manifest.stale() answers which of a collection of targets are stale with
+a single query: a target is stale when it has not completed or its target
+file is missing, when one of its inputs has not completed, is missing or
+completed after it with a different result than the one it was built
+with, when one of its dependencies has changed, or when a dependency it
+did not have when it completed is missing or newer than its completion.
+The dependency files are statted once each, rather than once per target,
+and only the target files of steps recorded as complete are statted.
+Targets without a row, e.g. ones built before the manifest existed, are
+checked against the filesystem and recorded.
+
+So a step that is re-run and reproduces its previous result does not make
+its consumers stale (early cutoff). drake, which only compares
+modification times, still runs them: Manifest.cutoff() is checked by
+run_step.py and the native scheduler before running a target, and a
+target that is up to date is touched instead of being run.
+
+The result hash is taken by pickling the result once more before it is
+dumped, see drain.store.digest(); steps set hash_result = False to skip
+it, e.g. for very large results, at the cost of early cutoff.
+
+Each thread has its own connection, closed when the thread exits.
+
+The manifest is a cache: deleting manifest.db is safe. Set DRAIN_MANIFEST=0
+to disable it, e.g. where SQLite locking is unreliable.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from drain import drake, util
+
+FILENAME = 'manifest.db'
+
+
+def read_environ():
+    """
+    Read ENABLED from the environment, again in a drain.daemon worker once
+    it has the client's environment
+    """
+    global ENABLED
+    ENABLED = os.environ.get('DRAIN_MANIFEST', '1') != '0'
+
+read_environ()
+
+# seconds to wait for concurrent writers, e.g. run_step.py processes
+TIMEOUT = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS steps (
+    digest TEXT PRIMARY KEY,
+    class TEXT NOT NULL,
+    dirname TEXT NOT NULL,
+    completed REAL,
+    result TEXT
+);
+CREATE TABLE IF NOT EXISTS inputs (
+    digest TEXT NOT NULL,
+    input TEXT NOT NULL,
+    result TEXT,
+    PRIMARY KEY (digest, input)
+);
+CREATE TABLE IF NOT EXISTS dependencies (
+    digest TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    mtime REAL,
+    PRIMARY KEY (digest, filename)
+);
+CREATE TABLE IF NOT EXISTS dumps (
+    dirname TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+"""
+
+_STALE = """
+SELECT w.digest, s.digest IS NOT NULL FROM wanted w
+LEFT JOIN steps s ON s.digest = w.digest
+WHERE s.completed IS NULL
+OR EXISTS (SELECT 1 FROM inputs e LEFT JOIN steps i ON i.digest = e.input
+    WHERE e.digest = s.digest AND (i.completed IS NULL OR (i.completed > s.completed
+        AND (e.result IS NULL OR i.result IS NULL OR e.result != i.result))))
+OR EXISTS (SELECT 1 FROM wanted_dependencies w JOIN files f ON f.filename = w.filename
+    LEFT JOIN dependencies d ON d.digest = w.digest AND d.filename = w.filename
+    WHERE w.digest = s.digest AND (f.mtime IS NULL
+        OR (d.filename IS NULL AND f.mtime > s.completed)
+        OR (d.filename IS NOT NULL AND (d.mtime IS NULL OR f.mtime != d.mtime))))
+"""
+
+# columns added since the first version of the schema
+_COLUMNS = [('steps', 'result', 'TEXT'), ('inputs', 'result', 'TEXT')]
+
+# a thread's manifests, closed when it exits: a connection can not be
+# shared between threads, nor carried across a fork
+_local = threading.local()
+
+
+def get(outputdir):
+    """
+    Returns the Manifest of outputdir, shared within a thread,
+    or None when manifests are disabled
+    """
+    if not ENABLED or outputdir is None:
+        return None
+
+    pid = os.getpid()
+    if getattr(_local, 'pid', None) != pid:
+        _local.pid = pid
+        _local.manifests = {}
+    if outputdir not in _local.manifests:
+        _local.manifests[outputdir] = Manifest(outputdir)
+    return _local.manifests[outputdir]
+
+
+def _mtime(filename):
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+
+def dependencies(step):
+    """
+    Returns the files whose modification makes the step stale, other than
+    its inputs: its dependencies and source digest file. Its step.yaml is left
+    out since its content is determined by the digest.
+    """
+    filenames = drake.get_file_dependencies(step)
+    return [f for f in filenames if f != step._yaml_filename]
+
+
+class Manifest(object):
+    def __init__(self, outputdir):
+        self.outputdir = outputdir
+        self.filename = os.path.join(outputdir, FILENAME)
+        self.connection = sqlite3.connect(self.filename, timeout=TIMEOUT)
+        with self.connection:
+            self.connection.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """
+        Add the columns missing from a manifest created by an older version
+        """
+        for table, column, type in _COLUMNS:
+            columns = [row[1] for row in
+                    self.connection.execute('PRAGMA table_info(%s)' % table)]
+            if column in columns:
+                continue
+            try:
+                with self.connection:
+                    self.connection.execute('ALTER TABLE %s ADD COLUMN %s %s'
+                            % (table, column, type))
+            except sqlite3.OperationalError:
+                # added concurrently by another process
+                pass
+
+    def close(self):
+        self.connection.close()
+
+    def __del__(self):
+        connection = getattr(self, 'connection', None)
+        if connection is not None:
+            connection.close()
+
+    def has(self, step):
+        """
+        Whether the step's directory has been set up
+        """
+        cursor = self.connection.execute(
+                'SELECT 1 FROM steps WHERE digest = ?', (step._digest,))
+        return cursor.fetchone() is not None
+
+    def completed(self, step):
+        """
+        Returns the time the step was last completed or None
+        """
+        cursor = self.connection.execute(
+                'SELECT completed FROM steps WHERE digest = ?', (step._digest,))
+        row = cursor.fetchone()
+        return row[0] if row is not None else None
+
+    def result(self, step):
+        """
+        Returns the hash of the step's result when it last completed or None
+        """
+        cursor = self.connection.execute(
+                'SELECT result FROM steps WHERE digest = ?', (step._digest,))
+        row = cursor.fetchone()
+        return row[0] if row is not None else None
+
+    def add(self, step):
+        """
+        Record that the step's directory has been set up
+        """
+        with self.connection:
+            self.connection.execute('INSERT OR IGNORE INTO steps '
+                    '(digest, class, dirname) VALUES (?, ?, ?)',
+                    (step._digest, step.__class__.__name__,
+                     os.path.relpath(step._output_dirname, self.outputdir)))
+
+    def start(self, step):
+        """
+        Record that the step is being run, i.e. that its target is missing
+        """
+        self.add(step)
+        with self.connection:
+            self.connection.execute(
+                    'UPDATE steps SET completed = NULL WHERE digest = ?',
+                    (step._digest,))
+
+    def invalidate(self, dirname):
+        """
+        Record that the target in the step directory dirname was removed,
+        e.g. evicted by drain.cache
+        """
+        with self.connection:
+            self.connection.execute(
+                    'UPDATE steps SET completed = NULL WHERE dirname = ?',
+                    (os.path.relpath(dirname, self.outputdir),))
+
+    def has_dumps(self):
+        """
+        Whether any dumps are recorded
+        """
+        return self.connection.execute('SELECT 1 FROM dumps LIMIT 1').fetchone() is not None
+
+    def dumps(self):
+        """
+        Returns the dump directories recorded by drain.cache and their sizes,
+        least recently used first
+        """
+        rows = self.connection.execute('SELECT dirname, size FROM dumps ORDER BY used, rowid')
+        return [(os.path.join(self.outputdir, d), size) for d, size in rows]
+
+    def add_dumps(self, dumps):
+        """
+        Record dumps written by drain.cache.
+        Args:
+            dumps: (dirname, size, used) tuples
+        """
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO dumps VALUES (?, ?, ?)',
+                    [(os.path.relpath(d, self.outputdir), size, used)
+                     for d, size, used in dumps])
+
+    def use_dump(self, dirname):
+        """
+        Record that the dump directory dirname was read
+        """
+        with self.connection:
+            self.connection.execute('UPDATE dumps SET used = ? WHERE dirname = ?',
+                    (time.time(), os.path.relpath(dirname, self.outputdir)))
+
+    def remove_dump(self, dirname):
+        """
+        Record that the dump directory dirname was removed
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM dumps WHERE dirname = ?',
+                    (os.path.relpath(dirname, self.outputdir),))
+
+    def complete(self, step, inputs, completed=None, result=None):
+        """
+        Record that the step's target was dumped.
+        Args:
+            step: the target
+            inputs: its input targets
+            completed: completion time, defaults to now
+            result: hash of its result, see drain.store.digest(), None
+                when unknown
+        """
+        if completed is None:
+            completed = time.time()
+        mtimes = [(f, _mtime(f)) for f in dependencies(step)]
+
+        self.add(step)
+        with self.connection:
+            digest = step._digest
+            self.connection.execute(
+                    'UPDATE steps SET completed = ?, result = ? WHERE digest = ?',
+                    (completed, result, digest))
+            self.connection.execute('DELETE FROM inputs WHERE digest = ?', (digest,))
+            # the results of the inputs it was built with
+            self.connection.executemany('INSERT INTO inputs (digest, input, result) '
+                    'VALUES (?, ?, (SELECT result FROM steps WHERE digest = ?))',
+                    [(digest, i._digest, i._digest) for i in set(inputs)])
+            self.connection.execute('DELETE FROM dependencies WHERE digest = ?', (digest,))
+            self.connection.executemany('INSERT INTO dependencies VALUES (?, ?, ?)',
+                    [(digest, f, m) for f, m in mtimes])
+
+    def stale(self, data):
+        """
+        Args:
+            data: dictionary of target: input targets,
+                as returned by drain.drake.get_drake_data()
+        Returns:
+            the set of targets in data that are stale themselves. Targets
+            consuming stale inputs are not included, see
+            drain.scheduler.Scheduler.stale()
+        """
+        targets = dict((t._digest, t) for t in data if t.is_target())
+        wanted_dependencies = [(d, f) for d, t in targets.items()
+                for f in dependencies(t)]
+        filenames = set(f for d, f in wanted_dependencies)
+        files = [(f, _mtime(f)) for f in filenames]
+
+        cursor = self.connection.cursor()
+        # a deleted target, e.g. to force a re-run, is stale, and so are the
+        # targets consuming it. Only the targets recorded as complete are
+        # statted, the others are stale either way
+        steps = dict((s._digest, s) for s in targets.values())
+        steps.update((i._digest, i) for t in targets.values() for i in data[t])
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS candidates (digest TEXT PRIMARY KEY)')
+        cursor.execute('DELETE FROM candidates')
+        cursor.executemany('INSERT INTO candidates VALUES (?)', [(d,) for d in steps])
+        complete = [d for d, in cursor.execute('SELECT c.digest FROM candidates c '
+                'JOIN steps s ON s.digest = c.digest WHERE s.completed IS NOT NULL')]
+        missing = [(d,) for d in complete if not os.path.exists(steps[d]._target_filename)]
+        cursor.executemany('UPDATE steps SET completed = NULL WHERE digest = ?', missing)
+
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS wanted (digest TEXT PRIMARY KEY)')
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, mtime REAL)')
+        # a dependency recorded at completion that is no longer a
+        # dependency, e.g. a source file, does not make the target stale
+        cursor.execute('CREATE TEMP TABLE IF NOT EXISTS wanted_dependencies '
+                '(digest TEXT, filename TEXT, PRIMARY KEY (digest, filename))')
+        cursor.execute('DELETE FROM wanted')
+        cursor.execute('DELETE FROM files')
+        cursor.execute('DELETE FROM wanted_dependencies')
+        cursor.executemany('INSERT INTO wanted VALUES (?)', [(d,) for d in targets])
+        cursor.executemany('INSERT INTO files VALUES (?, ?)', files)
+        cursor.executemany('INSERT OR IGNORE INTO wanted_dependencies VALUES (?, ?)',
+                wanted_dependencies)
+
+        rows = cursor.execute(_STALE).fetchall()
+        # targets without a row are checked against the filesystem
+        unknown = [targets[d] for d, known in rows if not known]
+        stale = set(targets[d] for d, known in rows if known)
+        if unknown:
+            for t in unknown:
+                if drake.is_outdated(t, data[t]):
+                    self.add(t)
+                else:
+                    self.complete(t, data[t], completed=_mtime(t._target_filename))
+            return self.stale(data)
+
+        self.connection.commit()
+        return stale
+
+    def cutoff(self, step, inputs):
+        """
+        Whether a target that drake would run because an input target is
+        newer is up to date: it has completed and every input that
+        completed since reproduced the result it was built with. Its
+        target is then touched and its completion recorded, so that it
+        counts as complete without being run.
+        Args:
+            step: the target
+            inputs: its input targets
+        """
+        if self.completed(step) is None or \
+                not os.path.exists(step._target_filename):
+            return False
+        if self.stale({step: inputs}):
+            return False
+
+        util.touch(step._target_filename)
+        self.complete(step, inputs, completed=os.stat(step._target_filename).st_mtime,
+                result=self.result(step))
+        return True
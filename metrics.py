@@ -1,6 +1,5 @@
 import numpy as np
 import pandas as pd
-import sklearn.metrics
 
 from . import util
 from .util import to_float
@@ -45,6 +44,7 @@ def baseline(y_true, y_score=None):
         return 0.0
 
 def auc(y_true, y_score):
+    import sklearn.metrics
     notnull = ~np.isnan(y_true)
     fpr, tpr, thresholds = sklearn.metrics.roc_curve(y_true[notnull], y_score[notnull])
     return sklearn.metrics.auc(fpr, tpr)
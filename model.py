@@ -4,14 +4,12 @@ import datetime
 import math
 import logging
 import inspect
+from functools import partial
 
 import pandas as pd
 import numpy as np
 
-from sklearn.externals import joblib
-from sklearn.base import _pprint
-
-from . import util, metrics
+from . import cache, util, metrics
 from drain.util import merge_dicts
 from drain.step import Step, Construct
 
@@ -60,30 +58,41 @@ class FitPredict(Step):
         return result
 
     def dump(self):
+        from sklearn.externals import joblib
+        self.setup_dump()
         result = self.get_result()
-        if self.return_estimator:
-            filename = os.path.join(self._dump_dirname, 'estimator.pkl')
-            joblib.dump(result['estimator'], filename)
-        if self.return_feature_importances:
-            filename = os.path.join(self._dump_dirname, 'feature_importances.hdf')
-            result['feature_importances'].to_hdf(filename, 'df')
-        if self.return_predictions:
-            filename = os.path.join(self._dump_dirname, 'y.hdf')
-            result['y'].to_hdf(filename, 'df')
+
+        def write(dirname):
+            if self.return_estimator:
+                filename = os.path.join(dirname, 'estimator.pkl')
+                joblib.dump(result['estimator'], filename)
+            if self.return_feature_importances:
+                filename = os.path.join(dirname, 'feature_importances.hdf')
+                result['feature_importances'].to_hdf(filename, 'df')
+            if self.return_predictions:
+                filename = os.path.join(dirname, 'y.hdf')
+                result['y'].to_hdf(filename, 'df')
+        cache.dump(self, write)
 
     def load(self):
-        result = {}
+        """
+        Lazily load the result so that e.g. metrics on the predictions
+        do not unpickle the estimator
+        """
+        from sklearn.externals import joblib
+        dirname = cache.get_dirname(self)
+        loaders = {}
         if self.return_estimator:
-            filename = os.path.join(self._dump_dirname, 'estimator.pkl')
-            result['estimator'] = joblib.load(filename)
+            filename = os.path.join(dirname, 'estimator.pkl')
+            loaders['estimator'] = partial(joblib.load, filename)
         if self.return_feature_importances:
-            filename = os.path.join(self._dump_dirname, 'feature_importances.hdf')
-            result['feature_importances'] = pd.read_hdf(filename, 'df')
+            filename = os.path.join(dirname, 'feature_importances.hdf')
+            loaders['feature_importances'] = partial(pd.read_hdf, filename, 'df')
         if self.return_predictions:
-            filename = os.path.join(self._dump_dirname, 'y.hdf')
-            result['y'] = pd.read_hdf(filename, 'df')
+            filename = os.path.join(dirname, 'y.hdf')
+            loaders['y'] = partial(pd.read_hdf, filename, 'df')
 
-        self.set_result(result)
+        self.set_result(util.LazyDict(loaders))
 
 class Fit(FitPredict):
     def __init__(self, **kwargs):
@@ -140,8 +149,6 @@ class LogisticRegression(object):
     def predict_proba(self, X):
         return self.result.predict(X)
 
-from sklearn.externals.joblib import Parallel, delayed
-from sklearn.ensemble.forest import _parallel_helper
 
 def _proximity_parallel_helper(train_nodes, t, k):
     d = (train_nodes == t).sum(axis=1)
@@ -150,6 +157,7 @@ def _proximity_parallel_helper(train_nodes, t, k):
     return d[n], n #distance, neighbors
 
 def _proximity_helper(train_nodes, test_nodes, k):
+    from sklearn.externals.joblib import Parallel, delayed
     results = Parallel(n_jobs=16, backend='threading')(delayed(_proximity_parallel_helper)(train_nodes, t, k) for t in test_nodes)
     distance, neighbors = zip(*results)
     return np.array(distance), np.array(neighbors)
@@ -243,7 +251,7 @@ class PrintMetrics(Step):
             metric_fn = getattr(sys.modules[__name__], metric_name) # TODO allow external metrics
 
             r = metric_fn(self.inputs[0], **kwargs)
-            print('%s(%s): %s' % (metric_name, _pprint(kwargs, offset=len(metric_name)), r))
+            print('%s(%s): %s' % (metric_name, util.pprint_kwargs(kwargs, offset=len(metric_name)), r))
 
 def perturb(estimator, X, bins, columns=None):
     """
@@ -0,0 +1,210 @@
+"""
+Per-step run reports.
+
+While executing, the Executor measures every step it loads or runs: wall
+time, CPU time, the increase in the process's peak resident set size and
+the size and shape of the result. Step.execute() adds its total wall and
+CPU time, the latter counting every thread and pool worker the executor
+used, and the time taken to dump its output. When it dumps one, it writes
+the whole report as {OUTPUTDIR}/{Class}/{digest}/report.json next to
+step.yaml. Since drake
+runs every target through bin/run_step.py, which calls execute(), an
+OUTPUTDIR accumulates one report per target.
+
+read_reports() collects these reports into a DataFrame with one row per
+measured step and summarize() aggregates it by step class, which is what
+bin/summarize_reports.py prints.
+
+The report of a target looks like:
+    {
+        "step": "drain.step.Add",
+        "digest": "...",
+        "started": "2016-01-01T12:00:00",
+        "wall": 1.2, "cpu": 1.1,
+        "steps": [
+            {"step": "drain.step.Scalar", "digest": "...", "phase": "run",
+             "wall": 0.1, "cpu": 0.1, "peak_rss_delta": 0,
+             "bytes": 24, "rows": null, "columns": null},
+            ...
+        ],
+        "dump": {"wall": 0.2, "cpu": 0.1, "peak_rss_delta": 0}
+    }
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from drain import util
+
+REPORT_FILENAME = 'report.json'
+
+# per-thread CPU time where the platform supports it,
+# so that concurrent steps on a thread pool are not charged for each other
+_RUSAGE = getattr(resource, 'RUSAGE_THREAD', getattr(resource, 'RUSAGE_SELF', None))
+
+
+def _cpu_time(process=False):
+    """
+    Returns the CPU time of the calling thread or, when process is True,
+    of the process and its waited-for children, e.g. the workers of a
+    process pool once it has been joined
+    """
+    if resource is None:
+        return time.clock()
+    if not process:
+        usage = resource.getrusage(_RUSAGE)
+        return usage.ru_utime + usage.ru_stime
+    return sum(usage.ru_utime + usage.ru_stime for usage in
+            (resource.getrusage(resource.RUSAGE_SELF),
+             resource.getrusage(resource.RUSAGE_CHILDREN)))
+
+
+def _max_rss():
+    """
+    Returns the peak resident set size of this process in bytes
+    """
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on os x
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+class Measure(object):
+    """
+    Context manager measuring the wall time, CPU time and peak RSS delta
+    of its block. Afterwards the stats attribute holds them as a dict.
+    """
+    def __init__(self, process=False):
+        """
+        Args:
+            process: whether to measure the CPU time of the whole process
+                and its children rather than of the calling thread, for
+                blocks running steps on pools
+        """
+        self.process = process
+
+    def __enter__(self):
+        self._wall = time.time()
+        self._cpu = _cpu_time(self.process)
+        self._rss = _max_rss()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats = {
+            'wall': time.time() - self._wall,
+            'cpu': _cpu_time(self.process) - self._cpu,
+            'peak_rss_delta': _max_rss() - self._rss,
+        }
+        return False
+
+
+def describe(result):
+    """
+    Returns a dict with the estimated size in bytes of the result and,
+    for DataFrames, Series and arrays, its number of rows and columns
+    """
+    rows, columns = None, None
+    shape = getattr(result, 'shape', None)
+    if isinstance(shape, tuple) and len(shape) > 0:
+        rows = shape[0]
+        columns = shape[1] if len(shape) > 1 else None
+
+    return {'bytes': util.nbytes(result), 'rows': rows, 'columns': columns}
+
+
+def step_name(step):
+    cls = step.__class__
+    return '%s.%s' % (cls.__module__, cls.__name__)
+
+
+def step_entry(step, phase, stats, result):
+    """
+    Returns the report entry for a step that was loaded or run
+    """
+    entry = {'step': step_name(step), 'digest': step._digest, 'phase': phase}
+    entry.update(stats)
+    entry.update(describe(result))
+    return entry
+
+
+def write_report(step, report):
+    """
+    Write the report dict to the step's output directory
+    """
+    filename = os.path.join(step._output_dirname, REPORT_FILENAME)
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True, default=str)
+
+
+def read_report(step):
+    filename = os.path.join(step._output_dirname, REPORT_FILENAME)
+    with open(filename) as f:
+        return json.load(f)
+
+
+def read_reports(outputdir):
+    """
+    Read every {outputdir}/{Class}/{digest}/report.json.
+    Returns:
+        a DataFrame with a row per step entry in a report, where the
+        dump of a report's own step is a row with phase 'dump'. The
+        column target holds the directory of the report's step.
+    """
+    import pandas as pd
+    rows = []
+    for class_name in sorted(os.listdir(outputdir)):
+        class_dirname = os.path.join(outputdir, class_name)
+        if not os.path.isdir(class_dirname):
+            continue
+
+        for digest in sorted(os.listdir(class_dirname)):
+            filename = os.path.join(class_dirname, digest, REPORT_FILENAME)
+            if not os.path.isfile(filename):
+                continue
+            with open(filename) as f:
+                report = json.load(f)
+
+            target = os.path.join(class_name, digest)
+            for entry in report['steps']:
+                rows.append(dict(entry, target=target))
+            if 'dump' in report:
+                rows.append(dict(report['dump'], target=target, phase='dump',
+                        step=report['step'], digest=report['digest']))
+
+    columns = ['target', 'step', 'digest', 'phase', 'wall', 'cpu',
+               'peak_rss_delta', 'bytes', 'rows', 'columns']
+    return pd.DataFrame(rows, columns=columns)
+
+
+def summarize(reports):
+    """
+    Aggregate a DataFrame returned by read_reports() by step class.
+    Returns:
+        a DataFrame indexed by step with the number of times each step
+        class was run, the total wall time of each phase, total CPU time,
+        maximum peak RSS delta and bytes, sorted by total wall time
+    """
+    import pandas as pd
+    wall = reports.pivot_table(index='step', columns='phase', values='wall',
+            aggfunc='sum').fillna(0)
+    wall.columns = ['%s_wall' % c for c in wall.columns]
+
+    grouped = reports.groupby('step')
+    summary = pd.DataFrame({
+        'runs': reports[reports.phase == 'run'].groupby('step').size(),
+        'wall': grouped['wall'].sum(),
+        'cpu': grouped['cpu'].sum(),
+        'peak_rss_delta': grouped['peak_rss_delta'].max(),
+        'bytes': grouped['bytes'].max(),
+    }, columns=['runs', 'wall', 'cpu', 'peak_rss_delta', 'bytes'])
+    summary['runs'] = summary['runs'].fillna(0).astype(int)
+
+    return summary.join(wall).sort_values('wall', ascending=False)
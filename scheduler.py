@@ -0,0 +1,227 @@
+"""
+Native replacement for running a workflow through drake.
+
+drake runs every target in a new `python bin/run_step.py` process, so each
+target pays for a JVM round-trip, a fresh interpreter importing pandas and
+sklearn, and parsing step.yaml files. A Scheduler takes the same graph of
+outputs and input targets as drain.drake.get_drake_data() and the same
+staleness rules as the generated Drakefile, and runs the stale outputs on a
+pool of long-lived worker processes that receive the steps pickled.
+
+An output is stale when:
+    - it is not a target (drake always runs those), or
+    - its target file does not exist, which covers a changed digest since
+      the output directory is named by it, or
+    - its target is older than its step.yaml, its dependencies, its
+      source digest file (see drain.source) or the target of any input, or
+    - any of its input targets is stale.
+The timestamps are read from the OUTPUTDIR's drain.manifest when enabled.
+A stale target whose inputs were re-run but reproduced the results it was
+built with is touched rather than run, see drain.manifest, unless force.
+
+Each stale output is run as run_step.py would: input targets are loaded
+from their dumps, other inputs are run and target outputs are dumped.
+With async_dump, outputs run in the calling process are dumped by a
+drain.writer.Writer while the next output runs.
+"""
+import logging
+import multiprocessing
+import os
+import traceback
+from multiprocessing.pool import Pool
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+from drain import step, drake, manifest, writer
+from drain.executor import _next_done
+
+
+def run(output, inputs, writer=None, cutoff=True):
+    """
+    Run an output step, loading its input targets, like run_step.py.
+    Results are not kept, so that a long-lived worker's memory does not
+    grow with every output it runs. A target output is dumped by writer
+    when given, which should release its result. With cutoff, a target
+    whose inputs reproduced the results it was built with is not run,
+    see drain.manifest.
+    """
+    if cutoff and output.is_target():
+        m = manifest.get(step.OUTPUTDIR)
+        if m is not None and m.cutoff(output, inputs):
+            logging.info('Up to date: %s' % output._target_filename)
+            return
+
+    output.execute(output=output if output.is_target() else None,
+            inputs=inputs, release=True, writer=writer)
+    if writer is None or not output.is_target():
+        del output._result
+
+
+def _init_worker(outputdir):
+    step.OUTPUTDIR = outputdir
+    import drain.yaml
+    drain.yaml.configure()
+
+
+def _call(output, inputs, cutoff):
+    try:
+        run(output, inputs, cutoff=cutoff)
+    except Exception:
+        return traceback.format_exc()
+
+
+class Scheduler(object):
+    """
+    Runs the stale outputs of a collection of steps in dependency order.
+    """
+
+    def __init__(self, steps, n_jobs=1, force=False, use_manifest=True, async_dump=False):
+        """
+        Args:
+            steps: collection of drain.step.Step objects, as passed to
+                drain.drake.to_drakefile()
+            n_jobs (int): number of worker processes, -1 for one per cpu.
+                With 1 outputs are run in the calling process.
+            force (boolean): run every output, stale or not
+            use_manifest (boolean): find outdated targets with a query of
+                the OUTPUTDIR's drain.manifest rather than statting their
+                files, when manifests are enabled
+            async_dump (boolean): when outputs are run in the calling
+                process, dump each in the background while the next runs
+        """
+        self.n_jobs = n_jobs if n_jobs > 0 else multiprocessing.cpu_count()
+        self.force = force
+        self.use_manifest = use_manifest
+        self.async_dump = async_dump
+
+        self.data = drake.get_drake_data(steps)
+        # output: outputs taking it as input
+        self._consumers = {output: [] for output in self.data}
+        for output, inputs in self.data.items():
+            for i in inputs:
+                self._consumers[i].append(output)
+
+    def order(self):
+        """
+        Returns the outputs in dependency order: every output after its
+        input targets, ties broken by output directory for determinism.
+        """
+        waiting = {output: len(inputs) for output, inputs in self.data.items()}
+        ready = sorted((o for o in waiting if waiting[o] == 0),
+                key=_sort_key, reverse=True)
+        order = []
+        while ready:
+            output = ready.pop()
+            order.append(output)
+            for consumer in self._consumers[output]:
+                waiting[consumer] -= 1
+                if waiting[consumer] == 0:
+                    ready.append(consumer)
+
+        if len(order) != len(self.data):
+            raise ValueError('Cycle in step graph')
+        return order
+
+    def stale(self):
+        """
+        Returns the set of stale outputs
+        """
+        m = manifest.get(step.OUTPUTDIR) if self.use_manifest else None
+        if m is not None:
+            outdated = m.stale(self.data)
+        else:
+            outdated = set(o for o in self.data
+                    if o.is_target() and drake.is_outdated(o, self.data[o]))
+
+        stale = set()
+        for output in self.order():
+            if self.force or not output.is_target() or output in outdated or \
+                    any(i in stale for i in self.data[output]):
+                stale.add(output)
+
+        return stale
+
+    def run(self, preview=False):
+        """
+        Set up the output directories and run the stale outputs.
+        Args:
+            preview (boolean): only return the stale outputs
+        Returns:
+            the stale outputs, in the order they were (or would be) run
+        """
+        if not preview:
+            # writes step.yaml, which is regenerated when it doesn't match
+            drake.setup_dumps(self.data, self.n_jobs)
+
+        stale = self.stale()
+        order = [o for o in self.order() if o in stale]
+        if preview:
+            return order
+
+        logging.info('Running %s of %s outputs' % (len(order), len(self.data)))
+        if self.n_jobs == 1 or len(order) <= 1:
+            self._run_serial(order)
+        else:
+            self._run_parallel(order)
+
+        return order
+
+    def _run_serial(self, order):
+        if not self.async_dump:
+            for output in order:
+                run(output, self.data[output], cutoff=not self.force)
+            return
+
+        with writer.Writer(release=True) as w:
+            for output in order:
+                # input targets are loaded from their dumps
+                w.wait(self.data[output])
+                run(output, self.data[output], writer=w, cutoff=not self.force)
+
+    def _run_parallel(self, order):
+        stale = set(order)
+        waiting = {o: sum(1 for i in self.data[o] if i in stale) for o in order}
+        ready = [o for o in reversed(order) if waiting[o] == 0]
+
+        pool = Pool(self.n_jobs, initializer=_init_worker, initargs=(step.OUTPUTDIR,))
+        done = Queue()
+        # apply_async() results by output
+        running = {}
+        error = None
+        try:
+            while ready or running:
+                while ready and error is None:
+                    output = ready.pop()
+                    running[output] = pool.apply_async(_call,
+                            (output, self.data[output], not self.force),
+                            callback=lambda e, o=output: done.put((o, e)))
+
+                if not running:
+                    break
+
+                output, exc = _next_done(done, running, lambda exc: exc)
+                if exc is not None:
+                    if error is None:
+                        error = (output, exc)
+                    # stop submitting but let running outputs finish
+                    ready = []
+                elif error is None:
+                    for consumer in self._consumers[output]:
+                        if consumer in stale:
+                            waiting[consumer] -= 1
+                            if waiting[consumer] == 0:
+                                ready.append(consumer)
+        finally:
+            pool.close()
+            pool.join()
+
+        if error is not None:
+            output, exc = error
+            raise RuntimeError('Error running %s:\n%s' % (output, exc))
+
+
+def _sort_key(output):
+    return (output.__class__.__name__, output._digest)
@@ -0,0 +1,210 @@
+"""
+Digests of the code of step classes.
+
+A step whose class is defined outside of the drain library depends on its
+code. Depending on the class's source file would re-run every step of
+every class in it after any edit, even to a comment or an unrelated
+class. Instead each such class has a source digest file
+
+    {OUTPUTDIR}/{Class}/{module}.source
+
+holding digest(cls), which Step.setup_dump() rewrites only when the
+digest changes. drake, the native scheduler and the manifest depend on
+that file's modification time, see drain.drake.get_file_dependencies().
+
+digest(cls) hashes the bytecode, constants and names of the methods and
+attributes of the class and of its bases outside of the drain library,
+and of the functions, classes and simple constants of the class's module
+that these refer to by global name, transitively. Line numbers, comments
+and docstrings are not part of it. Code of other modules is not tracked,
+and a new Python version may change the digests.
+
+When a source digest file is first written it takes the modification
+time of the class's source file, so targets that are newer than the
+source file stay up to date.
+"""
+import hashlib
+import os
+import threading
+import types
+
+# digests by class
+_digests = {}
+# (class, source digest file) pairs that are up to date in this process
+_updated = set()
+_lock = threading.Lock()
+
+# types of constants whose repr is part of a digest
+_SIMPLE = (type(None), bool, int, float, complex, str, bytes, type(u''))
+
+
+def _is_simple(value):
+    if isinstance(value, (tuple, list, frozenset, set)):
+        return all(_is_simple(v) for v in value)
+    return isinstance(value, _SIMPLE)
+
+
+def _repr(value):
+    """
+    repr with sets sorted, whose order varies between processes
+    """
+    if isinstance(value, (frozenset, set)):
+        return '{%s}' % ', '.join(sorted(_repr(v) for v in value))
+    elif isinstance(value, (tuple, list)):
+        return '(%s)' % ', '.join(_repr(v) for v in value)
+    return repr(value)
+
+
+def _functions(value):
+    """
+    Returns the functions defining a class attribute: itself, those of
+    a staticmethod, classmethod or property, or of a cached_property
+    """
+    if isinstance(value, types.FunctionType):
+        return [value]
+    elif isinstance(value, (staticmethod, classmethod)):
+        return [value.__func__]
+    elif isinstance(value, property):
+        return [f for f in (value.fget, value.fset, value.fdel) if f is not None]
+    elif isinstance(getattr(value, 'func', None), types.FunctionType):
+        return [value.func]
+    return []
+
+
+def _encode_code(code, doc, parts, names):
+    """
+    Append the parts of code that determine what it does to parts and
+    the global names it refers to to names
+    """
+    parts.append(repr(code.co_code))
+    parts.append(repr(code.co_names))
+    names.update(code.co_names)
+    for i, const in enumerate(code.co_consts):
+        if isinstance(const, types.CodeType):
+            _encode_code(const, None, parts, names)
+        elif i == 0 and doc is not None and const == doc:
+            # the docstring
+            continue
+        else:
+            parts.append(_repr(const))
+
+
+def _encode_function(f, parts, refs):
+    names = set()
+    _encode_code(f.__code__, f.__doc__, parts, names)
+    if f.__defaults__ is not None:
+        parts.append(_repr([d if _is_simple(d) else type(d).__name__
+                for d in f.__defaults__]))
+
+    module = f.__module__
+    for name in sorted(names):
+        value = f.__globals__.get(name)
+        if isinstance(value, (types.FunctionType, type)) and \
+                value.__module__ == module:
+            refs.append(value)
+        elif name in f.__globals__ and _is_simple(value):
+            parts.append('%s = %s' % (name, _repr(value)))
+
+
+def _encode_class(cls, parts, refs):
+    from drain import drake
+
+    for base in cls.__bases__:
+        try:
+            user = base.__module__ == cls.__module__ or \
+                    drake.get_source_file(base) is not None
+        except TypeError:
+            # built in
+            user = False
+        if user:
+            refs.append(base)
+        parts.append('base %s.%s' % (base.__module__, base.__name__))
+
+    for name in sorted(cls.__dict__):
+        if name in ('__dict__', '__weakref__', '__module__', '__doc__'):
+            continue
+        value = cls.__dict__[name]
+        functions = _functions(value)
+        parts.append(name)
+        if functions:
+            for f in functions:
+                _encode_function(f, parts, refs)
+        elif _is_simple(value):
+            parts.append(_repr(value))
+        else:
+            parts.append(type(value).__name__)
+
+
+def digest(cls):
+    """
+    Returns the hex digest of the code of a step class, see above
+    """
+    if cls not in _digests:
+        parts = []
+        seen = set()
+        refs = [cls]
+        while refs:
+            obj = refs.pop(0)
+            if obj in seen:
+                continue
+            seen.add(obj)
+            parts.append('%s %s.%s' % ('class' if isinstance(obj, type) else 'def',
+                    obj.__module__, obj.__name__))
+            if isinstance(obj, type):
+                _encode_class(obj, parts, refs)
+            else:
+                _encode_function(obj, parts, refs)
+
+        _digests[cls] = hashlib.md5('\n'.join(parts).encode('utf-8')).hexdigest()
+    return _digests[cls]
+
+
+def get_filename(step):
+    """
+    Returns the source digest file of the step's class, or None when the
+    class is part of the drain library
+    """
+    from drain import drake
+
+    cls = step.__class__
+    if drake.get_source_file(cls) is None:
+        return None
+    return os.path.join(os.path.dirname(step._output_dirname),
+            '%s.source' % cls.__module__)
+
+
+def update(step):
+    """
+    Write the source digest file of the step's class when it is missing or
+    holds a different digest, see above. Its directory must exist.
+    """
+    from drain import drake
+
+    filename = get_filename(step)
+    if filename is None:
+        return
+
+    cls = step.__class__
+    with _lock:
+        if (cls, filename) in _updated:
+            return
+
+        d = digest(cls)
+        try:
+            with open(filename) as f:
+                current = f.read()
+        except IOError:
+            current = None
+
+        if current != d:
+            # written to a temporary file and renamed, so that concurrent
+            # processes never read a partial digest
+            tmp_filename = '%s.%s.tmp' % (filename, os.getpid())
+            with open(tmp_filename, 'w') as f:
+                f.write(d)
+            if current is None:
+                mtime = os.stat(drake.get_source_file(cls)).st_mtime
+                os.utime(tmp_filename, (mtime, mtime))
+            os.rename(tmp_filename, filename)
+
+        _updated.add((cls, filename))
@@ -4,7 +4,6 @@ import yaml
 import inspect
 import sys
 import itertools
-import pandas as pd
 from cached_property import cached_property
 from pprint import pformat
 
@@ -13,21 +12,32 @@ try:
 except ImportError:
     from io import StringIO
 
-from sklearn.base import _pprint
-import joblib
 import os
 import base64
+import errno
 import hashlib
 import itertools
+import json
 import logging
+import numbers
 import shutil
-import warnings
-from tables import NaturalNameWarning
+import weakref
+from datetime import datetime, date, time, timedelta
 
-from drain import util
+import numpy as np
+
+# drain.store imports pandas and joblib, so it is imported when a result
+# is loaded or dumped rather than with this module
+from drain import util, report, drake, manifest, source, stream, cache
+from drain.util import Mapping
+from drain.executor import Executor
+from drain.graph import StepGraph
 
 OUTPUTDIR=None
 
+# PyYAML's libyaml emitter when PyYAML was built with it, used for step.yaml
+Dumper = getattr(yaml, 'CDumper', yaml.Dumper)
+
 
 def load(steps):
     """
@@ -42,7 +52,87 @@ def load(steps):
             pass
     return loaded
 
+# interned steps by (digest, name), see intern_steps()
+_interned = weakref.WeakValueDictionary()
+
+
+def intern_steps(steps):
+    """
+    Collapse equal steps, i.e. steps with the same digest and name, built
+    anywhere into a single object. The inputs of the given steps and of
+    their inputs are replaced by the first equal step interned while it
+    is alive, so that each step is run or loaded once and its result is
+    shared. A step is a target if any of the steps it replaces is.
+    Returns:
+        the list of interned steps
+    """
+    interned = []
+    # breadth-first, so that the first equal step found is the one kept.
+    # replaced steps are visited too, to pass their inputs' targets on.
+    queue = []
+    visited = set()
+
+    def visit(step):
+        canonical = _intern(step)
+        for s in (step, canonical):
+            if id(s) not in visited:
+                visited.add(id(s))
+                queue.append(s)
+        return canonical
+
+    for step in steps:
+        interned.append(visit(step))
+
+    for step in queue:
+        for inputs in _input_lists(step):
+            for n, i in enumerate(inputs):
+                inputs[n] = visit(i)
+
+    return interned
+
+
+def _intern(step):
+    """
+    Returns the interned step equal to step, interning step if there is none
+    """
+    key = (step._digest, step.get_name())
+    canonical = _interned.get(key)
+    if canonical is None:
+        _interned[key] = step
+        return step
+    if canonical is not step:
+        if step.is_target():
+            canonical._target = True
+        if step.has_result() and not canonical.has_result():
+            canonical.set_result(step.get_result())
+    return canonical
+
+
+def _input_lists(step):
+    """
+    Returns the lists holding the step's inputs: its inputs attribute and,
+    when it is a different list, its inputs argument
+    """
+    lists = [step.inputs]
+    inputs = step._kwargs.get('inputs')
+    if isinstance(inputs, list) and inputs is not step.inputs:
+        lists.append(inputs)
+    return lists
+
+
 class Step(object):
+    # name of the drain.store backend used to dump results, None for the default
+    result_store = None
+    # compression setting used to dump results, None for the default,
+    # see drain.store.parse_compression
+    result_compression = None
+    # whether run() consumes and may yield DataFrame chunks, see drain.stream
+    streaming = False
+    # whether dump_output() hashes the result for the manifest's early cutoff,
+    # which pickles it once more; False for results that are too large to
+    # hash again or that are handles rather than data, see drain.manifest
+    hash_result = True
+
     def __init__(self, name=None, target=False, **kwargs):
         """
         Args:
@@ -67,9 +157,9 @@ class Step(object):
         if not hasattr(self, 'dependencies'):
             self.dependencies = []
 
-    def execute(self, inputs=None, output=None, load_targets=False):
+    def execute(self, inputs=None, output=None, load_targets=False, writer=None, **kwargs):
         """ 
-        Run this step, recursively running or loading inputs. 
+        Run this step, running or loading inputs in dependency order.
         Used in bin/run_step.py which is run by drake.
         Args:
             inputs: collection of steps that should be loaded
@@ -78,39 +168,92 @@ class Step(object):
                 This argument is not used by run_step.py because target 
                 does not get serialized. But it can be useful for 
                 running steps directly.
+            writer: optional drain.writer.Writer to dump output in the
+                background, so that execute() returns once it is run
+            kwargs: passed to drain.executor.Executor, e.g. n_jobs to run
+                independent steps concurrently or memory_limit to release
+                and spill intermediate results.
+
+        The timings and result sizes of the steps loaded and run are kept
+        in self._report and, when output is dumped, written to its
+        report.json. See drain.report.
+        When output is dumped its completion is recorded in the
+        OUTPUTDIR's manifest, see drain.manifest.
         """
         if self == output:
+            m = manifest.get(OUTPUTDIR)
+            if m is not None:
+                m.start(self)
             if os.path.exists(self._dump_dirname):
                 shutil.rmtree(self._dump_dirname)
             if os.path.exists(self._target_filename):
                 os.remove(self._target_filename)
             os.makedirs(self._dump_dirname)
-    
-        if inputs is None:
-            inputs = []
-    
-        if not self.has_result():
-            if self in inputs or (load_targets and self.is_target()):
-                logging.info('Loading\n\t%s' % str(self).replace('\n','\n\t'))
-                self.load()
-            else:
-                for i in self.inputs:
-                    i.execute(inputs=inputs, output=output, load_targets=load_targets)
-    
-                args, kwargs = self.map_inputs()
-                logging.info('Running\n\t%s' % str(self).replace('\n','\n\t'))
-                self.set_result(self.run(*args, **kwargs))
-    
+
+        started = datetime.now()
+        with report.Measure(process=True) as total:
+            executor = Executor(inputs=inputs, load_targets=load_targets, **kwargs)
+            executor.execute([self])
+
+        self._report = {'step': report.step_name(self), 'digest': self._digest,
+                'started': started, 'steps': executor.report}
+        self._report.update(total.stats)
+
         if self == output:
-            self.dump()
-            util.touch(self._target_filename)
+            if writer is None:
+                self.dump_output()
+            else:
+                writer.submit(self)
 
         return self.get_result()
 
+    def dump_output(self):
+        """
+        Dump this step as the output of execute(): its result and report
+        are written first, then its target is touched and its completion
+        recorded in the manifest along with a hash of its result, so that
+        a target is never newer than an incomplete dump. The hash is None,
+        i.e. consumers never cut off, when hash_result is False or the
+        result can not be hashed.
+        """
+        # the manifest's connection belongs to the calling thread
+        m = manifest.get(OUTPUTDIR)
+        if m is not None:
+            from drain import store
+            # hashed before dumping, which consumes streamed results
+            result = store.digest(self.get_result()) if self.hash_result else None
+
+        with report.Measure() as dump:
+            self.dump()
+
+        self._report['dump'] = dump.stats
+        report.write_report(self, self._report)
+        util.touch(self._target_filename)
+
+        if m is not None:
+            m.complete(self, drake.get_input_targets(self),
+                    completed=os.stat(self._target_filename).st_mtime,
+                    result=result)
+
     @cached_property
+    def _signature(self):
+        """
+        Canonical encoding of this step's class and arguments in which
+        steps are represented by their digests, see _canonical(). So a
+        step's digest depends on its inputs' cached digests rather than on
+        a dump of its whole input tree.
+        """
+        # compute ancestors' digests bottom-up to avoid deep recursion
+        for step in _without_digest(self):
+            step._digest
+
+        cls = self.__class__
+        return _canonical({'step': '%s.%s' % (cls.__module__, cls.__name__),
+                           'arguments': self.get_arguments()})
+
+    @property
     def _hasher(self):
-        # TODO: check to make sure configure_yaml has been called!
-        return hashlib.md5(yaml.dump(self).encode('utf-8'))
+        return hashlib.md5(self._signature.encode('utf-8'))
 
     @cached_property
     def _digest(self):
@@ -122,35 +265,15 @@ class Step(object):
     def named_steps(self):
         """ 
         returns a dictionary of name: step pairs
-        recursively searches self and inputs
+        searching self and its inputs, see drain.graph.StepGraph
         """
-        named = {}
-
-        for i in self.inputs:
-            for name,step in i.named_steps.iteritems():
-                if name in named and step != named[name]:
-                    raise NameError('Multiple steps with the same name: %s' % name)
-                named[name] = step
-        
-        if self.has_name():
-            name = self.get_name()
-            if name in named and named[name] != self:
-                raise NameError('Multiple steps with the same name: %s' % name)
-            named[name] = self
-
-        return named
+        return StepGraph([self]).named_steps
 
     def get_input(self, name):
         """
         Searches the inputs tree for a step of the given name
         """
-        for i in self.inputs:
-            step = i.get_input(name)
-            if step is not None:
-                return step
-
-        if self.get_name() == name:
-            return self
+        return StepGraph([self]).by_name(name)
 
     def get_name(self):
         return self._name
@@ -166,14 +289,7 @@ class Step(object):
             kwarg is an argument name
             value is the value of the argument
         """
-        d = dict()
-        named = self.named_steps
-
-        for name, step in named.iteritems():
-            for k,v in step.get_arguments(inputs=False).iteritems():
-                d[(name, k)] = v
-
-        return d
+        return StepGraph([self]).named_arguments
 
     # returns a shallow copy of _kwargs
     # any argument specified is excluded if False
@@ -201,7 +317,7 @@ class Step(object):
                 raise ValueError('Too many inputs_mappings')
 
             for input, mapping in zip(self.inputs, inputs_mapping):
-                result = input.get_result()
+                result = self._input_result(input)
                 if isinstance(mapping, dict):
                     # pass through any missing keys, so {} is the identity
                     # do it first so that inputs_mapping overrides keys
@@ -213,7 +329,7 @@ class Step(object):
                             kwargs[mapping[k]] = result[k]
 
                 elif isinstance(mapping, basestring):
-                    kwargs[mapping] = input.get_result()
+                    kwargs[mapping] = result
                 elif mapping is None: # drop Nones
                     pass
                 else:
@@ -224,18 +340,26 @@ class Step(object):
             mapped_inputs = 0
 
         for i in range(mapped_inputs, len(self.inputs)):
-            result = self.inputs[i].get_result()
+            result = self._input_result(self.inputs[i])
             # without a mapping we handle two cases
             # when the result is a dict merge it with a global dict
-            if isinstance(result, dict):
+            if isinstance(result, Mapping):
                 # but do not override
-                kwargs.update({k:v for k,v in result.iteritems() if k not in kwargs})
+                kwargs.update({k:result[k] for k in result if k not in kwargs})
             # otherwise use it as a positional argument
             else:
                 args.append(result)
 
         return args, kwargs
 
+    def _input_result(self, input):
+        """
+        Returns the result of input as passed to run(): streamed results
+        are concatenated unless this step is streaming
+        """
+        result = input.get_result()
+        return result if self.streaming else stream.materialize(result)
+
     def get_result(self):
         return self._result
 
@@ -272,23 +396,11 @@ class Step(object):
     
     def load(self):
         """
-        Load this step's result from its dump directory
+        Load this step's result from its dump directory, or from its copy
+        in the local tier, see drain.cache
         """
-        hdf_filename = os.path.join(self._dump_dirname, 'result.h5')
-        if os.path.isfile(hdf_filename):
-            store = pd.HDFStore(hdf_filename)
-            keys = store.keys()
-            if keys == ['/df']:
-                self.set_result(store['df'])
-            else:
-                if set(keys) == set(map(lambda i: '/%s' % i, range(len(keys)))):
-                    # keys are not necessarily ordered
-                    self.set_result([store[str(k)] for k in range(len(keys))])
-                else:
-                    self.set_result({k[1:]:store[k] for k in keys})
-                
-        else:
-            self.set_result(joblib.load(os.path.join(self._output_dirname, 'dump', 'result.pkl')))
+        from drain import store
+        self.set_result(store.load(cache.get_dirname(self)))
 
     def setup_dump(self):
         """
@@ -301,50 +413,59 @@ class Step(object):
         """
         dumpdir = self._dump_dirname
         if not os.path.isdir(dumpdir):
-            os.makedirs(dumpdir)
+            try:
+                os.makedirs(dumpdir)
+            except OSError as e:
+                # created concurrently, e.g. by drain.drake.setup_dumps()
+                if e.errno != errno.EEXIST:
+                    raise
+        source.update(self)
+
+        # a step.yaml recorded in the manifest matches the digest, unless the
+        # step directory was removed since
+        m = manifest.get(OUTPUTDIR)
+        yaml_filename = self._yaml_filename
+        if m is not None and m.has(self) and os.path.isfile(yaml_filename):
+            return
             
         dump = False
-        yaml_filename = self._yaml_filename
         
         if not os.path.isfile(yaml_filename):
             dump = True
         else:
             with open(yaml_filename) as f:
-                if f.read() != yaml.dump(self):
+                if f.read() != yaml.dump(self, Dumper=Dumper):
                     logging.warning('Existing step.yaml does not match hash, regenerating')
                     dump = True
         
         if dump:
             with open(yaml_filename, 'w') as f:
-                yaml.dump(self, f)
+                yaml.dump(self, f, Dumper=Dumper)
+
+        if m is not None:
+            m.add(self)
 
     def dump(self):
+        """
+        Dump this step's result to its dump directory using the store
+        named by result_store and the result_compression setting,
+        see drain.store. The dump is written to the local tier first,
+        when there is one, and published atomically, see drain.cache.
+        """
+        from drain import store
         self.setup_dump()
         result = self.get_result()
-        if isinstance(result, pd.DataFrame):
-            result.to_hdf(os.path.join(self._dump_dirname, 'result.h5'), 'df')
-        elif hasattr(result, '__iter__') and is_dataframe_collection(result):
-            if not isinstance(result, dict):
-                keys = map(str, range(len(result)))
-                values = result
-            else:
-                keys = result.keys()
-                values = result.values()
-
-            store = pd.HDFStore(os.path.join(self._dump_dirname, 'result.h5'))
-            # ignore NaturalNameWarning
-            with warnings.catch_warnings():
-                warnings.simplefilter('ignore', category=NaturalNameWarning)
-                for key, df in zip(keys, values):
-                    store.put(key, df, mode='w')
-        else:
-            joblib.dump(self.get_result(), os.path.join(self._dump_dirname, 'result.pkl'))
+        cache.dump(self, lambda dirname: store.dump(result, dirname,
+                self.result_store, self.result_compression))
+        if isinstance(result, stream.Chunks):
+            # dumping consumed the chunks, read them back from the dump
+            self.load()
 
     def __repr__(self):
         class_name = self.__class__.__name__
 
         return '%s(%s)' % (class_name, 
-                _pprint(self._kwargs, offset=len(class_name)),)
+                util.pprint_kwargs(self._kwargs, offset=len(class_name)),)
 
     def __hash__(self):
         return int(self._hasher.hexdigest(), 16)
@@ -353,20 +474,92 @@ class Step(object):
         if not isinstance(other, Step):
             return False
         else:
-            return util.eqattr(self, other, '__class__') and util.eqattr(self, other, '_kwargs')
+            return self._digest == other._digest
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
-# checks if l is a collection of DataFrames or a DataFrame-valued dictionary
-def is_dataframe_collection(l):
-    if isinstance(l, dict):
-        l = l.values()
+class SignatureDumper(Dumper):
+    """
+    Dumper for step signatures: represents steps by their digests,
+    never emits aliases, so that equal arguments dump equally regardless of
+    object identity, and sorts mapping keys.
+    """
+    def ignore_aliases(self, data):
+        return True
 
-    for i in l:
-        if not isinstance(i, pd.DataFrame):
-            return False
-    return True
+def _digest_representer(dumper, step):
+    return dumper.represent_scalar('!digest', step._digest.decode('ascii'))
+
+SignatureDumper.add_multi_representer(Step, _digest_representer)
+
+def _canonical(obj):
+    """
+    Returns a compact canonical encoding of obj: JSON with sorted keys in
+    which steps are represented by their digests, and tuples, sets, dates,
+    numpy scalars and non-string dictionary keys are tagged so they do not
+    collide with plain values. Other objects are tagged YAML dumped by
+    SignatureDumper.
+    """
+    return json.dumps(_canonical_value(obj), sort_keys=True,
+            separators=(',', ':'))
+
+def _canonical_value(obj):
+    """
+    Returns a JSON-serializable value encoding obj, see _canonical()
+    """
+    if isinstance(obj, np.generic) and obj.dtype != object:
+        return {'!%s' % obj.dtype: obj.item() if obj.dtype.kind in 'biuf'
+                else str(obj)}
+    elif obj is None or isinstance(obj, (basestring, bool, float)):
+        return obj
+    elif isinstance(obj, numbers.Integral):
+        return int(obj)
+    elif isinstance(obj, Step):
+        return {'!digest': obj._digest.decode('ascii')}
+    elif isinstance(obj, list):
+        return [_canonical_value(v) for v in obj]
+    elif isinstance(obj, tuple):
+        return {'!tuple': [_canonical_value(v) for v in obj]}
+    elif isinstance(obj, dict):
+        if all(isinstance(k, basestring) and not k.startswith('!') for k in obj):
+            return dict((k, _canonical_value(v)) for k, v in obj.items())
+        # encode keys first so that mixed key types sort
+        return {'!dict': sorted(([_canonical(k), _canonical_value(v)]
+                for k, v in obj.items()), key=lambda item: item[0])}
+    elif isinstance(obj, (set, frozenset)):
+        return {'!set': sorted(_canonical(v) for v in obj)}
+    elif isinstance(obj, (datetime, date, time)):
+        return {'!%s' % obj.__class__.__name__: obj.isoformat()}
+    elif isinstance(obj, timedelta):
+        return {'!timedelta': [obj.days, obj.seconds, obj.microseconds]}
+    else:
+        return {'!yaml': yaml.dump(obj, Dumper=SignatureDumper)}
+
+def _without_digest(step):
+    """
+    Returns the ancestors of step (via the inputs argument) whose digests
+    have not been computed yet, each after its own inputs.
+    """
+    ancestors = []
+    seen = set([id(step)])
+    stack = [(i, False) for i in _input_arguments(step)]
+    while stack:
+        s, expanded = stack.pop()
+        if expanded:
+            ancestors.append(s)
+        elif id(s) not in seen and '_digest' not in s.__dict__:
+            seen.add(id(s))
+            stack.append((s, True))
+            stack.extend((i, False) for i in _input_arguments(s))
+
+    return ancestors
+
+def _input_arguments(step):
+    inputs = step._kwargs.get('inputs')
+    if isinstance(inputs, (list, tuple)):
+        return [i for i in inputs if isinstance(i, Step)]
+    return []
 
 class Construct(Step):
     def __init__(self, __class_name__, name=None, target=False, **kwargs):
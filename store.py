@@ -0,0 +1,498 @@
+"""
+Storage backends for step results.
+
+A Store dumps a step's result into the step's dump directory and loads it
+back. Step.dump() uses the store named by the step's result_store class
+attribute, falling back to DEFAULT, which can be set with the DRAIN_STORE
+environment variable so that it reaches the run_step.py processes spawned
+by drake. Step.load() detects the format from the files in the dump
+directory, so results remain loadable when the configured store changes.
+
+Dictionaries and lists are loaded lazily: load() returns a
+drain.util.LazyDict or LazyList which reads each key from disk when it is
+first accessed. Dictionaries whose values are not all DataFrames are
+dumped one value per subdirectory of items/ so that they too can be read
+key by key.
+
+Streamed results, i.e. drain.stream.Chunks, are dumped one chunk at a
+time and loaded as a Chunks reading one chunk at a time. The hdf and npy
+stores write each chunk as a DataFrame of a collection, other stores use
+the hdf store.
+
+Results are compressed as configured by the step's result_compression
+class attribute, falling back to COMPRESSION, which can be set with the
+DRAIN_COMPRESSION environment variable. A compression setting is a codec
+and a level from 0 to 9, written as 'codec,level' or (codec, level), or
+None for no compression. Codecs are those of PyTables, e.g. zlib, blosc,
+blosc:lz4 and blosc:zstd ('lz4' and 'zstd' are short for the latter).
+joblib uses the same codec when it has it, i.e. zlib, bz2 and lz4
+(with the lz4 package installed), and zlib otherwise. Loading needs no
+configuration. benchmarks/codecs.py compares codecs on drain results.
+
+Stores:
+    hdf: DataFrames and collections of them in a single result.h5
+        pd.HDFStore, anything else pickled by joblib. This is the default.
+    npy: DataFrames and collections of them as directories of .npy files,
+        one per dtype block with each column contiguous on disk.
+        Loading memory-maps these files and builds the DataFrames directly
+        on top of the maps, so no data is copied and processes reading
+        the same result share the page cache. Anything else is pickled.
+        With compression, blocks are pickled compressed by joblib instead
+        and read into memory when loaded.
+    joblib: everything pickled by joblib.
+"""
+import os
+import shutil
+import threading
+import warnings
+from functools import partial
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from drain import util, stream
+from drain.util import Mapping
+
+# DEFAULT and COMPRESSION are read from the environment by read_environ()
+
+DEFAULT_LEVEL = 5
+
+# short names of blosc codecs
+_HDF_CODECS = {'lz4': 'blosc:lz4', 'lz4hc': 'blosc:lz4hc', 'zstd': 'blosc:zstd',
+               'snappy': 'blosc:snappy', 'bz2': 'bzip2'}
+
+_JOBLIB_CODECS = ('zlib', 'bz2', 'lz4')
+
+# the HDF5 library is not thread-safe
+_HDF_LOCK = threading.Lock()
+
+
+def is_dataframe_collection(l):
+    """
+    checks if l is a collection of DataFrames or a DataFrame-valued dictionary
+    """
+    if isinstance(l, Mapping):
+        l = l.values()
+
+    for i in l:
+        if not isinstance(i, pd.DataFrame):
+            return False
+    return True
+
+
+def _is_dataframes(result):
+    return isinstance(result, pd.DataFrame) or \
+            (hasattr(result, '__iter__') and is_dataframe_collection(result))
+
+
+def _items(result):
+    """
+    Split a DataFrame collection into (kind, keys, values) where kind is
+    one of 'df', 'list' or 'dict'.
+    """
+    if isinstance(result, pd.DataFrame):
+        return 'df', ['df'], [result]
+    elif isinstance(result, Mapping):
+        return 'dict', list(result.keys()), list(result.values())
+    else:
+        result = list(result)
+        return 'list', [str(k) for k in range(len(result))], result
+
+
+def _collect(kind, keys, loaders):
+    """
+    inverse of _items(), taking functions that load the values,
+    or of dumping chunks when kind is 'chunks'
+    """
+    if kind == 'df':
+        return loaders[0]()
+    elif kind == 'chunks':
+        return stream.Chunks(lambda: (load() for load in loaders))
+    elif kind == 'dict':
+        return util.LazyDict(dict(zip(keys, loaders)))
+    else:
+        return util.LazyList(loaders)
+
+
+def parse_compression(compression):
+    """
+    Returns a compression setting as (codec, level), or None for none
+    """
+    if compression is None or compression is False or compression in ('', 'none'):
+        return None
+    if isinstance(compression, basestring):
+        codec, _, level = compression.partition(',')
+        return codec, int(level) if level else DEFAULT_LEVEL
+    codec, level = compression
+    return codec, int(level)
+
+
+def read_environ():
+    """
+    Read DEFAULT and COMPRESSION from the environment, again in a
+    drain.daemon worker once it has the client's environment
+    """
+    global DEFAULT, COMPRESSION
+    DEFAULT = os.environ.get('DRAIN_STORE', 'hdf')
+    COMPRESSION = parse_compression(os.environ.get('DRAIN_COMPRESSION'))
+
+read_environ()
+
+
+def _hdf_compression(compression):
+    """
+    Returns the keyword arguments for pandas' HDF writers
+    """
+    if compression is None:
+        return {}
+    codec, level = compression
+    return {'complib': _HDF_CODECS.get(codec, codec), 'complevel': level}
+
+
+def _joblib_compression(compression):
+    """
+    Returns the compress argument for joblib.dump()
+    """
+    if compression is None:
+        return 0
+    codec, level = compression
+    # blosc:lz4 is lz4
+    codec = _HDF_CODECS.get(codec, codec).split(':')[-1]
+    codec = {'bzip2': 'bz2'}.get(codec, codec)
+    if codec == 'lz4':
+        try:
+            import lz4
+        except ImportError:
+            codec = 'zlib'
+    if codec not in _JOBLIB_CODECS:
+        codec = 'zlib'
+    return codec, level
+
+
+def _read_hdf(filename, key):
+    with _HDF_LOCK:
+        return pd.read_hdf(filename, key)
+
+
+class Store(object):
+    """
+    Base class for storage backends.
+    """
+    def __init__(self, compression=None):
+        """
+        Args:
+            compression: compression setting, see parse_compression(),
+                None for COMPRESSION and 'none' for no compression
+        """
+        self.compression = parse_compression(
+                COMPRESSION if compression is None else compression)
+
+    def dump(self, result, dirname):
+        """
+        Write result into the existing directory dirname.
+        """
+        raise NotImplementedError
+
+    def load(self, dirname):
+        """
+        Read the result dumped into dirname.
+        """
+        raise NotImplementedError
+
+    def dump_chunks(self, chunks, dirname):
+        """
+        Write the DataFrames of a drain.stream.Chunks into the existing
+        directory dirname as they are produced.
+        """
+        HDFStore(self._compression_arg).dump_chunks(chunks, dirname)
+
+    @classmethod
+    def exists(cls, dirname):
+        """
+        Whether dirname contains a result dumped by this store.
+        """
+        raise NotImplementedError
+
+    @property
+    def _compression_arg(self):
+        # the compression argument of a store using the same setting
+        return self.compression or 'none'
+
+
+class JoblibStore(Store):
+    def dump(self, result, dirname):
+        joblib.dump(result, os.path.join(dirname, 'result.pkl'),
+                compress=_joblib_compression(self.compression))
+
+    def load(self, dirname):
+        return joblib.load(os.path.join(dirname, 'result.pkl'))
+
+    @classmethod
+    def exists(cls, dirname):
+        return os.path.isfile(os.path.join(dirname, 'result.pkl'))
+
+
+class HDFStore(Store):
+    def dump(self, result, dirname):
+        if not _is_dataframes(result):
+            return JoblibStore(self._compression_arg).dump(result, dirname)
+
+        filename = os.path.join(dirname, 'result.h5')
+        compression = _hdf_compression(self.compression)
+        if isinstance(result, pd.DataFrame):
+            with _HDF_LOCK:
+                result.to_hdf(filename, 'df', **compression)
+            return
+
+        from tables import NaturalNameWarning
+        kind, keys, values = _items(result)
+        with _HDF_LOCK:
+            store = pd.HDFStore(filename, **compression)
+            try:
+                # ignore NaturalNameWarning
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', category=NaturalNameWarning)
+                    for key, df in zip(keys, values):
+                        store.put(key, df, mode='w')
+            finally:
+                store.close()
+
+    def dump_chunks(self, chunks, dirname):
+        from tables import NaturalNameWarning
+        filename = os.path.join(dirname, 'result.h5')
+        compression = _hdf_compression(self.compression)
+        n = 0
+        for df in _chunks(chunks):
+            with _HDF_LOCK:
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', category=NaturalNameWarning)
+                    df.to_hdf(filename, 'chunks/%s' % n,
+                            mode='w' if n == 0 else 'a', **compression)
+            n += 1
+
+    def load(self, dirname):
+        filename = os.path.join(dirname, 'result.h5')
+        with _HDF_LOCK:
+            store = pd.HDFStore(filename, mode='r')
+            try:
+                keys = store.keys()
+            finally:
+                store.close()
+
+        if keys and all(k.startswith('/chunks/') for k in keys):
+            return _collect('chunks', None, [partial(_read_hdf, filename, 'chunks/%s' % n)
+                    for n in range(len(keys))])
+        elif keys == ['/df']:
+            return _read_hdf(filename, 'df')
+        elif set(keys) == set(map(lambda i: '/%s' % i, range(len(keys)))):
+            # keys are not necessarily ordered
+            return _collect('list', None, [partial(_read_hdf, filename, str(k))
+                    for k in range(len(keys))])
+        else:
+            return _collect('dict', [k[1:] for k in keys],
+                    [partial(_read_hdf, filename, k) for k in keys])
+
+    @classmethod
+    def exists(cls, dirname):
+        return os.path.isfile(os.path.join(dirname, 'result.h5'))
+
+
+class NpyStore(Store):
+    """
+    Layout of the dump directory:
+        columns/
+            keys.pkl: (kind, keys) as returned by _items()
+            {n}/: the n-th DataFrame
+                meta.pkl: index, columns and a list of blocks
+                {b}.npy: values of the b-th block, shape (n_columns, n_rows)
+                {b}.pkl: the same compressed by joblib, when compressed
+    """
+    def dump(self, result, dirname):
+        if not _is_dataframes(result):
+            return JoblibStore(self._compression_arg).dump(result, dirname)
+
+        root = os.path.join(dirname, 'columns')
+        if os.path.exists(root):
+            shutil.rmtree(root)
+        os.makedirs(root)
+        kind, keys, values = _items(result)
+        joblib.dump((kind, keys), os.path.join(root, 'keys.pkl'))
+        for n, df in enumerate(values):
+            frame_dirname = os.path.join(root, str(n))
+            os.makedirs(frame_dirname)
+            dump_frame(df, frame_dirname, self.compression)
+
+    def dump_chunks(self, chunks, dirname):
+        root = os.path.join(dirname, 'columns')
+        if os.path.exists(root):
+            shutil.rmtree(root)
+        os.makedirs(root)
+        n = 0
+        for df in _chunks(chunks):
+            frame_dirname = os.path.join(root, str(n))
+            os.makedirs(frame_dirname)
+            dump_frame(df, frame_dirname, self.compression)
+            n += 1
+        # written last, so that an interrupted dump does not exist
+        joblib.dump(('chunks', range(n)), os.path.join(root, 'keys.pkl'))
+
+    def load(self, dirname):
+        root = os.path.join(dirname, 'columns')
+        kind, keys = joblib.load(os.path.join(root, 'keys.pkl'))
+        return _collect(kind, keys, [partial(load_frame, os.path.join(root, str(n)))
+                for n in range(len(keys))])
+
+    @classmethod
+    def exists(cls, dirname):
+        return os.path.isfile(os.path.join(dirname, 'columns', 'keys.pkl'))
+
+
+def _chunks(chunks):
+    """
+    Iterate over chunks, yielding an empty DataFrame when there are none
+    so that an empty stream is still dumped
+    """
+    empty = True
+    for df in chunks:
+        empty = False
+        yield df
+    if empty:
+        yield pd.DataFrame()
+
+
+def dump_frame(df, dirname, compression=None):
+    """
+    Write the blocks of df to dirname. Blocks of plain numpy values are
+    saved as .npy files, or compressed by joblib as .pkl files when
+    compression is given, anything else (objects, categoricals,
+    timezones, empty blocks) is pickled along with the metadata.
+    """
+    blocks = []
+    for b, block in enumerate(df._data.blocks):
+        placement = block.mgr_locs.as_array
+        values = block.values
+        if isinstance(values, np.ndarray) and values.ndim == 2 and \
+                values.dtype != object and values.size > 0:
+            values = np.ascontiguousarray(values)
+            if compression is None:
+                filename = '%s.npy' % b
+                np.save(os.path.join(dirname, filename), values)
+            else:
+                filename = '%s.pkl' % b
+                joblib.dump(values, os.path.join(dirname, filename),
+                        compress=_joblib_compression(compression))
+            blocks.append((placement, filename))
+        else:
+            blocks.append((placement, df.iloc[:, placement]))
+
+    joblib.dump((df.index, df.columns, blocks),
+            os.path.join(dirname, 'meta.pkl'))
+
+
+def load_frame(dirname, mmap_mode='c'):
+    """
+    Read a DataFrame written by dump_frame(), memory-mapping its .npy blocks.
+    The default copy-on-write mode lets callers modify the DataFrame
+    without touching the files.
+    """
+    from pandas.core.internals import BlockManager, make_block
+
+    index, columns, blocks = joblib.load(os.path.join(dirname, 'meta.pkl'))
+    mgr_blocks = []
+    for placement, values in blocks:
+        if isinstance(values, pd.DataFrame):
+            # map the pickled frame's block placements back to ours
+            for block in values._data.blocks:
+                mgr_blocks.append(block.make_block_same_class(block.values,
+                        placement=placement[block.mgr_locs.as_array]))
+        elif values.endswith('.pkl'):
+            values = joblib.load(os.path.join(dirname, values))
+            mgr_blocks.append(make_block(values, placement=placement))
+        else:
+            values = np.load(os.path.join(dirname, values), mmap_mode=mmap_mode)
+            mgr_blocks.append(make_block(values, placement=placement))
+
+    return pd.DataFrame(BlockManager(mgr_blocks, [columns, index]))
+
+
+STORES = {
+    'hdf': HDFStore,
+    'npy': NpyStore,
+    'joblib': JoblibStore,
+}
+
+
+def get_store(name=None, compression=None):
+    """
+    Returns an instance of the store with the given name, or of DEFAULT,
+    using the given compression setting, see Store.
+    """
+    if name is None:
+        name = DEFAULT
+    if name not in STORES:
+        raise ValueError('Invalid store: %s' % name)
+    return STORES[name](compression)
+
+
+def dump(result, dirname, store=None, compression=None):
+    """
+    Dump result to the directory dirname using the named store and
+    compression setting.
+    """
+    if isinstance(result, stream.Chunks):
+        get_store(store, compression).dump_chunks(result, dirname)
+    elif isinstance(result, Mapping) and not _is_dataframes(result):
+        _dump_items(result, dirname, store, compression)
+    else:
+        get_store(store, compression).dump(result, dirname)
+
+
+def _dump_items(result, dirname, store, compression=None):
+    """
+    Dump each value of a dictionary to its own subdirectory of items/
+    """
+    root = os.path.join(dirname, 'items')
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    os.makedirs(root)
+
+    keys = list(result.keys())
+    joblib.dump(keys, os.path.join(root, 'keys.pkl'))
+    for n, key in enumerate(keys):
+        item_dirname = os.path.join(root, str(n))
+        os.makedirs(item_dirname)
+        get_store(store, compression).dump(result[key], item_dirname)
+
+
+def digest(result):
+    """
+    Returns a hash of the content of a result, or None for a
+    drain.stream.Chunks, whose chunks are only read once, and for results
+    that can not be pickled, e.g. an open pd.HDFStore. Hashing pickles
+    the whole result, see Step.hash_result. See drain.manifest.
+    """
+    if isinstance(result, stream.Chunks):
+        return None
+    try:
+        return joblib.hash(result)
+    except Exception:
+        # e.g. pickle.PicklingError or TypeError
+        return None
+
+
+def load(dirname):
+    """
+    Load the result in dirname using whichever store dumped it.
+    """
+    root = os.path.join(dirname, 'items')
+    if os.path.isfile(os.path.join(root, 'keys.pkl')):
+        keys = joblib.load(os.path.join(root, 'keys.pkl'))
+        return _collect('dict', keys, [partial(load, os.path.join(root, str(n)))
+                for n in range(len(keys))])
+
+    for cls in STORES.values():
+        if cls.exists(dirname):
+            return cls().load(dirname)
+
+    raise IOError('No result found in %s' % dirname)
@@ -0,0 +1,87 @@
+"""
+Streaming step results.
+
+Normally a step's result is a single object, so a pipeline such as
+FromSQL -> transform -> ToHDF holds the whole table in memory. A step whose
+streaming attribute is True may instead make its run() a generator of
+DataFrames. The executor wraps the generator in a Chunks object, which is
+the step's result:
+    - streaming consumers receive the Chunks and iterate over it, so each
+      chunk is produced, transformed and written before the next is read,
+    - other consumers receive the concatenated DataFrame, built the first
+      time one of them needs it,
+    - Step.dump() appends the chunks to the store one at a time and
+      the loaded result is a Chunks reading one chunk at a time.
+
+Since run() is a generator, the work of a streaming step happens while its
+consumer iterates over it, and that is where it is measured. A Chunks
+wrapping a generator can only be iterated once, so a streaming result
+should have a single streaming consumer, unless it is loaded from a dump.
+
+For example:
+
+    class Clean(Step):
+        streaming = True
+
+        def run(self, events):
+            for chunk in events:
+                yield chunk.dropna()
+
+    Clean(inputs=[FromSQL(table='events', chunksize=10**6)])
+"""
+
+
+class Chunks(object):
+    """
+    Iterable of the DataFrame chunks of a streaming result
+    """
+    def __init__(self, chunks):
+        """
+        Args:
+            chunks: an iterable of DataFrames, or a function returning
+                a new one for results that can be read more than once
+        """
+        self._chunks = chunks
+        self._consumed = False
+        self._frame = None
+
+    def __iter__(self):
+        if self._frame is not None:
+            return iter([self._frame])
+        if callable(self._chunks):
+            return iter(self._chunks())
+        if self._consumed:
+            raise ValueError('Chunks can only be iterated once')
+        self._consumed = True
+        return iter(self._chunks)
+
+    def concat(self):
+        """
+        Returns the chunks concatenated into a DataFrame, which is kept
+        for later calls and iterations
+        """
+        if self._frame is None:
+            import pandas as pd
+            chunks = list(self)
+            self._frame = pd.concat(chunks) if chunks else pd.DataFrame()
+            self._chunks = None
+        return self._frame
+
+    def __reduce__(self):
+        # a generator cannot be pickled, e.g. to a worker process
+        return (Chunks, ([self.concat()],))
+
+
+def chunks(result):
+    """
+    Returns result if it is a Chunks, otherwise a Chunks of the single
+    DataFrame result
+    """
+    return result if isinstance(result, Chunks) else Chunks([result])
+
+
+def materialize(result):
+    """
+    Returns the DataFrame of a Chunks result, other results unchanged
+    """
+    return result.concat() if isinstance(result, Chunks) else result
@@ -1,7 +1,7 @@
 import pandas as pd
 from drain.aggregate import *
 from itertools import product
-from pandas.util.testing import assert_frame_equal
+from pandas.util.testing import assert_frame_equal, assert_series_equal
 
 def test_aggregator(small_df):
 
@@ -104,3 +104,104 @@ def test_lambda_counts(small_df):
     df.index.name = 'name'
     assert_frame_equal(ag, df)
 
+
+def test_factorize():
+    df = pd.DataFrame({'a': [2, 1, np.nan, 2, 1], 'b': ['x', 'y', 'x', 'x', 'x']})
+
+    codes, groups = factorize(df, 'a')
+    assert list(codes) == [1, 0, -1, 1, 0]
+    assert list(groups) == [1, 2]
+    assert groups.name == 'a'
+
+    codes, groups = factorize(df, ['a', 'b'])
+    assert list(codes) == [2, 1, -1, 2, 0]
+    assert list(groups) == [(1, 'x'), (1, 'y'), (2, 'x')]
+    assert list(groups.names) == ['a', 'b']
+
+def test_reductions():
+    df = pd.DataFrame({'name': ['Anne', 'Ben', 'Anne', 'Charlie', 'Ben', np.nan],
+                       'score': [0.2, np.nan, 0.1, 1.0, np.nan, 3.0],
+                       'arrests': [1, 2, 2, 5, 3, 1]})
+    funcs = ['sum', 'count', 'mean', 'min', 'max', 'sumsq']
+
+    ag = Aggregator(df, [Aggregate(['score', 'arrests'], funcs)]).aggregate('name')
+
+    grouped = df.astype({'score': np.float32, 'arrests': np.float32}).groupby('name')
+    for column in ['score', 'arrests']:
+        for func in funcs:
+            expected = grouped[column].agg(sum_squares if func == 'sumsq' else func)
+            assert_series_equal(ag['%s_%s' % (column, func)], expected,
+                    check_names=False, check_dtype=False)
+
+def test_date_reductions(crime_df):
+    ag = Aggregator(crime_df, [Aggregate('Date', [date_min, date_max],
+            fname=['min', 'max'], astype=crime_df.Date.dtype)]).aggregate('District')
+
+    grouped = crime_df.groupby('District').Date
+    assert_series_equal(ag['Date_min'], grouped.min(), check_names=False)
+    assert_series_equal(ag['Date_max'], grouped.max(), check_names=False)
+
+def test_fallback(small_df):
+    ag = Aggregator(small_df, [Aggregate('score', [lambda s: s.median(), 'median'],
+            fname=['lambda', 'median'])]).aggregate(['name', 'stop'])
+
+    expected = small_df.groupby(['name', 'stop']).score.median().astype(np.float32)
+    assert_series_equal(ag['score_lambda'], expected, check_names=False, check_dtype=False)
+    assert_series_equal(ag['score_median'], expected, check_names=False, check_dtype=False)
+
+def test_group_key_cache(small_df):
+    cache = GroupKeyCache()
+
+    codes, groups = cache.factorize(small_df, 'name')
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert not codes.flags.writeable
+
+    assert cache.factorize(small_df, 'name')[0] is codes
+    cache.factorize(small_df, ['name', 'stop'])
+    cache.factorize(small_df, ['name', 'stop'])
+    cache.factorize(small_df.copy(), 'name')
+    assert (cache.hits, cache.misses) == (2, 3)
+
+    # entries go with their frame
+    df = small_df.copy()
+    cache.factorize(df, 'name')
+    assert len(cache) == 3
+    del df
+    assert len(cache) == 2
+
+def test_group_key_cache_aggregator(small_df):
+    group_keys.clear()
+    Aggregator(small_df, [Count()]).aggregate('name')
+    Aggregator(small_df, [Count('score')]).aggregate('name')
+    assert (group_keys.hits, group_keys.misses) == (1, 1)
+
+def test_window_reducer():
+    df = pd.DataFrame({'key': ['a', 'b', 'a', np.nan, 'b', 'a', 'c'],
+                       'x': [1.0, 2.0, np.nan, 4.0, 5.0, 6.0, 7.0]})
+    codes, groups = factorize(df, 'key')
+    window = WindowReducer(codes, groups)
+    funcs = ['sum', 'count', 'mean', 'sumsq']
+
+    for start, stop in [(0, 7), (1, 5), (2, 3), (5, 7)]:
+        bounds = window.bounds(slice(start, stop))
+        observed = np.flatnonzero(bounds[1] > bounds[0])
+        results = window.reduce('x', df.x.values, funcs, bounds, observed)
+
+        expected = GroupReducer(codes[start:stop], groups).reduce(df.x.iloc[start:stop], funcs)
+        for r, e in zip(results, expected):
+            assert list(groups.take(observed)) == list(e.index)
+            assert_series_equal(pd.Series(r, index=e.index), e)
+
+def test_window_reducer_exact():
+    codes, groups = factorize(pd.DataFrame({'key': ['a', 'a', 'b', 'b']}), 'key')
+    window = WindowReducer(codes, groups)
+
+    counts = np.array([1.0, np.nan, 3.0, 4.0])
+    assert window.additive('counts', counts, 'sum') == 'sum'
+    assert window.additive('counts', counts, sum_squares) == 'sumsq'
+
+    # large values followed by small ones would cancel in the cumulative sums
+    values = np.array([1.3e8, 0.7, 1.1e8, 0.3])
+    assert window.additive('values', values, 'count') == 'count'
+    for agg_func in ['sum', 'mean', 'sumsq', sum_squares]:
+        assert window.additive('values', values, agg_func) is None
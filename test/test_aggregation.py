@@ -1,9 +1,13 @@
 from drain.aggregation import SimpleAggregation, SpacetimeAggregation, AggregationJoin, SpacetimeAggregationJoin
-from drain.aggregate import Count
+from drain.aggregate import Count, Aggregate
+from drain.cube import SpacetimeCube
 from drain import step
-from datetime import date
+from datetime import date, datetime
+import pytest
+import os
 import pandas as pd
 import numpy as np
+from pandas.util.testing import assert_frame_equal
 
 class SimpleCrimeAggregation(SimpleAggregation):
     @property
@@ -82,3 +86,129 @@ def test_spacetime_join_fillna(drain_setup, spacetime_crime_agg):
         'date':[np.datetime64(date(2015,12,30)), np.datetime64(date(2015,12,31))]})
     print spacetime_crime_agg.join(left)
 
+
+class CensoredCrimeDataStep(step.Step):
+    def run(self):
+        df = pd.read_csv(os.path.join(os.path.dirname(__file__), 'crimes.csv'),
+                parse_dates=['Date'])
+        # an arrest date up to three days after the crime, missing for some
+        df['Arrest Date'] = df.Date + pd.to_timedelta(df.ID % 72, unit='h')
+        df.loc[df.ID % 5 == 0, 'Arrest Date'] = pd.NaT
+        df['Arrest'] = df.Arrest.astype(float)
+        # shuffled, so the input must be sorted by date
+        return df.sample(frac=1, random_state=0)
+
+class CensoredCrimeAggregation(SpacetimeAggregation):
+    def __init__(self, inputs, **kwargs):
+        SpacetimeAggregation.__init__(self, inputs=inputs,
+                spacedeltas={'district': ('District', ['12h', '24h', 'all']),
+                             'both': (['District', 'Community Area'], ['1d'])},
+                dates=[date(2015,12,30), date(2015,12,31)], date_column='Date',
+                censor_columns={'Arrest Date': ['Arrest']}, prefix='crimes', **kwargs)
+
+    def get_aggregates(self, date, delta):
+        return [
+            Count(),
+            Count('Arrest'),
+            Count(lambda c: c['Primary Type'] == 'THEFT', 'theft', prop=True),
+            Aggregate(lambda c: (c['Arrest Date'] - c.Date) / np.timedelta64(1, 'h'),
+                    ['sum', 'max'], 'arrest_hours')
+        ]
+
+class WindowCensoredCrimeAggregation(CensoredCrimeAggregation):
+    precompute_columns = False
+
+class DirectCensoredCrimeAggregation(CensoredCrimeAggregation):
+    cumulative_sums = False
+
+def test_spacetime_precompute_columns(drain_setup):
+    precomputed = CensoredCrimeAggregation(inputs=[CensoredCrimeDataStep()]).execute()
+    windowed = WindowCensoredCrimeAggregation(inputs=[CensoredCrimeDataStep()]).execute()
+
+    assert len(precomputed) == len(windowed)
+    for p, w in zip(precomputed, windowed):
+        assert_frame_equal(p.sort_index(axis=1), w.sort_index(axis=1))
+
+def test_spacetime_cumulative_sums(drain_setup):
+    cumulative = CensoredCrimeAggregation(inputs=[CensoredCrimeDataStep()]).execute()
+    direct = DirectCensoredCrimeAggregation(inputs=[CensoredCrimeDataStep()]).execute()
+
+    for c, d in zip(cumulative, direct):
+        assert_frame_equal(c.sort_index(axis=1), d.sort_index(axis=1))
+
+class DriftingDataStep(step.Step):
+    def run(self):
+        rng = np.random.RandomState(0)
+        dates = pd.date_range('2015-01-01', '2015-02-28', freq='20min')[:4000]
+        # large values in January, small ones in February
+        scale = np.where(dates < pd.Timestamp('2015-02-01'), 1e8, 1)
+        return pd.DataFrame({'Date': dates, 'District': rng.randint(0, 5, len(dates)),
+                             'Q': rng.rand(len(dates)) * scale})
+
+class DriftingAggregation(SpacetimeAggregation):
+    def __init__(self, inputs, **kwargs):
+        SpacetimeAggregation.__init__(self, inputs=inputs,
+                spacedeltas={'district': ('District', ['1d', 'all'])},
+                dates=[date(2015,2,20)], date_column='Date', prefix='drift', **kwargs)
+
+    def get_aggregates(self, date, delta):
+        return [Aggregate('Q', ['sum', 'mean', 'sumsq', 'count'])]
+
+class DirectDriftingAggregation(DriftingAggregation):
+    cumulative_sums = False
+
+def test_spacetime_cumulative_sums_large_values(drain_setup):
+    cumulative = DriftingAggregation(inputs=[DriftingDataStep()]).execute()
+    direct = DirectDriftingAggregation(inputs=[DriftingDataStep()]).execute()
+
+    for c, d in zip(cumulative, direct):
+        assert_frame_equal(c.sort_index(axis=1), d.sort_index(axis=1), check_exact=True)
+
+def crime_aggregates():
+    # defined once, so that the cube and the aggregations share Columns
+    return [
+        Count(),
+        Count('Arrest', prop=True),
+        Count(is_theft, 'theft', prop=True),
+        Aggregate('Beat', ['min', 'max', 'mean'])
+    ]
+
+def is_theft(c):
+    return c['Primary Type'] == 'THEFT'
+
+class CrimeCube(SpacetimeCube):
+    def __init__(self, inputs, **kwargs):
+        SpacetimeCube.__init__(self, inputs=inputs,
+                keys=['District', 'Community Area'], date_column='Date', **kwargs)
+
+    def get_aggregates(self):
+        return crime_aggregates()
+
+class CubeCrimeAggregation(SpacetimeAggregation):
+    def __init__(self, inputs, **kwargs):
+        SpacetimeAggregation.__init__(self, inputs=inputs,
+                spacedeltas={'district': ('District', ['1d', '2d', 'all']),
+                             'both': (['District', 'Community Area'], ['1d'])},
+                dates=[date(2015,12,30), date(2015,12,31)], date_column='Date',
+                prefix='crimes', **kwargs)
+
+    def get_aggregates(self, date, delta):
+        return crime_aggregates()
+
+def test_spacetime_cube(drain_setup, crime_step):
+    raw = CubeCrimeAggregation(inputs=[crime_step]).execute()
+    cubed = CubeCrimeAggregation(inputs=[CrimeCube(inputs=[crime_step])]).execute()
+
+    assert len(raw) == len(cubed)
+    for r, c in zip(raw, cubed):
+        assert_frame_equal(r.sort_index(axis=1), c.sort_index(axis=1), check_exact=True)
+
+def test_spacetime_cube_windows(drain_setup, crime_step):
+    cube = CrimeCube(inputs=[crime_step])
+    cube.execute()
+    with pytest.raises(ValueError):
+        cube.get_aggregator(datetime(2015,12,31,12), '1d', crime_aggregates())
+    with pytest.raises(ValueError):
+        cube.get_aggregator(datetime(2015,12,31), '12h', crime_aggregates())
+    with pytest.raises(ValueError):
+        cube.get_aggregator(datetime(2015,12,31), '1d', [Aggregate('Latitude', 'sum')])
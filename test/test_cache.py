@@ -0,0 +1,122 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pandas.util.testing import assert_frame_equal
+
+from drain import cache, data, manifest, step
+from drain.step import Step
+
+class Frame(Step):
+    result_store = 'npy'
+
+    def run(self):
+        # about 80KB dumped
+        return pd.DataFrame({'a': np.arange(10000.0) * self.n})
+
+def local_tier(monkeypatch, limit=None):
+    localdir = tempfile.mkdtemp()
+    monkeypatch.setattr(cache, 'LOCALDIR', localdir)
+    monkeypatch.setattr(cache, 'LOCAL_LIMIT', limit)
+    return localdir
+
+def test_parse_size():
+    assert cache.parse_size(None) is None
+    assert cache.parse_size('100') == 100
+    assert cache.parse_size('2k') == 2048
+    assert cache.parse_size('1.5G') == 1.5 * 2**30
+
+def test_shared_only(drain_setup, monkeypatch):
+    monkeypatch.setattr(cache, 'LOCALDIR', None)
+    s = Frame(n=1, target=True)
+    s.execute()
+    s.dump()
+    s.dump()
+    local, shared = cache.get_tiers(s)
+    assert cache.get_dirname(s) == s._dump_dirname
+    assert shared.version(s) != ''
+    # no temporary directories are left behind
+    assert not [f for f in os.listdir(s._output_dirname) if f.startswith('.')]
+
+    s.load()
+    assert_frame_equal(s.get_result(), Frame(n=1).execute())
+
+def test_local(drain_setup, monkeypatch):
+    local_tier(monkeypatch)
+    s = Frame(n=2, target=True)
+    s.execute()
+    s.dump()
+    local, shared = cache.get_tiers(s)
+    assert local.version(s) == shared.version(s)
+    assert cache.get_dirname(s) == local.dirname(s)
+
+    s.load()
+    assert_frame_equal(s.get_result(), Frame(n=2).execute())
+
+def test_promote(drain_setup, monkeypatch):
+    local_tier(monkeypatch)
+    s = Frame(n=3, target=True)
+    s.execute()
+    s.dump()
+    local, shared = cache.get_tiers(s)
+
+    # a new result published from another machine
+    t = Frame(n=3)
+    t.set_result(Frame(n=-3).execute())
+    monkeypatch.setattr(cache, 'LOCALDIR', tempfile.mkdtemp())
+    t.dump()
+    monkeypatch.setattr(cache, 'LOCALDIR', local.root)
+    assert local.version(s) != shared.version(s)
+
+    s.load()
+    assert_frame_equal(s.get_result(), Frame(n=-3).execute())
+    assert local.version(s) == shared.version(s)
+
+def test_evict(drain_setup, monkeypatch):
+    local_tier(monkeypatch, limit=100000)
+    monkeypatch.setattr(cache, 'SHARED_LIMIT', 200000)
+    steps = [Frame(n=n, target=True) for n in range(4)]
+    for s in steps:
+        s.execute(output=s)
+        os.utime(s._dump_dirname, (1000 + s.n, 1000 + s.n))
+
+    local, shared = cache.get_tiers(steps[0])
+    assert [local.exists(s) for s in steps] == [False, False, False, True]
+    assert [shared.exists(s) for s in steps] == [False, False, True, True]
+    assert not os.path.exists(steps[0]._target_filename)
+    assert os.path.exists(steps[3]._target_filename)
+
+def test_evict_index(drain_setup, monkeypatch):
+    monkeypatch.setattr(step, 'OUTPUTDIR', tempfile.mkdtemp())
+    monkeypatch.setattr(cache, 'LOCALDIR', None)
+    monkeypatch.setattr(cache, 'SHARED_LIMIT', 200000)
+    steps = [Frame(n=n, target=True) for n in range(10, 12)]
+    steps[0].execute(output=steps[0])
+
+    # recorded dumps are evicted without walking the tier
+    def walk(self):
+        raise AssertionError('walked %s' % self.root)
+    monkeypatch.setattr(cache.Tier, '_walk', walk)
+    for s in steps[1:]:
+        s.execute(output=s)
+
+    local, shared = cache.get_tiers(steps[0])
+    m = manifest.get(shared.root)
+    assert [d for d, size in m.dumps()] == [shared.dirname(s) for s in steps]
+
+def test_to_hdf_local(drain_setup, monkeypatch):
+    local_tier(monkeypatch)
+    d = data.ClassificationData()
+    h = data.ToHDF(inputs=[d], target=True)
+    h.execute(output=h)
+    local, shared = cache.get_tiers(h)
+    assert local.version(h) == shared.version(h)
+    assert not [f for f in os.listdir(h._output_dirname) if f.startswith('.')]
+
+    h.get_result().close()
+    h.load()
+    assert h.get_result().filename.startswith(local.root)
+    for key, df in d.get_result().items():
+        assert h.get_result()[key].equals(df)
+    h.get_result().close()
@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+import time
+import multiprocessing
+
+import pytest
+
+from drain import daemon, drake, manifest, step
+from drain.step import Scalar, Add
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+def start(preload=()):
+    path = os.path.join(tempfile.mkdtemp(), 'drain.sock')
+    p = multiprocessing.Process(target=daemon.serve, args=(path, preload))
+    p.start()
+    for i in range(100):
+        if os.path.exists(path):
+            break
+        time.sleep(.1)
+    return path, p
+
+@pytest.fixture
+def socket_path():
+    path, p = start()
+    yield path
+    p.terminate()
+    p.join()
+
+def test_submit(drain_setup, socket_path):
+    a = Scalar(value=7, target=True)
+    s = Add(inputs=[a, Scalar(value=8)], target=True)
+    for step in (a, s):
+        step.setup_dump()
+
+    stderr = StringIO()
+    code = daemon.submit(socket_path,
+            [a._target_filename, a._yaml_filename], stderr=stderr)
+    assert code == 0
+    assert 'Running' in stderr.getvalue()
+
+    code = daemon.submit(socket_path, [s._target_filename, s._yaml_filename,
+            a._yaml_filename, a._target_filename], stderr=StringIO())
+    assert code == 0
+    s.load()
+    assert s.get_result() == 15
+
+def test_submit_error(drain_setup, socket_path):
+    stderr = StringIO()
+    assert daemon.submit(socket_path, ['/nonexistent/a/b/step.yaml'], stderr=stderr) == 1
+    assert 'Traceback' in stderr.getvalue()
+
+def test_submit_environ(drain_setup, socket_path, monkeypatch):
+    a = Scalar(value=9, target=True)
+    a.setup_dump()
+
+    # the worker reads the client's settings, not the daemon's
+    monkeypatch.setenv('DRAIN_MANIFEST', '0')
+    code = daemon.submit(socket_path,
+            [a._target_filename, a._yaml_filename], stderr=StringIO())
+    assert code == 0
+    assert os.path.exists(a._target_filename)
+    assert manifest.get(step.OUTPUTDIR).completed(a) is None
+
+def test_submit_exit(monkeypatch):
+    monkeypatch.setattr(drake, 'run_step', lambda args: sys.exit(*args))
+    path, p = start()
+    try:
+        # sys.exit() succeeds, sys.exit(message) fails
+        assert daemon.submit(path, [], stderr=StringIO()) == 0
+        stderr = StringIO()
+        assert daemon.submit(path, ['failed'], stderr=stderr) == 1
+        assert 'failed' in stderr.getvalue()
+    finally:
+        p.terminate()
+        p.join()
+
+def test_submit_changed_module(drain_setup, monkeypatch):
+    dirname = tempfile.mkdtemp()
+    filename = os.path.join(dirname, 'daemon_steps.py')
+    with open(filename, 'w') as f:
+        f.write('VALUE = 1\n')
+    monkeypatch.syspath_prepend(dirname)
+
+    a = Scalar(value=10, target=True)
+    a.setup_dump()
+    path, p = start(preload=['daemon_steps'])
+    try:
+        assert daemon.submit(path, [a._target_filename, a._yaml_filename],
+                stderr=StringIO()) == 0
+
+        # a preloaded module edited since is not run with its old code
+        with open(filename, 'w') as f:
+            f.write('VALUE = 2\n')
+        t = time.time() + 10
+        os.utime(filename, (t, t))
+        stderr = StringIO()
+        assert daemon.submit(path, [a._target_filename, a._yaml_filename],
+                stderr=stderr) is None
+        assert 'daemon_steps' in stderr.getvalue()
+    finally:
+        p.terminate()
+        p.join()
+
+def test_unreachable():
+    assert daemon.submit('/nonexistent/drain.sock', []) is None
@@ -17,6 +17,17 @@ def test_to_hdf():
     for key in r1.keys():
        assert r0[key].equals(r1[key])
 
+def test_to_hdf_output(drain_setup):
+    d = data.ClassificationData()
+    h = data.ToHDF(inputs=[d], target=True)
+    # the open store is not hashed for the manifest
+    h.execute(output=h)
+    assert os.path.exists(h._target_filename)
+
+    r0, r1 = h.get_result(), d.get_result()
+    for key in r1.keys():
+       assert r0[key].equals(r1[key])
+
 def test_date_select():
     df = pd.DataFrame({'date':pd.to_datetime(
             [date(2013,m,1) for m in range(1,13)])})
@@ -1,3 +1,5 @@
+import os
+import drain.drake
 from drain.drake import *
 from drain.step import Step
 
@@ -36,3 +38,22 @@ def test_drakefile(drain_setup):
     steps = [Step(a=1, inputs=[Step(b=1, target=True)]),
              Step(a=2, inputs=[Step(b=1, target=True)])]
     print to_drakefile(steps, preview=True)
+
+def test_drakefile_setup_dumps(drain_setup):
+    inputs = [Step(b=i, target=True) for i in range(3)]
+    steps = [Step(a=i, inputs=[inputs[i % 3]], target=True) for i in range(20)]
+    to_drakefile(steps, preview=False, n_jobs=4)
+    for s in steps + inputs:
+        assert os.path.isfile(s._yaml_filename)
+
+def test_source_file_cached():
+    assert get_source_file(Step) is None
+    assert Step in drain.drake._sources
+
+def test_source_file_interactive(drain_setup):
+    # e.g. defined in a REPL, a notebook or python -c
+    cls = type('InteractiveStep', (Step,), {'__module__': '__interactive__'})
+    assert get_source_file(cls) is None
+    s = cls(a=1, target=True)
+    s.setup_dump()
+    assert os.path.isfile(s._yaml_filename)
@@ -0,0 +1,102 @@
+import time
+import pytest
+import numpy as np
+import pandas as pd
+
+from drain.step import Step, Scalar, Add
+from drain.executor import Executor
+
+class Sleep(Step):
+    def __init__(self, seconds, **kwargs):
+        Step.__init__(self, seconds=seconds, **kwargs)
+
+    def run(self, *args):
+        time.sleep(self.seconds)
+        return self.seconds
+
+class Increment(Step):
+    def run(self, value=0):
+        return value + 1
+
+    # the default repr recurses through the whole chain
+    def __repr__(self):
+        return 'Increment()'
+
+class Fail(Step):
+    def run(self):
+        raise ValueError('fail')
+
+def test_parallel_thread(drain_setup):
+    s = Add(inputs=[Scalar(value=v) for v in range(1, 10)])
+    assert s.execute(n_jobs=4) == 45
+
+def test_parallel_process(drain_setup):
+    s = Add(inputs=[Add(inputs=[Scalar(value=v), Scalar(value=v)])
+            for v in range(1, 10)])
+    assert s.execute(n_jobs=4, backend='process') == 90
+
+def test_critical_path(drain_setup):
+    s = Add(inputs=[Sleep(seconds=.5, i=i) for i in range(4)])
+    start = time.time()
+    assert s.execute(n_jobs=4) == 2
+    assert time.time() - start < 1.5
+
+def test_diamond(drain_setup):
+    a = Scalar(value=1)
+    s = Add(inputs=[Add(inputs=[a]), Add(inputs=[a, a])])
+    assert s.execute(n_jobs=2) == 3
+
+def test_deep_chain(drain_setup):
+    s = Increment()
+    for i in range(5000):
+        s = Increment(inputs=[s], inputs_mapping=['value'])
+
+    assert Executor().execute([s]) == [5001]
+
+def test_error(drain_setup):
+    s = Add(inputs=[Fail(), Scalar(value=1)])
+    with pytest.raises(RuntimeError):
+        s.execute(n_jobs=2)
+
+class Unpicklable(Step):
+    def run(self):
+        return lambda: self.value
+
+def test_error_pickling(drain_setup):
+    # a result that can not be sent back from the worker raises rather than hangs
+    s = Add(inputs=[Unpicklable(value=1), Scalar(value=1)])
+    with pytest.raises(RuntimeError):
+        s.execute(n_jobs=2, backend='process')
+
+def test_invalid_backend():
+    with pytest.raises(ValueError):
+        Executor(backend='gpu')
+
+class Frame(Step):
+    def run(self, *args):
+        return pd.DataFrame({'a': np.arange(1000.0) * self.value})
+
+class Sum(Step):
+    def run(self, *dfs):
+        return sum(df if np.isscalar(df) else df.a.sum() for df in dfs)
+
+def test_release(drain_setup):
+    a = Scalar(value=1)
+    b = Add(inputs=[a, a])
+    s = Add(inputs=[b, Scalar(value=2)])
+    assert s.execute(release=True) == 4
+    assert not a.has_result()
+    assert not b.has_result()
+    assert s.has_result()
+
+def test_spill(drain_setup):
+    frames = [Frame(value=v) for v in range(4)]
+    s = Sum(inputs=frames)
+    assert s.execute(memory_limit=1) == sum(range(4)) * np.arange(1000.0).sum()
+    assert not frames[0].has_result()
+
+def test_spill_parallel(drain_setup):
+    frames = [Frame(value=v) for v in range(4)]
+    s = Sum(inputs=[Sum(inputs=frames[:2]), Sum(inputs=frames[2:])] + frames)
+    expected = 2 * sum(range(4)) * np.arange(1000.0).sum()
+    assert s.execute(n_jobs=2, memory_limit=1) == expected
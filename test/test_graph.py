@@ -0,0 +1,70 @@
+from drain.step import Step, Scalar, Add
+from drain.graph import StepGraph
+from drain import drake
+
+class Sum(Add):
+    # the default repr recurses through every path
+    def __repr__(self):
+        return 'Sum()'
+
+def diamonds(depth):
+    """
+    A chain of diamonds: each level adds two steps taking the previous
+    level as input, so there are 2**depth paths from the top to the bottom
+    """
+    s = Scalar(value=0, name='bottom')
+    for d in range(depth):
+        s = Sum(inputs=[Sum(level=d, side=side, inputs=[s]) for side in range(2)],
+                target=(d % 10 == 0))
+    return s
+
+def test_order():
+    a = Scalar(value=1, name='a')
+    b = Scalar(value=2, name='b')
+    c = Add(inputs=[a, b], name='c')
+    graph = StepGraph([c])
+
+    assert len(graph) == 3
+    assert graph.steps[graph.roots[0]] is c
+    for n in range(len(graph)):
+        assert all(j < n for j in graph.predecessors(n))
+
+    assert set(graph.predecessors(graph.index(c))) == {graph.index(a), graph.index(b)}
+    assert graph.successors(graph.index(a)) == [graph.index(c)]
+    assert graph.by_name('b') is b
+    assert graph.by_digest(a._digest) is a
+    assert graph.named_steps == {'a': a, 'b': b, 'c': c}
+
+def test_equal_steps():
+    s1 = Scalar(value=1)
+    s2 = Scalar(value=1, target=True)
+    graph = StepGraph([Add(inputs=[s1, s2])])
+
+    assert len(graph) == 2
+    n = graph.index(s1)
+    # the target is kept
+    assert graph.steps[n] is s2
+    assert graph.equal(n) == [s2, s1]
+
+def test_expand():
+    a = Scalar(value=1)
+    b = Add(inputs=[a])
+    graph = StepGraph([Add(inputs=[b])], expand=lambda s: s is not b)
+
+    assert a not in graph
+    assert graph.predecessors(graph.index(b)) == []
+
+def test_diamonds():
+    s = diamonds(100)
+    graph = StepGraph([s])
+
+    assert len(graph) == 301
+    data = graph.drake_data()
+    # the root and a target every 10 levels
+    assert len(data) == 11
+    # the target at level 90
+    assert len(data[s]) == 1
+    assert drake.get_input_targets(s) == data[s]
+
+def test_diamonds_execute(drain_setup):
+    assert diamonds(100).execute() == 0
@@ -18,3 +18,18 @@ def test_subset_dropna():
 
 def test_subset_k():
    assert set(y_subset(y, k=2).index) == set([1,3])
+
+def test_fit_predict_lazy_load(drain_setup):
+    from drain import data, step
+    from drain.model import FitPredict
+
+    d = data.ClassificationData(n_samples=100, n_features=5)
+    est = step.Construct('sklearn.linear_model.LogisticRegression')
+    fp = FitPredict(inputs=[est, d], return_estimator=True, target=True)
+    fp.execute()
+    fp.dump()
+
+    fp.load()
+    result = fp.get_result()
+    assert len(result['y']) > 0
+    assert not result.is_loaded('estimator')
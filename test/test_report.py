@@ -0,0 +1,62 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from drain import report, step
+from drain.step import Step, Scalar, Add
+
+class Frame(Step):
+    def run(self):
+        return pd.DataFrame({'a': np.arange(10.0), 'b': np.arange(10)})
+
+def test_execute_report(drain_setup):
+    s = Add(inputs=[Scalar(value=1), Scalar(value=2)], target=True)
+    s.execute(output=s)
+
+    r = report.read_report(s)
+    assert r['step'] == 'drain.step.Add'
+    assert r['digest'] == s._digest
+    assert [e['phase'] for e in r['steps']] == ['run']*3
+    assert r['steps'][-1]['digest'] == s._digest
+    for key in ('wall', 'cpu', 'peak_rss_delta'):
+        assert key in r['dump']
+    assert r['wall'] >= r['steps'][-1]['wall']
+
+class Busy(Step):
+    def run(self):
+        started = report._cpu_time()
+        while report._cpu_time() - started < 0.2:
+            pass
+        return self.n
+
+def test_execute_report_threads(drain_setup):
+    s = Add(inputs=[Busy(n=n) for n in range(2)], target=True)
+    s.execute(output=s, n_jobs=2)
+
+    # the total counts the CPU time of the pool's threads
+    r = report.read_report(s)
+    assert r['cpu'] >= 0.9 * sum(e['cpu'] for e in r['steps'])
+
+def test_describe():
+    d = report.describe(Frame().run())
+    assert (d['rows'], d['columns']) == (10, 2)
+    assert d['bytes'] > 160
+    assert report.describe(1)['rows'] is None
+
+def test_summarize(drain_setup):
+    f = Frame(target=True)
+    f.execute(output=f)
+    s = Add(inputs=[Scalar(value=3)], target=True)
+    s.execute(output=s)
+
+    reports = report.read_reports(step.OUTPUTDIR)
+    name = report.step_name(f)
+    frames = reports[reports.step == name]
+    assert set(frames.phase) == {'run', 'dump'}
+    assert frames[frames.phase == 'run'].rows.iloc[0] == 10
+
+    summary = report.summarize(reports)
+    assert summary.loc[name, 'runs'] == 1
+    assert 'dump_wall' in summary.columns
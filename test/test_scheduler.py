@@ -0,0 +1,54 @@
+import os
+import time
+import pytest
+
+from drain.step import Scalar, Add
+from drain.scheduler import Scheduler
+
+def grid(offset):
+    a = Scalar(value=offset, target=True)
+    return [Add(inputs=[a, Scalar(value=v)], target=True) for v in range(4)]
+
+def test_run(drain_setup):
+    steps = grid(100)
+    scheduler = Scheduler(steps)
+    assert len(scheduler.run(preview=True)) == 5
+    assert not os.path.exists(steps[0]._target_filename)
+
+    assert len(scheduler.run()) == 5
+    for s in steps:
+        s.load()
+        assert s.get_result() == 100 + s.inputs[1].value
+
+    assert scheduler.run() == []
+
+def test_stale_input(drain_setup):
+    steps = grid(200)
+    Scheduler(steps).run()
+
+    # an updated input target makes its consumers stale
+    a = steps[0].inputs[0]
+    t = time.time() + 10
+    os.utime(a._target_filename, (t, t))
+    assert set(Scheduler(steps, use_manifest=False).stale()) == set(steps)
+
+def test_non_target(drain_setup):
+    s = Add(inputs=[Scalar(value=1, target=True)])
+    scheduler = Scheduler([s])
+    assert scheduler.run() == scheduler.order()
+    assert scheduler.run() == [s]
+
+def test_parallel(drain_setup):
+    steps = grid(300)
+    assert len(Scheduler(steps, n_jobs=2).run()) == 5
+    for s in steps:
+        s.load()
+        assert s.get_result() == 300 + s.inputs[1].value
+    assert Scheduler(steps, n_jobs=2).stale() == set()
+
+def test_parallel_pickling_error(drain_setup):
+    steps = grid(400)
+    # an output that can not be sent to a worker raises rather than hangs
+    steps[0].callback = lambda: None
+    with pytest.raises(RuntimeError):
+        Scheduler(steps, n_jobs=2).run()
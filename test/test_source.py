@@ -0,0 +1,71 @@
+import os
+import sys
+import tempfile
+import importlib
+
+from drain import source, step, drake
+from drain.step import Step
+
+MODULE = '''
+N = 3
+
+def helper(x):
+    return x + N
+
+def unrelated():
+    return 1
+
+class Source(Step):
+    result_store = 'npy'
+
+    def run(self):
+        """Returns helper(1)"""
+        return helper(1)
+'''
+
+def digest(code):
+    namespace = {'__name__': 'user_steps', 'Step': Step}
+    exec(compile(code, 'user_steps.py', 'exec'), namespace)
+    return source.digest(namespace['Source'])
+
+def test_digest():
+    d = digest(MODULE)
+    # comments, line numbers and docstrings
+    assert digest('\n# steps\n' + MODULE.replace('(self):', '(self):  # run')) == d
+    assert digest(MODULE.replace('Returns', 'Return')) == d
+    assert digest(MODULE.replace('return 1', 'return 2')) == d
+
+    assert digest(MODULE.replace('x + N', 'x - N')) != d
+    assert digest(MODULE.replace('N = 3', 'N = 4')) != d
+    assert digest(MODULE.replace("'npy'", "'hdf'")) != d
+
+def test_update(drain_setup):
+    dirname = tempfile.mkdtemp()
+    filename = os.path.join(dirname, 'user_source_steps.py')
+    with open(filename, 'w') as f:
+        f.write('from drain.step import Step\n' + MODULE)
+    os.utime(filename, (1000, 1000))
+    sys.path.insert(0, dirname)
+    try:
+        module = importlib.import_module('user_source_steps')
+    finally:
+        sys.path.remove(dirname)
+
+    s = module.Source(target=True)
+    s.setup_dump()
+    source_filename = source.get_filename(s)
+    assert source_filename in drake.get_file_dependencies(s)
+    with open(source_filename) as f:
+        assert f.read() == source.digest(module.Source)
+    # takes the source file's modification time when first written
+    assert os.stat(source_filename).st_mtime == 1000
+
+    # rewritten only when the digest changes
+    source._updated.clear()
+    source.update(s)
+    assert os.stat(source_filename).st_mtime == 1000
+
+    source._updated.clear()
+    source._digests[module.Source] = 'changed'
+    source.update(s)
+    assert os.stat(source_filename).st_mtime > 1000
@@ -0,0 +1,26 @@
+import subprocess
+import sys
+import tempfile
+
+HEAVY = ('pandas', 'sklearn', 'scipy', 'sqlalchemy', 'tables', 'matplotlib', 'joblib')
+
+def imported(module):
+    script = 'import sys, %s; print(" ".join(sys.modules))' % module
+    # run outside of the drain directory, whose yaml.py would shadow PyYAML
+    output = subprocess.check_output([sys.executable, '-c', script],
+            cwd=tempfile.gettempdir())
+    return set(m.split('.')[0] for m in output.decode().split())
+
+def test_import_step():
+    assert imported('drain.step').isdisjoint(HEAVY)
+
+def test_import_run_step():
+    # what bin/run_step.py imports before loading a step
+    assert imported('drain.daemon, drain.drake, drain.yaml').isdisjoint(HEAVY)
+
+def test_import_model():
+    assert imported('drain.model').isdisjoint(('sklearn', 'matplotlib'))
+
+def test_import_util():
+    # drain.util.PgSQLDatabase imports drain.sql when called
+    assert imported('drain.util').isdisjoint(('sqlalchemy',))
@@ -1,4 +1,5 @@
 from drain.step import *
+import pandas as pd
 from drain import step
 import tempfile
 
@@ -73,3 +74,58 @@ def test_dump_hdf_dict():
     t.dump()
     t.load()
     print t.get_result()
+
+def test_digest_inputs():
+    a = Scalar(value=1)
+    assert Add(inputs=[a, a])._digest == Add(inputs=[a, Scalar(value=1)])._digest
+    assert Add(inputs=[a])._digest != Add(inputs=[Scalar(value=2)])._digest
+    assert Add(inputs=[a])._digest != Divide(inputs=[a])._digest
+
+def test_digest_deep_chain():
+    s = Scalar(value=0)
+    for i in range(2000):
+        s = Add(inputs=[s])
+    assert s == Add(inputs=[s.inputs[0]])
+    assert s != s.inputs[0]
+
+def test_canonical():
+    assert step._canonical({'b': 1, 'a': [1, 2]}) == '{"a":[1,2],"b":1}'
+    assert step._canonical((1, 2)) != step._canonical([1, 2])
+    assert step._canonical({1: 'x'}) != step._canonical({'1': 'x'})
+    assert step._canonical({'a': set([2, 1])}) == step._canonical({'a': set([1, 2])})
+    a = Scalar(value=1)
+    assert a._digest.decode('ascii') in step._canonical([a])
+
+def test_yaml_load(drain_setup):
+    import drain.yaml
+    s = Add(inputs=[Scalar(value=1), Scalar(value=(2, 3))], target=True)
+    s.setup_dump()
+    loaded = drain.yaml.load(s._yaml_filename)
+    assert loaded == s
+    assert loaded.inputs[1].value == (2, 3)
+
+class Count(Step):
+    runs = 0
+
+    def run(self, *args):
+        Count.runs += 1
+        return Count.runs
+
+def test_execute_equal_steps(drain_setup):
+    Count.runs = 0
+    s = Add(inputs=[Count(x=1), Count(x=1), Add(inputs=[Count(x=1)])])
+    assert s.execute() == 3
+    assert Count.runs == 1
+
+def test_intern(drain_setup):
+    a = Count(x=2)
+    b = Count(x=2, target=True)
+    s1 = Add(inputs=[a])
+    s2 = Add(inputs=[Add(inputs=[b])])
+    interned = intern_steps([s1, s2])
+
+    assert interned[0] is s1
+    assert s2.inputs[0].inputs[0] is a
+    assert a.is_target()
+    assert intern_steps([Count(x=2)])[0] is a
+    assert intern_steps([Count(x=2, name='other')])[0] is not a
@@ -0,0 +1,170 @@
+import os
+import tempfile
+import pytest
+import numpy as np
+import pandas as pd
+from pandas.util.testing import assert_frame_equal
+
+from drain import store
+from drain.step import Step
+
+def mixed_df():
+    return pd.DataFrame({
+        'f': np.arange(5, dtype=np.float32),
+        'g': np.arange(5, dtype=np.float32) * 2,
+        'i': np.arange(5),
+        'b': [True, False, True, True, False],
+        'd': pd.date_range('2015-01-01', periods=5),
+        's': list('abcde'),
+        'c': pd.Categorical(list('xyxyx')),
+    }, index=pd.Index(range(10, 15), name='id'))
+
+@pytest.mark.parametrize('name', ['hdf', 'npy', 'joblib'])
+def test_roundtrip_df(name):
+    dirname = tempfile.mkdtemp()
+    df = mixed_df()
+    if name == 'hdf':
+        df = df.drop('c', axis=1)
+    store.dump(df, dirname, name)
+    assert_frame_equal(store.load(dirname), df)
+
+@pytest.mark.parametrize('name', ['hdf', 'npy', 'joblib'])
+def test_roundtrip_collections(name):
+    df = pd.DataFrame({'a': range(3)})
+    for result in ([df, df*2], {'x': df, 'y': df*3}):
+        dirname = tempfile.mkdtemp()
+        store.dump(result, dirname, name)
+        loaded = store.load(dirname)
+        assert len(loaded) == len(result)
+        for k in (range(len(result)) if isinstance(result, list) else result):
+            assert_frame_equal(loaded[k], result[k])
+
+@pytest.mark.parametrize('name', ['hdf', 'npy', 'joblib'])
+def test_roundtrip_object(name):
+    dirname = tempfile.mkdtemp()
+    store.dump({'a': 1, 'b': [2]}, dirname, name)
+    assert dict(store.load(dirname)) == {'a': 1, 'b': [2]}
+
+def test_npy_memmap():
+    dirname = tempfile.mkdtemp()
+    df = mixed_df()
+    store.dump(df, dirname, 'npy')
+    loaded = store.load(dirname)
+    assert isinstance(loaded['f'].values.base, np.memmap) or \
+            isinstance(loaded['f'].values, np.memmap)
+
+    # copy on write leaves the dump untouched
+    loaded['f'].values[0] = -1
+    assert store.load(dirname)['f'].values[0] == 0
+
+def test_npy_multiindex_empty():
+    dirname = tempfile.mkdtemp()
+    df = pd.DataFrame({'a': [1.0, 2.0], 'k': [1, 2], 'j': ['x', 'y']})
+    df = df.set_index(['k', 'j'])
+    store.dump([df, df.iloc[0:0]], dirname, 'npy')
+    loaded = store.load(dirname)
+    assert_frame_equal(loaded[0], df)
+    assert_frame_equal(loaded[1], df.iloc[0:0])
+
+def test_invalid_store():
+    with pytest.raises(ValueError):
+        store.get_store('parquet')
+
+def test_parse_compression():
+    assert store.parse_compression('none') is None
+    assert store.parse_compression(None) is None
+    assert store.parse_compression('zlib') == ('zlib', store.DEFAULT_LEVEL)
+    assert store.parse_compression('blosc:lz4,3') == ('blosc:lz4', 3)
+    assert store.parse_compression(('zstd', 1)) == ('zstd', 1)
+
+def test_joblib_compression():
+    assert store._joblib_compression(None) == 0
+    assert store._joblib_compression(('blosc:zstd', 3)) == ('zlib', 3)
+    assert store._joblib_compression(('bz2', 9)) == ('bz2', 9)
+
+@pytest.mark.parametrize('name', ['hdf', 'npy', 'joblib'])
+@pytest.mark.parametrize('compression', ['zlib,1', 'blosc:lz4,5'])
+def test_roundtrip_compressed(name, compression):
+    dirname = tempfile.mkdtemp()
+    df = mixed_df().drop(['c', 's'], axis=1)
+    store.dump(df, dirname, name, compression)
+    assert_frame_equal(store.load(dirname), df)
+
+def test_compression_smaller():
+    df = pd.DataFrame({'a': np.zeros(100000, dtype=np.float32)})
+    sizes = {}
+    for compression in ('none', 'zlib,5'):
+        dirname = tempfile.mkdtemp()
+        store.dump(df, dirname, 'npy', compression)
+        sizes[compression] = sum(os.path.getsize(os.path.join(d, f))
+                for d, _, files in os.walk(dirname) for f in files)
+    assert sizes['zlib,5'] < sizes['none'] / 10
+
+def test_digest():
+    df = mixed_df()
+    assert store.digest(df) == store.digest(mixed_df())
+    assert store.digest(df) != store.digest(df.iloc[1:])
+
+class NpyStep(Step):
+    result_store = 'npy'
+
+    def run(self):
+        return pd.DataFrame({'a': np.arange(10.0)})
+
+def test_step_result_store(drain_setup):
+    s = NpyStep(target=True)
+    s.execute()
+    s.dump()
+    s.dump()
+    assert os.path.isdir(os.path.join(s._dump_dirname, 'columns'))
+    s.load()
+    assert_frame_equal(s.get_result(), pd.DataFrame({'a': np.arange(10.0)}))
+
+def test_lazy_dict():
+    dirname = tempfile.mkdtemp()
+    df = pd.DataFrame({'a': range(3)})
+    store.dump({'df': df, 'n': 1, 's': pd.Series([1, 2])}, dirname)
+    loaded = store.load(dirname)
+    assert sorted(loaded.keys()) == ['df', 'n', 's']
+    assert not loaded.is_loaded('df')
+    assert loaded['n'] == 1
+    assert not loaded.is_loaded('df')
+    assert_frame_equal(loaded['df'], df)
+
+def test_lazy_list():
+    dirname = tempfile.mkdtemp()
+    dfs = [pd.DataFrame({'a': range(i)}) for i in range(3)]
+    store.dump(dfs, dirname)
+    loaded = store.load(dirname)
+    assert len(loaded) == 3
+    assert_frame_equal(loaded[-1], dfs[2])
+    assert not loaded.is_loaded(0)
+
+class DictStep(Step):
+    def run(self):
+        return {'big': pd.DataFrame({'a': range(3)}), 'small': 1}
+
+class Small(Step):
+    def run(self, small):
+        return small
+
+def test_lazy_inputs_mapping(drain_setup):
+    d = DictStep(target=True)
+    d.execute()
+    d.dump()
+
+    d = DictStep()
+    s = Small(inputs=[d], inputs_mapping=[{'big': None}])
+    assert s.execute(inputs=[d]) == 1
+    assert not d.get_result().is_loaded('big')
+
+class CompressedStep(NpyStep):
+    result_compression = ('zlib', 1)
+
+def test_step_result_compression(drain_setup):
+    s = CompressedStep(target=True)
+    s.execute()
+    s.dump()
+    assert os.path.isfile(os.path.join(s._dump_dirname, 'columns', '0', '0.pkl'))
+    s.load()
+    assert_frame_equal(s.get_result(), pd.DataFrame({'a': np.arange(10.0)}))
@@ -0,0 +1,100 @@
+import tempfile
+import pytest
+import pandas as pd
+from pandas.util.testing import assert_frame_equal
+
+from drain import store, stream
+from drain.step import Step, Add
+from drain.data import FromSQL
+
+# order in which chunks were produced and consumed
+events = []
+
+class Source(Step):
+    streaming = True
+
+    def run(self):
+        for n in range(self.n):
+            events.append(('produce', n))
+            yield pd.DataFrame({'a': range(n*10, (n+1)*10)})
+
+class Double(Step):
+    streaming = True
+
+    def run(self, chunks):
+        for chunk in chunks:
+            events.append(('consume', len(events)))
+            yield chunk * 2
+
+class Total(Step):
+    def run(self, df):
+        return df.a.sum()
+
+class Engine(Step):
+    def run(self):
+        from sqlalchemy import create_engine
+        engine = create_engine('sqlite://')
+        pd.DataFrame({'a': range(25)}).to_sql('t', engine, index=False)
+        return engine
+
+def test_chunks_interleaved():
+    del events[:]
+    s = Double(inputs=[Source(n=3)])
+    result = s.execute()
+
+    assert isinstance(result, stream.Chunks)
+    chunks = list(result)
+    assert len(chunks) == 3
+    assert chunks[1].a.tolist() == range(20, 40, 2)
+    # each chunk is consumed before the next is produced
+    assert [e[0] for e in events] == ['produce', 'consume'] * 3
+
+def test_chunks_once():
+    c = stream.Chunks(iter([pd.DataFrame({'a': [1]})]))
+    list(c)
+    with pytest.raises(ValueError):
+        list(c)
+
+def test_materialize():
+    s = Total(inputs=[Double(inputs=[Source(n=4)])])
+    assert s.execute() == 2 * sum(range(40))
+
+def test_materialize_process(drain_setup):
+    s = Add(inputs=[Total(inputs=[Source(n=2)]),
+                    Total(inputs=[Double(inputs=[Source(n=3)])])])
+    assert s.execute(n_jobs=2, backend='process') == sum(range(20)) + 2 * sum(range(30))
+
+@pytest.mark.parametrize('name', ['hdf', 'npy', 'joblib'])
+def test_dump_chunks(name):
+    dirname = tempfile.mkdtemp()
+    chunks = [pd.DataFrame({'a': range(n, n+5)}) for n in range(3)]
+    store.dump(stream.Chunks(iter(chunks)), dirname, name)
+
+    loaded = store.load(dirname)
+    assert isinstance(loaded, stream.Chunks)
+    # loaded chunks can be read more than once
+    for i in range(2):
+        for c, l in zip(chunks, loaded):
+            assert_frame_equal(c, l)
+
+def test_dump_empty():
+    dirname = tempfile.mkdtemp()
+    store.dump(stream.Chunks(iter([])), dirname)
+    assert len(list(store.load(dirname))) == 1
+
+def test_execute_output(drain_setup):
+    s = Double(inputs=[Source(n=2)], target=True)
+    s.execute(output=s)
+    assert len(list(s.get_result())) == 2
+
+    s2 = Double(inputs=[Source(n=2)])
+    s2.load()
+    assert s2.get_result().concat().a.tolist() == range(0, 40, 2)
+
+def test_from_sql():
+    s = FromSQL(query='SELECT * FROM t', chunksize=10, inputs=[Engine()])
+    result = s.execute()
+    assert [len(c) for c in result] == [10, 10, 5]
+
+    s = Total(inputs=[FromSQL(query='SELECT * FROM t', chunksize=10, inputs=[Engine()])])
+    assert s.execute() == sum(range(25))
@@ -0,0 +1,47 @@
+import os
+import threading
+import pytest
+
+from drain.step import Scalar, Add
+from drain.writer import Writer
+from drain.scheduler import Scheduler
+
+class SlowDump(Scalar):
+    """
+    Scalar whose dump waits until released
+    """
+    def dump(self):
+        self.released.wait()
+        Scalar.dump(self)
+
+class FailDump(Scalar):
+    def dump(self):
+        raise IOError('disk full')
+
+def test_target_after_dump(drain_setup):
+    s = SlowDump(value=1, target=True)
+    s.released = threading.Event()
+    with Writer() as writer:
+        assert s.execute(output=s, writer=writer) == 1
+        # execute returned before the dump, so the target is not touched
+        assert not os.path.exists(s._target_filename)
+        s.released.set()
+        writer.wait([s])
+        assert os.path.exists(s._target_filename)
+
+def test_flush_error(drain_setup):
+    s = FailDump(value=2, target=True)
+    writer = Writer()
+    s.execute(output=s, writer=writer)
+    with pytest.raises(RuntimeError):
+        writer.close()
+    assert not os.path.exists(s._target_filename)
+
+def test_scheduler(drain_setup):
+    a = Scalar(value=400, target=True)
+    steps = [Add(inputs=[a, Scalar(value=v)], target=True) for v in range(4)]
+    assert len(Scheduler(steps, async_dump=True).run()) == 5
+    for s in steps:
+        s.load()
+        assert s.get_result() == 400 + s.inputs[1].value
+    assert Scheduler(steps).stale() == set()
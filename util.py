@@ -1,4 +1,3 @@
-import sqlalchemy
 import logging
 import os
 import sys
@@ -12,28 +11,39 @@ except ImportError:
 import dis
 
 import numpy as np
-import pandas as pd
 
 from itertools import chain, product
 from datetime import datetime, timedelta, date
-from sklearn import preprocessing
-from scipy import stats
 
 try:
     from repoze.lru import lru_cache
 except ImportError:
     from functools import lru_cache
 
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
+
 # useful for finding number of days in an interval: (date1 - date2) /day
 day = np.timedelta64(1, 'D')
 
+# sqlalchemy and pandas.io.sql are only imported when needed, see drain.sql
 def create_engine():
-    return sqlalchemy.create_engine('postgresql://{user}:{pwd}@{host}:5432/{db}'.format(
-            host=os.environ['PGHOST'], db=os.environ['PGDATABASE'], user=os.environ['PGUSER'], pwd=os.environ['PGPASSWORD']))
+    from drain import sql
+    return sql.create_engine()
 
 def create_db():
-    engine = create_engine()
-    return PgSQLDatabase(engine)
+    from drain import sql
+    return sql.create_db()
+
+def PgSQLDatabase(*args, **kwargs):
+    """
+    Returns a drain.sql.PgSQLDatabase, kept here for code constructing it
+    from drain.util; subclass or isinstance check drain.sql.PgSQLDatabase
+    """
+    from drain import sql
+    return sql.PgSQLDatabase(*args, **kwargs)
 
 def execute_sql(sql, engine):
     conn = engine.connect()
@@ -64,6 +74,7 @@ def timestamp(year,month,day):
     """
     Convenient constructor for pandas Timestamp
     """
+    import pandas as pd
     return pd.Timestamp('%04d-%02d-%02d' % (year, month, day))
 
 epoch = np.datetime64(0, 'ns')
@@ -129,6 +140,8 @@ def mode(series):
 # method = 'percentile': replace with percentile. SLOW
 def normalize(df, method='standard'):
     if method == 'standard':
+        import pandas as pd
+        from sklearn import preprocessing
         return pd.DataFrame(preprocessing.scale(df), index=df.index, columns=df.columns)
     elif method == 'percentile':
         return df.rank(pct=True)
@@ -164,6 +177,122 @@ def merge_dicts(*dict_args):
         result.update(dictionary)
     return result
 
+class LazyDict(Mapping):
+    """
+    A read-only mapping whose values are loaded on first access.
+    Takes a dictionary of key: loader pairs, where loader is a function
+    of no arguments returning the value. Use picklable loaders, e.g.
+    functools.partial of module-level functions, to keep it picklable.
+    """
+    def __init__(self, loaders):
+        self._loaders = loaders
+        self._values = {}
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            self._values[key] = self._loaders[key]()
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._loaders)
+
+    def __len__(self):
+        return len(self._loaders)
+
+    def is_loaded(self, key):
+        return key in self._values
+
+    def __repr__(self):
+        return 'LazyDict(%s)' % list(self._loaders.keys())
+
+class LazyList(Sequence):
+    """
+    A read-only sequence whose items are loaded on first access.
+    Takes a list of loaders, see LazyDict.
+    """
+    def __init__(self, loaders):
+        self._loaders = list(loaders)
+        self._values = {}
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if i not in self._values:
+            self._values[i] = self._loaders[i]()
+        return self._values[i]
+
+    def __len__(self):
+        return len(self._loaders)
+
+    def is_loaded(self, i):
+        return i in self._values
+
+    def __repr__(self):
+        return 'LazyList(%s)' % len(self)
+
+def nbytes(obj):
+    """
+    Estimate the memory used by an object, e.g. a step result.
+    DataFrames and arrays count their values (not the objects referenced
+    by object columns), collections the sum of their items.
+    """
+    import pandas as pd
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True).sum())
+    elif isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True))
+    elif isinstance(obj, np.ndarray):
+        return obj.nbytes
+    elif isinstance(obj, (LazyDict, LazyList)):
+        # only count what has been loaded
+        return sum(nbytes(v) for v in obj._values.values())
+    elif isinstance(obj, dict):
+        return sum(nbytes(v) for v in obj.values())
+    elif isinstance(obj, (list, tuple)):
+        return sum(nbytes(v) for v in obj)
+    else:
+        return sys.getsizeof(obj)
+
+def pprint_kwargs(params, offset=0, printer=repr):
+    """
+    Multi-line justified repr of a dictionary of keyword arguments.
+    Adapted from sklearn.base._pprint so that Step.__repr__ does not need
+    to import sklearn.
+    """
+    options = np.get_printoptions()
+    np.set_printoptions(precision=5, threshold=64, edgeitems=2)
+    params_list = list()
+    this_line_length = offset
+    line_sep = ',\n' + (1 + offset // 2) * ' '
+    for i, (k, v) in enumerate(sorted(params.items())):
+        if type(v) is float:
+            # use str for representing floating point numbers
+            # this way we get consistent representation across
+            # architectures and versions.
+            this_repr = '%s=%s' % (k, str(v))
+        else:
+            # use repr of the rest
+            this_repr = '%s=%s' % (k, printer(v))
+        if len(this_repr) > 500:
+            this_repr = this_repr[:300] + '...' + this_repr[-100:]
+        if i > 0:
+            if (this_line_length + len(this_repr) >= 75 or '\n' in this_repr):
+                params_list.append(line_sep)
+                this_line_length = len(line_sep)
+            else:
+                params_list.append(', ')
+                this_line_length += 2
+        params_list.append(this_repr)
+        this_line_length += len(this_repr)
+
+    np.set_printoptions(**options)
+    lines = ''.join(params_list)
+    # strip trailing spaces
+    lines = '\n'.join(l.rstrip(' ') for l in lines.split('\n'))
+    return lines
+
 def dict_subset(d, keys):
     return {k:d[k] for k in keys if k in d}
 
@@ -319,6 +448,7 @@ def conditional_join(left, right, left_on, right_on, condition, lsuffix='_left',
     return df
 
 def join_years(left, years, period=None, column='year'):
+    import pandas as pd
     years = pd.DataFrame({column:years})
     if period is None:
         cond = lambda df: (df[column + '_left'] <= df[column + '_right'])
@@ -329,103 +459,6 @@ def join_years(left, years, period=None, column='year'):
     df.rename(columns={column + '_y': column}, inplace=True)
     return df
 
-import pandas.io.sql
-class PgSQLDatabase(pandas.io.sql.SQLDatabase):
-    import tempfile
-    # FIXME Schema is pulled from Meta object, shouldn't actually be part of signature!
-    def to_sql(self, frame, name, if_exists='fail', index=True,
-               index_label=None, schema=None, chunksize=None, dtype=None, pk=None, prefixes=None, raise_on_error=True):
-        """
-        Write records stored in a DataFrame to a SQL database.
-
-        Parameters
-        ----------
-        frame : DataFrame
-        name : string
-            Name of SQL table
-        if_exists : {'fail', 'replace', 'append'}, default 'fail'
-            - fail: If table exists, do nothing.
-            - replace: If table exists, drop it, recreate it, and insert data.
-            - append: If table exists, insert data. Create if does not exist.
-        index : boolean, default True
-            Write DataFrame index as a column
-        index_label : string or sequence, default None
-            Column label for index column(s). If None is given (default) and
-            `index` is True, then the index names are used.
-            A sequence should be given if the DataFrame uses MultiIndex.
-        schema : string, default None
-            Name of SQL schema in database to write to (if database flavor
-            supports this). If specified, this overwrites the default
-            schema of the SQLDatabase object.
-        chunksize : int, default None
-            If not None, then rows will be written in batches of this size at a
-            time.  If None, all rows will be written at once.
-        dtype : dict of column name to SQL type, default None
-            Optional specifying the datatype for columns. The SQL type should
-            be a SQLAlchemy type.
-        pk: name of column(s) to set as primary keys
-        """
-        table = pandas.io.sql.SQLTable(name, self, frame=frame, index=index,
-                                       if_exists=if_exists, index_label=index_label,
-                                       schema=schema, dtype=dtype)
-        existed = table.exists()
-        table.create()
-        replaced = existed and if_exists=='replace'
-
-        table_name=name
-        if schema is not None:
-            table_name = schema + '.' + table_name
-
-        if pk is not None and ( (not existed) or replaced):
-            if isinstance(pk, str):
-                pks = pk
-            else:
-                pks = ", ".join(pk)
-            sql = "ALTER TABLE {table_name} ADD PRIMARY KEY ({pks})".format(table_name=table_name, pks=pks)
-            self.execute(sql)
-
-
-        from subprocess import Popen, PIPE, STDOUT
-
-        columns = frame.index.names + list(frame.columns) if index else frame.columns
-        columns = str.join(",", map(lambda c: '"' + c + '"', columns))
-
-        sql = "COPY {table_name} ({columns}) FROM STDIN WITH (FORMAT CSV, HEADER TRUE)".format(table_name=table_name, columns=columns)
-        p = Popen(['psql', '-c', sql], stdout=PIPE, stdin=PIPE, stderr=STDOUT)
-        frame.to_csv(p.stdin, index=index)
-
-        psql_out = p.communicate()[0]
-        logging.info(psql_out.decode()),
-        
-        r = p.wait()
-        if raise_on_error and (r > 0):
-            sys.exit(r)
-
-        return r
-
-    def read_table(self, name, schema=None):
-        table_name=name
-        if schema is not None:
-            table_name = schema + '.' + table_name
-
-        return self.read_query('select * from %s' % table_name)
-
-    def read_sql(self, query, raise_on_error=True, **kwargs):
-        from subprocess import Popen, PIPE, STDOUT
-
-        sql = "COPY (%s) TO STDOUT WITH (FORMAT CSV, HEADER TRUE)" % query
-        p = Popen(['psql', '-c', sql], stdout=PIPE, stdin=PIPE, stderr=STDOUT)
-        df = pd.read_csv(p.stdout, **kwargs)
-
-        psql_out = p.communicate()
-        logging.info(psql_out[0].decode(),)
-
-        r = p.wait()
-        if raise_on_error and (r > 0):
-            sys.exit(r)
- 
-        return df
-
 def capture_print(f, *args):
     """Helper function; calls function f(*args), 
     captures whatever f prints to
@@ -437,7 +470,7 @@ def capture_print(f, *args):
     sys.stdout = stdout_
     return stream.getvalue()
 
-# TODO: use this for a global step cache
+# steps are cached by digest with drain.step.intern_steps
 from functools import wraps
 
 def cached_class(klass):
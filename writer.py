@@ -0,0 +1,127 @@
+"""
+Background dumping of step outputs.
+
+Dumping a large result to HDF or joblib can take as long as computing it.
+Given a Writer, Step.execute() hands its output to the writer's thread and
+returns as soon as the output has been run, so the caller can go on to the
+next output while the previous one is written.
+
+A target is only touched, and its completion only recorded in the
+manifest, once its dump and report have been written (see
+Step.dump_output()), so an interrupted write leaves a missing target that
+is rerun, never a target that looks complete. Steps that consume a target
+being written must wait() for it before loading it, and flush() is the
+barrier at the end of a run: it waits for every pending dump and raises if
+any failed.
+
+    with Writer() as writer:
+        for output in outputs:
+            writer.wait(inputs_of(output))
+            output.execute(output=output, writer=writer)
+"""
+import logging
+import threading
+import traceback
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+
+class Writer(object):
+    """
+    Dumps outputs on a background thread, in the order they are submitted
+    """
+
+    def __init__(self, max_pending=1, release=False):
+        """
+        Args:
+            max_pending (int): number of outputs that may wait to be
+                written, beyond the one being written. submit() blocks when
+                it is reached, bounding the results held in memory.
+            release (boolean): delete each output's result once written
+        """
+        self.release = release
+        self._queue = Queue(max_pending)
+        # digest: Event set once the step's dump has finished
+        self._done = {}
+        # (step, traceback) of failed dumps
+        self._errors = []
+        self._thread = threading.Thread(target=self._work)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, step):
+        """
+        Dump step, which has a result, as the output of Step.execute()
+        """
+        done = threading.Event()
+        self._done[step._digest] = done
+        self._queue.put((step, done))
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            step, done = item
+            try:
+                logging.info('Dumping\n\t%s' % str(step).replace('\n', '\n\t'))
+                step.dump_output()
+            except Exception:
+                self._errors.append((step, traceback.format_exc()))
+            finally:
+                if self.release and step.has_result():
+                    del step._result
+                done.set()
+
+    def wait(self, steps):
+        """
+        Wait until the dumps of those of the given steps that were
+        submitted have finished. Raises RuntimeError if a dump failed.
+        """
+        for step in steps:
+            done = self._done.get(step._digest)
+            if done is not None:
+                done.wait()
+        self._check()
+
+    def flush(self):
+        """
+        Wait until every submitted dump has finished.
+        Raises RuntimeError if a dump failed.
+        """
+        for done in list(self._done.values()):
+            done.wait()
+        self._check()
+
+    def _check(self):
+        if self._errors:
+            step, exc = self._errors[0]
+            raise RuntimeError('Error dumping %s:\n%s' % (step, exc))
+
+    def close(self):
+        """
+        Flush, then stop the background thread
+        """
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            # do not mask the original error with a failed dump
+            try:
+                self.close()
+            except RuntimeError:
+                logging.exception('Error flushing writer')
+        return False
@@ -3,12 +3,15 @@ import yaml
 
 from cached_property import cached_property
 from drain import util
-from drain.step import Step
+from drain.step import Step, Dumper
+
+# PyYAML's libyaml parser when PyYAML was built with it
+Loader = getattr(yaml, 'CLoader', yaml.Loader)
 
 # load step from file via template
 def load(filename):
     with open(filename) as f:
-        template = yaml.load(f)
+        template = yaml.load(f, Loader=Loader)
         return template.step
 
 # temporary holder of step arguments
@@ -41,6 +44,8 @@ def step_multi_constructor(loader, tag_suffix, node):
     return StepTemplate(_cls=cls, **kwargs)
 
 def configure():
-    yaml.add_multi_representer(Step, step_multi_representer)
-    yaml.add_multi_constructor('!step', step_multi_constructor)
+    for dumper in set([yaml.Dumper, Dumper]):
+        yaml.add_multi_representer(Step, step_multi_representer, Dumper=dumper)
+    for loader in set([yaml.Loader, Loader]):
+        yaml.add_multi_constructor('!step', step_multi_constructor, Loader=loader)
  